@@ -0,0 +1,102 @@
+"""
+Compare full OCR with near-duplicate region-diff OCR on a repetitive workflow.
+
+    python benchmarks/dedup_benchmark.py [--screenshots 40] [--new-rate 0.1] [--latency 0.15]
+
+Simulates repeated captures of the same window where a status line or a few
+lines change between shots, with an occasional unrelated screenshot. Each
+sequence is OCR'd once with plain OCRService and once through IncrementalOCR
+against a local fake Vision API (ink profile mode), and reports upload bytes,
+total time, how many screenshots took the incremental path, and how many
+merged texts agree with a full OCR of the same image.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+os.environ.setdefault('API_KEY', 'benchmark')
+os.environ.setdefault('WATCH_DIR', tempfile.gettempdir())
+
+from PIL import Image, ImageDraw, ImageFont
+from fake_vision import FakeVisionServer
+from ocr_service import OCRService
+from image_store import ImageStore
+from incremental_ocr import IncrementalOCR
+from metrics import metrics
+from config import DECODE_MAX_SIDE
+
+WORDS = ("error warning import config service request response timeout cache "
+         "thread window screenshot value return true false none index").split()
+
+def random_line(rng: random.Random) -> str:
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 10)))
+
+def render(path: str, lines: list, size=(1920, 1080)):
+    image = Image.new('RGB', size, (250, 250, 250))
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=14)
+    for index, line in enumerate(lines):
+        draw.text((20, 12 + index * 24), line, fill=(20, 20, 20), font=font)
+    image.save(path)
+
+def make_sequence(directory: str, count: int, new_rate: float, seed: int) -> list:
+    """Screenshots of one window changing a line or two at a time, sometimes replaced entirely."""
+    rng = random.Random(seed)
+    lines = [random_line(rng) for _ in range(40)]
+    paths = []
+    for index in range(count):
+        if index and rng.random() < new_rate:
+            lines = [random_line(rng) for _ in range(40)]
+        elif index:
+            for _ in range(rng.randint(1, 2)):
+                lines[rng.randrange(len(lines))] = random_line(rng)
+        path = os.path.join(directory, f"shot_{index:03d}.png")
+        render(path, lines)
+        paths.append(path)
+    return paths
+
+def run(backend, paths: list) -> dict:
+    metrics.reset()
+    texts = []
+    start = time.perf_counter()
+    for path in paths:
+        result = backend.perform_ocr(path)
+        texts.append(result['text'] if result else None)
+    elapsed = time.perf_counter() - start
+    counters = metrics.snapshot()['counters']
+    return {'seconds': elapsed, 'texts': texts, 'upload_bytes': counters.get('upload_bytes', 0),
+            'incremental': counters.get('dedup_incremental', 0) + counters.get('dedup_unchanged', 0)}
+
+def main():
+    parser = argparse.ArgumentParser(description='Full vs incremental OCR of near-duplicate screenshots.')
+    parser.add_argument('--screenshots', type=int, default=40)
+    parser.add_argument('--new-rate', type=float, default=0.1, help='share of screenshots of a different window')
+    parser.add_argument('--latency', type=float, default=0.15, help='fake API latency in seconds')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    server = FakeVisionServer(latency=args.latency).start()
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            paths = make_sequence(directory, args.screenshots, args.new_rate, args.seed)
+            full = run(OCRService('benchmark', endpoint=server.url), paths)
+
+            store = ImageStore(DECODE_MAX_SIDE)
+            service = OCRService('benchmark', image_store=store, endpoint=server.url)
+            incremental = run(IncrementalOCR(service, service, store), paths)
+    finally:
+        server.stop()
+
+    agree = sum(a == b for a, b in zip(full['texts'], incremental['texts']))
+    print(f"{'':<12} {'upload KB':>10} {'seconds':>8}")
+    for label, run_result in (('full', full), ('incremental', incremental)):
+        print(f"{label:<12} {run_result['upload_bytes'] / 1024:>10.0f} {run_result['seconds']:>8.2f}")
+    print(f"\n{incremental['incremental']}/{len(paths)} screenshots took the incremental path, "
+          f"{agree}/{len(paths)} texts agree with a full OCR")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Compare the fixed JPEG upload encoding with the adaptive strategy.
+
+    python benchmarks/encoding_benchmark.py [--corpus DIR] [--endpoint URL --api-key KEY]
+
+For every screenshot in the corpus (synthetic samples by default) both
+encoders are timed, their payload sizes recorded, and both payloads are OCR'd.
+Without --endpoint a local fake Vision server is used and agreement means
+the ink profiles match (see fake_vision.py); with a real endpoint it is the
+similarity of the recognized text.
+"""
+import argparse
+import difflib
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+os.environ.setdefault('API_KEY', 'benchmark')
+os.environ.setdefault('WATCH_DIR', tempfile.gettempdir())
+
+from PIL import Image, ImageDraw, ImageFont
+from fake_vision import FakeVisionServer
+from ocr_service import OCRService
+from file_watcher import is_supported_file
+from fake_vision import ink_profile
+
+WORDS = ("error warning import config service request response timeout cache "
+         "thread window screenshot value return true false none index").split()
+
+def _lines(rng: random.Random, count: int) -> list:
+    return [' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 9))) for _ in range(count)]
+
+def _text_screen(path: str, size, font_size: int, background, foreground, seed: int, line_count: int = 200):
+    rng = random.Random(seed)
+    image = Image.new('RGB', size, background)
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=font_size)
+    y = 10
+    for line in _lines(rng, line_count):
+        if y > size[1] - font_size:
+            break
+        draw.text((10 + rng.randint(0, 40), y), line, fill=foreground, font=font)
+        y += int(font_size * 1.6)
+    image.save(path)
+
+def make_corpus(directory: str) -> list:
+    """Write a handful of representative synthetic screenshots."""
+    specs = {
+        'editor_1080p.png': lambda p: _text_screen(p, (1920, 1080), 13, (30, 30, 30), (220, 220, 220), 1),
+        'small_text_4k.png': lambda p: _text_screen(p, (3840, 2160), 14, (255, 255, 255), (0, 0, 0), 2),
+        'small_crop.png': lambda p: _text_screen(p, (360, 60), 16, (245, 245, 245), (20, 20, 20), 3, 2),
+        'dialog_large_text.png': lambda p: _text_screen(p, (1280, 720), 40, (240, 240, 250), (10, 10, 120), 4, 4),
+    }
+    paths = []
+    for name, build in specs.items():
+        path = os.path.join(directory, name)
+        build(path)
+        paths.append(path)
+
+    # Photo-like background with a caption, saved as JPEG like a camera app would
+    path = os.path.join(directory, 'photo_caption.jpg')
+    photo = Image.effect_noise((1600, 900), 80).convert('RGB')
+    photo = Image.merge('RGB', [photo.getchannel(0), photo.getchannel(1).point(lambda v: v // 2),
+                                photo.getchannel(2).point(lambda v: 255 - v)])
+    ImageDraw.Draw(photo).text((40, 800), "caption text over a photo", fill=(255, 255, 255),
+                               font=ImageFont.load_default(size=48))
+    photo.save(path, quality=92)
+    paths.append(path)
+    return paths
+
+def agreement(a: str, b: str) -> float:
+    return difflib.SequenceMatcher(None, (a or '').split(), (b or '').split()).ratio()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--corpus', help='directory of screenshots (default: synthetic samples)')
+    parser.add_argument('--endpoint', help='annotate endpoint (default: local fake server)')
+    parser.add_argument('--api-key', default='benchmark')
+    parser.add_argument('--repeat', type=int, default=3, help='encode runs per image for timing')
+    args = parser.parse_args()
+
+    if args.corpus:
+        paths = sorted(os.path.join(args.corpus, name) for name in os.listdir(args.corpus)
+                       if is_supported_file(name))
+    else:
+        paths = make_corpus(tempfile.mkdtemp(prefix='encoding-corpus-'))
+
+    server = None
+    endpoint = args.endpoint
+    if not endpoint:
+        server = FakeVisionServer().start()
+        endpoint = server.url
+
+    encoders = {
+        'fixed': OCRService(args.api_key, endpoint=endpoint, adaptive_encoding=False),
+        'adaptive': OCRService(args.api_key, endpoint=endpoint, adaptive_encoding=True)
+    }
+
+    # Against the fake server the ink profile of the original file is the ground
+    # truth; against a real endpoint the fixed encoding's text is the reference.
+    reference_label = 'truth' if server else 'fixed'
+    print(f"{'image':24s} {'fixed B':>10s} {'adapt B':>10s} {'fixed ms':>9s} {'adapt ms':>9s} "
+          f"{'fixed~' + reference_label:>12s} {'adapt~' + reference_label:>12s}")
+    totals = {name: {'bytes': 0, 'ms': 0.0, 'agreement': 0.0} for name in encoders}
+    try:
+        for path in paths:
+            row = {}
+            texts = {}
+            for name, service in encoders.items():
+                start = time.perf_counter()
+                for _ in range(args.repeat):
+                    data = service.compress_image(path)
+                elapsed = (time.perf_counter() - start) / args.repeat * 1000
+                result = service.perform_ocr(path)
+                texts[name] = result['text'] if result else ''
+                row[name] = (len(data), elapsed)
+
+            if server:
+                with Image.open(path) as image:
+                    reference = ink_profile(image)
+            else:
+                reference = texts['fixed']
+            for name in encoders:
+                score = agreement(reference, texts[name])
+                row[name] += (score,)
+                totals[name]['bytes'] += row[name][0]
+                totals[name]['ms'] += row[name][1]
+                totals[name]['agreement'] += score
+
+            print(f"{os.path.basename(path)[:24]:24s} {row['fixed'][0]:10d} {row['adaptive'][0]:10d} "
+                  f"{row['fixed'][1]:9.1f} {row['adaptive'][1]:9.1f} "
+                  f"{row['fixed'][2]:12.2f} {row['adaptive'][2]:12.2f}")
+    finally:
+        if server:
+            server.stop()
+
+    count = max(1, len(paths))
+    print(f"{'total':24s} {totals['fixed']['bytes']:10d} {totals['adaptive']['bytes']:10d} "
+          f"{totals['fixed']['ms']:9.1f} {totals['adaptive']['ms']:9.1f} "
+          f"{totals['fixed']['agreement'] / count:12.2f} {totals['adaptive']['agreement'] / count:12.2f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,365 @@
+"""
+Local stand-in for the Vision images:annotate endpoint.
+
+    python benchmarks/fake_vision.py --port 8088 [--latency 0.2 --latency-dist lognormal]
+        [--text "canned" | --annotations canned.json | --words --min-text-height 8]
+        [--error-rate 0.1] [--throttle-rate 0.05 --retry-after 1] [--slow-rate 0.05 --slow-latency 3]
+        [--rate-limit 10] [--certfile cert.pem --keyfile key.pem] [--connect-latency 0.05]
+        [--idle-timeout 5] [--no-gzip]
+
+Point the app at it with OCR_VISION_ENDPOINT=http://127.0.0.1:8088/v1/images:annotate
+(or OCRService(endpoint=...)). Without --text or --annotations the server
+"recognizes" each image with a crude ink profile: one token per text line
+giving the number of words in it, where a word is a run of ink columns
+separated by gaps wider than a fifth of the line height. The profile changes
+when small text is blurred together, so comparing it across encodings of the
+same screenshot is a cheap legibility check. With --words each word run is a
+token of its own, read as '?' when its line is shorter than
+--min-text-height pixels in the uploaded image. Responses carry textAnnotations
+shaped like the real API: the full text first, then one entry per token with
+its boundingPoly.
+
+Latency is fixed, uniform (0 to 2x), exponential or lognormal around
+--latency. Faults can be injected per request: 503 errors, 429 responses with
+a Retry-After header, and a slow tail of requests. With --rate-limit, a
+request is answered with 429 when it would take the images accepted over
+the last second past the limit, like the real per-project quota.
+
+The server speaks HTTP/1.1 with keep-alive, so clients can reuse
+connections. With --certfile and --keyfile it serves HTTPS; every new
+connection pays --connect-latency before its TLS handshake, standing in for
+the round trips to a distant endpoint, and connections idle longer than
+--idle-timeout are closed. gzip request bodies are accepted unless
+--no-gzip is given, in which case they are rejected with 400.
+"""
+import argparse
+import base64
+import gzip
+import io
+import json
+import random
+import math
+import ssl
+import sys
+import threading
+import time
+from array import array
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import List, Optional, Tuple
+
+from PIL import Image
+
+# Grey level distance from the background colour that counts as ink
+INK_CONTRAST = 60
+
+def _means(image: Image.Image, size) -> array:
+    """Box-average a float image down to size and return the values."""
+    return array('f', image.resize(size, Image.Resampling.BOX).tobytes())
+
+LATENCY_DISTRIBUTIONS = ('fixed', 'uniform', 'exponential', 'lognormal')
+
+def ink_profile(image: Image.Image) -> str:
+    """Describe the text lines of an image by their word counts."""
+    return ' '.join(token for token, _ in ink_lines(image))
+
+def ink_lines(image: Image.Image) -> List[Tuple[str, Tuple[int, int, int, int]]]:
+    """Return (word count, (left, top, right, bottom)) for each text line of an image."""
+    return [(str(len(words)), box) for box, words in _ink_runs(image)]
+
+def ink_words(image: Image.Image, min_height: int = 0) -> List[Tuple[str, Tuple[int, int, int, int]]]:
+    """Return one ('word', box) token per word; words on lines shorter than min_height px come back as '?'."""
+    return [('word' if box[3] - box[1] >= min_height else '?', word)
+            for box, words in _ink_runs(image) for word in words]
+
+def _ink_runs(image: Image.Image) -> List[Tuple[Tuple[int, int, int, int], List[Tuple[int, int, int, int]]]]:
+    """Return (line box, word boxes) for each text line of an image."""
+    gray = image.convert('L')
+    background = max(range(256), key=gray.histogram().__getitem__)
+    ink = gray.point(lambda value: 255 if abs(value - background) > INK_CONTRAST else 0).convert('F')
+
+    # Row projection: mean ink per row, a row with any ink belongs to a line
+    rows = list(_means(ink, (1, ink.height)))
+    lines = []
+    top = None
+    for y, value in enumerate(rows + [0]):
+        if value and top is None:
+            top = y
+        elif not value and top is not None:
+            band = ink.crop((0, top, ink.width, y))
+            columns = _means(band, (band.width, 1))
+            min_gap = max(1, (y - top) / 5)
+            words, gap = [], min_gap
+            for x, value in enumerate(columns):
+                if value:
+                    if gap >= min_gap:
+                        words.append([x, top, x + 1, y])
+                    gap = 0
+                    words[-1][2] = x + 1
+                else:
+                    gap += 1
+            boxes = [tuple(word) for word in words]
+            left, right = (boxes[0][0], boxes[-1][2]) if boxes else (0, 0)
+            lines.append(((left, top, right, y), boxes))
+            top = None
+    return lines
+
+def text_annotations(lines: List[Tuple[str, Tuple[int, int, int, int]]]) -> List[dict]:
+    """Build a textAnnotations list: the full text, then one entry per token."""
+    if not lines:
+        return []
+
+    def poly(box):
+        left, top, right, bottom = box
+        return {"vertices": [{"x": left, "y": top}, {"x": right, "y": top},
+                             {"x": right, "y": bottom}, {"x": left, "y": bottom}]}
+
+    full = (min(box[0] for _, box in lines), min(box[1] for _, box in lines),
+            max(box[2] for _, box in lines), max(box[3] for _, box in lines))
+    annotations = [{"locale": "en", "description": '\n'.join(token for token, _ in lines),
+                    "boundingPoly": poly(full)}]
+    annotations += [{"description": token, "boundingPoly": poly(box)} for token, box in lines]
+    return annotations
+
+def canned_lines(text: str) -> List[Tuple[str, Tuple[int, int, int, int]]]:
+    """Lay canned text out as one box per word, 10 px per character and 20 px per line."""
+    lines = []
+    for row, line in enumerate(text.splitlines()):
+        x = 0
+        for word in line.split():
+            lines.append((word, (x, row * 20, x + 10 * len(word), row * 20 + 16)))
+            x += 10 * (len(word) + 1)
+    return lines
+
+class FakeVisionHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so one connection can carry many requests
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out as separate writes; don't hold the body for the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        server = self.server
+        self.timeout = server.idle_timeout or None
+        with server._rate_lock:
+            server.connections_opened += 1
+        if server.connect_latency:
+            time.sleep(server.connect_latency)
+        if isinstance(self.request, ssl.SSLSocket):
+            self.request.settimeout(self.timeout)
+            self.request.do_handshake()
+        super().setup()
+
+    def do_HEAD(self):
+        # Nothing lives at the root, but the answer keeps the connection warm
+        self.send_response(404)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        server.requests_served += 1
+        server.bytes_received += len(body)
+        if self.headers.get('Content-Encoding') == 'gzip':
+            if not server.accept_gzip:
+                self._send(400, {"error": {"code": 400, "message": "Content-Encoding gzip is not supported"}})
+                return
+            server.gzip_requests += 1
+            body = gzip.decompress(body)
+        roll = server.random.random()
+        if roll < server.error_rate:
+            server.faults_injected += 1
+            self._send(503, {"error": {"code": 503, "message": "The service is currently unavailable."}})
+            return
+        if roll < server.error_rate + server.throttle_rate:
+            server.faults_injected += 1
+            self._send(429, {"error": {"code": 429, "message": "Quota exceeded."}},
+                       {'Retry-After': str(server.retry_after)})
+            return
+        try:
+            requests = json.loads(body)['requests']
+        except (ValueError, KeyError):
+            self._send(400, {"error": {"code": 400, "message": "Invalid JSON payload"}})
+            return
+        if not server.admit(len(requests)):
+            server.rate_limited += 1
+            self._send(429, {"error": {"code": 429, "message": "Quota exceeded for quota metric 'Requests'."}},
+                       {'Retry-After': str(server.retry_after)})
+            return
+        if server.random.random() < server.slow_rate:
+            time.sleep(server.slow_latency)
+        else:
+            time.sleep(server.sample_latency())
+
+        responses = []
+        for request in requests:
+            server.images_served += 1
+            try:
+                annotations = server.annotations
+                if annotations is None:
+                    data = base64.b64decode(request['image']['content'])
+                    image = Image.open(io.BytesIO(data))
+                    tokens = ink_words(image, server.min_text_height) if server.words else ink_lines(image)
+                    annotations = text_annotations(tokens)
+                responses.append({"textAnnotations": annotations} if annotations else {})
+            except Exception as e:
+                responses.append({"error": {"code": 3, "message": f"Bad image data: {e}"}})
+        self._send(200, {"responses": responses})
+
+    def _send(self, status: int, payload: dict, headers: Optional[dict] = None):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+class FakeVisionServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Bursts of new connections would overflow the default backlog of 5 and stall on SYN retries
+    request_queue_size = 128
+
+    def __init__(self, port: int = 0, latency: float = 0.0, text: Optional[str] = None,
+                 error_rate: float = 0.0, throttle_rate: float = 0.0, retry_after: float = 1,
+                 slow_rate: float = 0.0, slow_latency: float = 0.0, seed: Optional[int] = None,
+                 latency_dist: str = 'fixed', annotations: Optional[List[dict]] = None,
+                 words: bool = False, min_text_height: int = 0, rate_limit: float = 0,
+                 certfile: Optional[str] = None, keyfile: Optional[str] = None, connect_latency: float = 0.0,
+                 idle_timeout: float = 0.0, accept_gzip: bool = True):
+        """
+        text or annotations (a textAnnotations list) is returned for every image;
+        with neither, each image is answered with its ink profile, or with one
+        token per word if words is set. rate_limit caps the images accepted
+        per second (0 for no limit). With certfile the server speaks HTTPS.
+        """
+        if latency_dist not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution: {latency_dist}")
+        super().__init__(('127.0.0.1', port), FakeVisionHandler)
+        self.tls = certfile is not None
+        if self.tls:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(certfile, keyfile)
+            # Handshakes happen on the handler threads, after connect_latency
+            self.socket = context.wrap_socket(self.socket, server_side=True, do_handshake_on_connect=False)
+        self.connect_latency = connect_latency
+        self.idle_timeout = idle_timeout
+        self.accept_gzip = accept_gzip
+        self.latency = latency
+        self.latency_dist = latency_dist
+        self.text = text
+        if annotations is None and text is not None:
+            annotations = text_annotations(canned_lines(text)) if text else []
+            if annotations:
+                # Keep the canned text verbatim as the full-text entry
+                annotations[0]['description'] = text
+        self.annotations = annotations
+        self.words = words
+        self.min_text_height = min_text_height
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.random = random.Random(seed)
+        self.requests_served = 0
+        self.images_served = 0
+        self.faults_injected = 0
+        self.rate_limit = rate_limit
+        self.rate_limited = 0
+        self.connections_opened = 0
+        self.bytes_received = 0
+        self.gzip_requests = 0
+        self._accepted = deque()  # (time, images) of requests in the last second
+        self._rate_lock = threading.Lock()
+        self._thread = None
+
+    def handle_error(self, request, client_address):
+        # Clients dropping connections or refusing the certificate are part of the job
+        if not isinstance(sys.exc_info()[1], (ssl.SSLError, ConnectionError)):
+            super().handle_error(request, client_address)
+
+    def admit(self, images: int) -> bool:
+        """Whether a request of images stays within rate_limit over a sliding second."""
+        if not self.rate_limit:
+            return True
+        with self._rate_lock:
+            now = time.monotonic()
+            while self._accepted and self._accepted[0][0] <= now - 1.0:
+                self._accepted.popleft()
+            if sum(count for _, count in self._accepted) + images > self.rate_limit:
+                return False
+            self._accepted.append((now, images))
+            return True
+
+    def sample_latency(self) -> float:
+        """Draw the delay for one request; the distributions have median or mean --latency."""
+        if not self.latency or self.latency_dist == 'fixed':
+            return self.latency
+        if self.latency_dist == 'uniform':
+            return self.random.uniform(0, 2 * self.latency)
+        if self.latency_dist == 'exponential':
+            return self.random.expovariate(1 / self.latency)
+        # Median at latency with a long right tail, like real API latencies
+        return self.random.lognormvariate(math.log(self.latency), 0.5)
+
+    @property
+    def url(self) -> str:
+        scheme = 'https' if self.tls else 'http'
+        return f"{scheme}://127.0.0.1:{self.server_port}/v1/images:annotate"
+
+    def start(self) -> 'FakeVisionServer':
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Local fake Vision API')
+    parser.add_argument('--port', type=int, default=8088)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every request')
+    parser.add_argument('--latency-dist', choices=LATENCY_DISTRIBUTIONS, default='fixed')
+    parser.add_argument('--seed', type=int, help='seed for latency and fault injection')
+    parser.add_argument('--text', help='return this text for every image instead of the ink profile')
+    parser.add_argument('--annotations', help='JSON file with a textAnnotations list to return for every image')
+    parser.add_argument('--words', action='store_true', help='answer with one token per word instead of per line')
+    parser.add_argument('--min-text-height', type=int, default=0,
+                        help='with --words, words on lines shorter than this many px are unreadable (?)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests answered with 503')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='share of requests answered with 429')
+    parser.add_argument('--retry-after', type=float, default=1, help='Retry-After seconds sent with 429')
+    parser.add_argument('--slow-rate', type=float, default=0.0, help='share of requests delayed by --slow-latency')
+    parser.add_argument('--slow-latency', type=float, default=0.0)
+    parser.add_argument('--rate-limit', type=float, default=0.0, help='images accepted per second, 0 for no limit')
+    parser.add_argument('--certfile', help='serve HTTPS with this certificate (PEM)')
+    parser.add_argument('--keyfile', help='private key for --certfile, if not in the same file')
+    parser.add_argument('--connect-latency', type=float, default=0.0,
+                        help='seconds added to every new connection before its handshake')
+    parser.add_argument('--idle-timeout', type=float, default=0.0,
+                        help='close connections idle this many seconds, 0 to keep them open')
+    parser.add_argument('--no-gzip', action='store_true', help='reject gzip request bodies with 400')
+    args = parser.parse_args()
+
+    annotations = None
+    if args.annotations:
+        with open(args.annotations, 'r', encoding='utf-8') as f:
+            annotations = json.load(f)
+    server = FakeVisionServer(args.port, args.latency, args.text, args.error_rate, args.throttle_rate,
+                              args.retry_after, args.slow_rate, args.slow_latency, args.seed,
+                              args.latency_dist, annotations, args.words, args.min_text_height, args.rate_limit,
+                              args.certfile, args.keyfile, args.connect_latency, args.idle_timeout, not args.no_gzip)
+    print(f"Fake Vision API listening on {server.url}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
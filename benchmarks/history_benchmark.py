@@ -0,0 +1,97 @@
+"""
+Measure bulk indexing and search latency of the OCR history index.
+
+    python benchmarks/history_benchmark.py [--entries 200000] [--budget 1000]
+
+Fills a temporary index with synthetic OCR results (no API calls, no image
+files) whose words follow a Zipf-like frequency, then times ranked searches
+for common words, rare words, phrases and the prefix queries the search box
+sends while typing. Every match is ranked, so a word found in nearly every
+entry costs time in proportion to the index size (the app searches off the
+Tk thread). Exits non-zero when the p95 search latency exceeds --budget
+milliseconds.
+"""
+import argparse
+import hashlib
+import itertools
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from history import HistoryIndex
+
+COMMON = ("error warning import config service request response timeout cache thread window "
+          "screenshot value return true false none index file open close user data").split()
+RARE = ["ECONNREFUSED", "segfault", "NullPointerException", "quota", "deadlock", "checksum"]
+
+QUERIES = ['error', 'timeout cache', 'ECONNREFUSED', 'NullPointer', 'deadlock thread', 'scr', 'user data file',
+           'nonexistentword']
+
+def vocabulary(rng: random.Random, size: int = 20000) -> list:
+    """Common words first, then made-up ones, for a Zipf-like word frequency."""
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    words = list(COMMON)
+    while len(words) < size:
+        words.append(''.join(rng.choice(letters) for _ in range(rng.randint(3, 10))))
+    return words
+
+def synthetic_text(rng: random.Random, words: list, weights: list) -> str:
+    chosen = rng.choices(words, cum_weights=weights, k=rng.randint(5, 120))
+    if rng.random() < 0.01:
+        chosen.insert(rng.randrange(len(chosen)), rng.choice(RARE))
+    return ' '.join(chosen)
+
+def main():
+    parser = argparse.ArgumentParser(description='History index indexing and search benchmark.')
+    parser.add_argument('--entries', type=int, default=200000)
+    parser.add_argument('--chunk', type=int, default=5000, help='entries per transaction')
+    parser.add_argument('--repeat', type=int, default=20, help='runs per query')
+    parser.add_argument('--budget', type=float, default=1000.0, help='p95 search latency budget in ms')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    words = vocabulary(rng)
+    weights = list(itertools.accumulate(1 / rank for rank in range(1, len(words) + 1)))
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, 'history.db')
+        index = HistoryIndex(db_path)
+
+        start = time.perf_counter()
+        now = time.time()
+        for offset in range(0, args.entries, args.chunk):
+            records = []
+            for number in range(offset, min(args.entries, offset + args.chunk)):
+                path = f"/screenshots/screenshot_{number:07d}.png"
+                digest = hashlib.sha256(path.encode()).hexdigest()
+                records.append((path, synthetic_text(rng, words, weights), 'cloud', digest, now - number))
+            index.add_many(records)
+        index.optimize()
+        elapsed = time.perf_counter() - start
+        print(f"indexed {len(index)} entries in {elapsed:.1f} s ({args.entries / elapsed:.0f}/s), "
+              f"{os.path.getsize(db_path) / 1024 / 1024:.1f} MB on disk")
+
+        print(f"\n{'query':<18} {'hits':>5} {'p50 ms':>8} {'p95 ms':>8}")
+        worst = 0.0
+        for query in QUERIES:
+            samples = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                hits = index.search(query, 50)
+                samples.append((time.perf_counter() - start) * 1000)
+            samples.sort()
+            p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+            worst = max(worst, p95)
+            print(f"{query:<18} {len(hits):>5} {samples[len(samples) // 2]:>8.2f} {p95:>8.2f}")
+        index.close()
+
+    if worst > args.budget:
+        print(f"\nSearch p95 {worst:.1f} ms exceeds the {args.budget:.0f} ms budget")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Kill the OCR daemon mid-burst and check that a restart resumes every
+screenshot without repeating API calls.
+
+    python benchmarks/journal_harness.py [--files 60] [--kills 2] [--latency 0.2]
+
+Runs src/daemon.py in a child process watching a temporary directory, with
+the OCR cache and job journal in the same place and a fake Vision API in
+this process. Screenshots (all different) are written at a steady pace;
+the daemon is killed with SIGKILL --kills times while jobs are in flight,
+and more screenshots are written while it is down. After the last restart
+the harness waits for every screenshot to be delivered. Reports the
+screenshots lost, the images the API was asked for more than once, and the
+journal size. Exits non-zero if a screenshot is lost or more images are
+repeated than could have been in flight at the kills.
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from PIL import Image, ImageDraw
+from fake_vision import FakeVisionServer
+
+DAEMON = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'daemon.py')
+
+def write_screenshot(directory: str, index: int) -> str:
+    image = Image.new('RGB', (640, 360), (255, 255, 255))
+    ImageDraw.Draw(image).text((20, 20), f"screenshot number {index}", fill=(0, 0, 0))
+    path = os.path.join(directory, f"shot{index:04d}.png")
+    # Written aside and renamed in, like most screenshot tools
+    image.save(path + '.part', format='PNG')
+    os.replace(path + '.part', path)
+    return path
+
+def journal_states(path: str) -> dict:
+    """Replay the journal: the last state of every job."""
+    states = {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if 'p' in record:
+                    states[record['p']] = record['e']
+    except FileNotFoundError:
+        pass
+    return states
+
+def start_daemon(environment: dict, journal: str, log) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, DAEMON, '--port', '0', '--journal', journal],
+                            env=environment, stdout=log, stderr=subprocess.STDOUT)
+
+def wait_delivered(journal: str, paths: list, timeout: float) -> int:
+    deadline = time.monotonic() + timeout
+    while True:
+        states = journal_states(journal)
+        delivered = sum(1 for path in paths if states.get(path) == 'delivered')
+        if delivered == len(paths) or time.monotonic() > deadline:
+            return delivered
+        time.sleep(0.1)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--files', type=int, default=60)
+    parser.add_argument('--kills', type=int, default=2)
+    parser.add_argument('--interval', type=float, default=0.05, help='seconds between screenshots')
+    parser.add_argument('--latency', type=float, default=0.2, help='fake API seconds per request')
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    server = FakeVisionServer(text='ok', latency=args.latency).start()
+    with tempfile.TemporaryDirectory() as directory:
+        watch_dir = os.path.join(directory, 'screenshots')
+        os.makedirs(watch_dir)
+        journal = os.path.join(directory, 'journal.jsonl')
+        environment = dict(os.environ, API_KEY='benchmark', WATCH_DIR=watch_dir, OCR_VISION_ENDPOINT=server.url,
+                           OCR_CACHE_DIR=os.path.join(directory, 'cache'), OCR_CACHE='1', OCR_HISTORY='0',
+                           OCR_UNIT_LEDGER='', OCR_WARM_CONNECTIONS='0', OCR_WORKERS=str(args.workers),
+                           OCR_BATCH='0', OCR_DEDUP='0')
+        log = open(os.path.join(directory, 'daemon.log'), 'w')
+        paths = []
+        daemon = start_daemon(environment, journal, log)
+        time.sleep(2)  # Startup and first watch
+        per_phase = args.files // (args.kills + 1)
+        for phase in range(args.kills + 1):
+            for _ in range(per_phase):
+                paths.append(write_screenshot(watch_dir, len(paths)))
+                time.sleep(args.interval)
+            if phase == args.kills:
+                break
+            # Crash with jobs in flight, write some more while nothing is running, then restart
+            daemon.send_signal(signal.SIGKILL)
+            daemon.wait()
+            for _ in range(per_phase // 4):
+                paths.append(write_screenshot(watch_dir, len(paths)))
+            daemon = start_daemon(environment, journal, log)
+
+        delivered = wait_delivered(journal, paths, timeout=60)
+        daemon.send_signal(signal.SIGTERM)
+        daemon.wait(timeout=10)
+        log.close()
+        journal_lines = sum(1 for _ in open(journal, encoding='utf-8'))
+        if delivered < len(paths):
+            with open(os.path.join(directory, 'daemon.log')) as f:
+                print(f.read()[-2000:])
+    server.stop()
+
+    lost = len(paths) - delivered
+    repeated = server.images_served - len(paths)
+    print(f"screenshots {len(paths)}  delivered {delivered}  lost {lost}  "
+          f"API images {server.images_served} ({repeated} repeated)  journal {journal_lines} lines")
+    failures = []
+    if lost:
+        failures.append(f"{lost} screenshot(s) lost across restarts")
+    if repeated > args.kills * args.workers:
+        failures.append(f"{repeated} images were sent to the API again, more than were in flight at the kills")
+    for failure in failures:
+        print(failure)
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
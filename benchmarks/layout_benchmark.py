@@ -0,0 +1,101 @@
+"""
+Measure the cost of the structured OCR result (TextLayout).
+
+    python benchmarks/layout_benchmark.py [--words 2000] [--budget 1000]
+
+Builds a layout of synthetic words laid out like a dense screenshot and times
+building it, region queries, layout-preserving text and the JSON round trip
+used by the cache, next to its memory and serialized size compared with a
+plain list of [text, left, top, right, bottom] words. Exits non-zero when a
+region query takes longer than --budget microseconds at p95.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from text_layout import TextLayout
+
+WORDS = ("error warning import config service request response timeout cache "
+         "thread window screenshot value return true false none index").split()
+
+def synthetic_words(count: int, rng: random.Random) -> list:
+    """Words of 8 px wide characters on 24 px lines of a 1920 px wide screen."""
+    words = []
+    x, y = 10, 10
+    while len(words) < count:
+        text = rng.choice(WORDS)
+        width = 8 * len(text)
+        if x + width > 1910:
+            x, y = 10 + 8 * rng.randint(0, 6), y + 24
+        words.append([text, x, y, x + width, y + 14])
+        x += width + 8
+    return words
+
+def timed(function, repeat: int) -> list:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - start) * 1e6)
+    return sorted(samples)
+
+def allocated(factory) -> int:
+    tracemalloc.start()
+    value = factory()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del value
+    return size
+
+def main():
+    parser = argparse.ArgumentParser(description='TextLayout build, query and serialization benchmark.')
+    parser.add_argument('--words', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--budget', type=float, default=1000.0, help='p95 region query budget in microseconds')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    words = synthetic_words(args.words, rng)
+    layout = TextLayout.from_words(words)
+    bottom = max(word[4] for word in words)
+    regions = [(rng.randint(0, 1500), rng.randint(0, bottom - 200), 0, 0) for _ in range(args.repeat)]
+    regions = [(left, top, left + rng.randint(100, 400), top + rng.randint(24, 200)) for left, top, _, _ in regions]
+    queries = iter(regions * 2)
+    encoded = json.dumps(layout.to_json())
+
+    print(f"{len(layout)} words on {layout.line_count()} lines\n")
+    print(f"{'operation':<22} {'p50 us':>9} {'p95 us':>9}")
+    rows = [
+        ('build from words', lambda: TextLayout.from_words(words)),
+        ('text in region', lambda: layout.text_in(next(queries))),
+        ('layout text', layout.layout_text),
+        ('to JSON', lambda: json.dumps(layout.to_json())),
+        ('from JSON', lambda: TextLayout.from_json(json.loads(encoded))),
+    ]
+    region_p95 = None
+    for name, function in rows:
+        samples = timed(function, args.repeat)
+        p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+        if name == 'text in region':
+            region_p95 = p95
+        print(f"{name:<22} {samples[len(samples) // 2]:>9.1f} {p95:>9.1f}")
+
+    plain = json.dumps(words)
+    print(f"\n{'':<22} {'memory KB':>9} {'JSON KB':>9}")
+    print(f"{'list of word lists':<22} {allocated(lambda: json.loads(plain)) / 1024:>9.0f} {len(plain) / 1024:>9.0f}")
+    print(f"{'TextLayout':<22} {allocated(lambda: TextLayout.from_json(json.loads(encoded))) / 1024:>9.0f} "
+          f"{len(encoded) / 1024:>9.0f}")
+
+    if region_p95 > args.budget:
+        print(f"\nRegion query p95 {region_p95:.0f} us exceeds the {args.budget:.0f} us budget")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+End-to-end benchmark of the screenshot pipeline against a local fake Vision API.
+
+    python benchmarks/pipeline_benchmark.py [--bursts 5 --burst-size 20 --gap 1.0]
+        [--latency 0.15 --latency-dist lognormal] [--error-rate 0.02 --throttle-rate 0.02]
+        [--workers 4] [--seed 1] [--json results.json]
+
+Synthetic screenshots are copied into a watched directory in bursts and go
+through the real FileWatcher -> readiness detection -> OCRWorkerPool ->
+OCR backend (batching, retries, hedging) -> HTTP path. The fake server runs
+in a separate process so its decoding does not count against the pipeline.
+
+Reports throughput, write-to-result latency p50/p95/p99, peak RSS, CPU time
+per image and the per-stage timings collected by metrics.py. Runs are
+reproducible for a given --seed.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS, '..', 'src'))
+
+from PIL import Image, ImageDraw, ImageFont
+
+WORDS = ("error warning import config service request response timeout cache "
+         "thread window screenshot value return true false none index").split()
+
+def make_screenshot(path: str, seed: int, size=(1920, 1080), font_size: int = 14):
+    """Write a PNG of random text lines, different for every seed."""
+    rng = random.Random(seed)
+    image = Image.new('RGB', size, (250, 250, 250))
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=font_size)
+    for y in range(10, size[1] - font_size, int(font_size * 1.6)):
+        if rng.random() < 0.3:
+            continue
+        line = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 12)))
+        draw.text((10 + rng.randint(0, 200), y), line, fill=(20, 20, 20), font=font)
+    image.save(path)
+
+def start_fake_server(args) -> (subprocess.Popen, str):
+    command = [sys.executable, os.path.join(BENCHMARKS, 'fake_vision.py'), '--port', '0',
+               '--latency', str(args.latency), '--latency-dist', args.latency_dist,
+               '--error-rate', str(args.error_rate), '--throttle-rate', str(args.throttle_rate),
+               '--retry-after', str(args.retry_after), '--seed', str(args.seed)]
+    if args.text is not None:
+        command += ['--text', args.text]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if 'listening on' not in line:
+        process.kill()
+        raise RuntimeError(f"Fake Vision API did not start: {line!r}")
+    return process, line.rsplit(' ', 1)[1].strip()
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+def run(args, endpoint: str, corpus: List[str], watch_dir: str) -> Dict:
+    # Configuration is read when config is first imported, so set it up before that
+    os.environ['OCR_VISION_ENDPOINT'] = endpoint
+    os.environ['OCR_CACHE'] = '1' if args.cache else '0'
+    os.environ['OCR_BATCH'] = '0' if args.no_batch else '1'
+    os.environ['WATCH_DIR'] = watch_dir
+    os.environ['OCR_RATE_PER_SECOND'] = str(args.rate_limit)
+    os.environ['OCR_RATE_PER_MINUTE'] = '0'
+    # Count units in memory, not in the user's ledger
+    os.environ['OCR_UNIT_LEDGER'] = ''
+    from file_watcher import FileWatcher
+    from ocr_worker import OCRWorkerPool
+    from services import build_ocr_backend
+    from metrics import metrics
+    from config import OCR_QUEUE_SIZE
+
+    written_at: Dict[str, float] = {}
+    latencies: List[float] = []
+    outcomes = {'ok': 0, 'failed': 0}
+    lock = threading.Lock()
+    all_done = threading.Event()
+
+    def on_done(path: str, result: Optional[Dict[str, str]]):
+        with lock:
+            latencies.append(time.monotonic() - written_at[path])
+            outcomes['ok' if result else 'failed'] += 1
+            if sum(outcomes.values()) + pool.rejected >= len(corpus):
+                all_done.set()
+
+    def on_ready(path: str):
+        if not pool.submit(path, on_done):
+            with lock:
+                if sum(outcomes.values()) + pool.rejected >= len(corpus):
+                    all_done.set()
+
+    backend = build_ocr_backend('benchmark')
+    pool = OCRWorkerPool(backend, args.workers, OCR_QUEUE_SIZE, lambda func, *a: func(*a))
+    watcher = FileWatcher(watch_dir, on_ready)
+    if not watcher.start():
+        raise RuntimeError(f"Could not watch {watch_dir}")
+    metrics.reset()
+
+    cpu_start = cpu_seconds()
+    start = time.monotonic()
+    for burst in range(args.bursts):
+        for source in corpus[burst * args.burst_size:(burst + 1) * args.burst_size]:
+            target = os.path.join(watch_dir, os.path.basename(source))
+            written_at[target] = time.monotonic()
+            shutil.copyfile(source, target)
+        if burst < args.bursts - 1:
+            time.sleep(args.gap)
+    finished = all_done.wait(args.timeout)
+    wall = time.monotonic() - start
+    cpu = cpu_seconds() - cpu_start
+
+    watcher.stop()
+    pool.stop()
+    if hasattr(backend, 'stop'):
+        backend.stop()
+
+    snapshot = metrics.snapshot()
+    processed = outcomes['ok'] + outcomes['failed']
+    return {
+        'images': len(corpus),
+        'ok': outcomes['ok'],
+        'failed': outcomes['failed'],
+        'rejected': pool.rejected,
+        'lost': 0 if finished else len(corpus) - processed - pool.rejected,
+        'wall_seconds': round(wall, 3),
+        'throughput': round(processed / wall, 2) if wall else None,
+        'latency_p50': percentile(latencies, 0.5),
+        'latency_p95': percentile(latencies, 0.95),
+        'latency_p99': percentile(latencies, 0.99),
+        'latency_max': max(latencies) if latencies else None,
+        # ru_maxrss is in KiB on Linux and bytes on macOS
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss /
+                             (1024 * 1024 if sys.platform == 'darwin' else 1024), 1),
+        'cpu_ms_per_image': round(1000 * cpu / max(1, processed), 2),
+        'api_requests': snapshot['counters'].get('api_requests', 0),
+        'stages': {stage: {'count': h['count'], 'p50': h['p50'], 'p95': h['p95']}
+                   for stage, h in snapshot['stages'].items()}
+    }
+
+def report(results: Dict):
+    def ms(value):
+        return f"{value * 1000:.0f} ms" if value is not None else 'n/a'
+
+    print(f"images: {results['images']} ({results['ok']} ok, {results['failed']} failed, "
+          f"{results['rejected']} rejected, {results['lost']} lost)")
+    print(f"throughput: {results['throughput']} img/s over {results['wall_seconds']} s, "
+          f"{results['api_requests']} API requests")
+    print(f"latency write->result: p50 {ms(results['latency_p50'])}, p95 {ms(results['latency_p95'])}, "
+          f"p99 {ms(results['latency_p99'])}, max {ms(results['latency_max'])}")
+    print(f"peak RSS: {results['peak_rss_mb']} MB, CPU: {results['cpu_ms_per_image']} ms/image")
+    print(f"\n{'stage':<12} {'count':>6} {'p50':>10} {'p95':>10}")
+    for stage, h in results['stages'].items():
+        print(f"{stage:<12} {h['count']:>6} {ms(h['p50']):>10} {ms(h['p95']):>10}")
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end pipeline benchmark with a fake Vision API.')
+    parser.add_argument('--bursts', type=int, default=5)
+    parser.add_argument('--burst-size', type=int, default=20)
+    parser.add_argument('--gap', type=float, default=1.0, help='seconds between bursts')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.15, help='fake API latency in seconds')
+    parser.add_argument('--latency-dist', default='lognormal',
+                        choices=('fixed', 'uniform', 'exponential', 'lognormal'))
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--retry-after', type=float, default=0.2)
+    parser.add_argument('--rate-limit', type=float, default=0,
+                        help='images per second the request scheduler lets through, 0 for no limit')
+    parser.add_argument('--text', help='canned text instead of the ink profile (cheaper fake server)')
+    parser.add_argument('--cache', action='store_true', help='keep the OCR result cache enabled')
+    parser.add_argument('--no-batch', action='store_true', help='one API request per image')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--timeout', type=float, default=120.0)
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    os.environ.setdefault('API_KEY', 'benchmark')
+    random.seed(args.seed)
+    with tempfile.TemporaryDirectory() as staging, tempfile.TemporaryDirectory() as watch_dir:
+        count = args.bursts * args.burst_size
+        corpus = []
+        for index in range(count):
+            path = os.path.join(staging, f"screenshot_{index:04d}.png")
+            make_screenshot(path, args.seed * 100000 + index)
+            corpus.append(path)
+
+        server, endpoint = start_fake_server(args)
+        try:
+            results = run(args, endpoint, corpus, watch_dir)
+        finally:
+            server.terminate()
+            server.wait(timeout=5)
+
+    report(results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(dict(results, args=vars(args)), f, indent=2)
+    sys.exit(1 if results['lost'] else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Measure upload preprocessing throughput on large screenshots in threads vs
+worker processes.
+
+    python benchmarks/preprocess_benchmark.py [--images 24] [--threads 4] [--workers 1,2,4]
+
+Writes --images synthetic 1440p to 8K screenshots full of small text, then
+decodes, resizes and encodes all of them for upload as the OCR worker
+threads do: first with --threads threads encoding in this process, then with
+the same threads handing the work to a PreprocessPool of each --workers
+size (default 1, 2, 4 ... up to the CPU count), from the file path and with
+the images already decoded for the preview (the reduced 8K decodes go
+through shared memory, the rest are decoded again by the workers). A
+ticker thread stands in for the Tk main loop and records how late its
+10 ms ticks run.
+Reports images/sec, speedup over threads, ticker lag p95/max, and the first
+image latency of a cold and a preloaded pool. Exits non-zero if a worker's
+payload differs from the in-process one, or if on a machine with several
+cores no pool size beats the threads.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+os.environ.setdefault('API_KEY', 'benchmark')
+os.environ.setdefault('WATCH_DIR', tempfile.gettempdir())
+
+from PIL import Image, ImageDraw, ImageFont
+from config import DECODE_MAX_SIDE
+from image_store import ImageStore, SharedImage
+from preprocess import PreprocessPool, encode_upload, upload_side
+
+SIZES = ((3840, 2160), (5120, 2880), (7680, 4320), (2560, 1440))
+
+def write_screenshots(directory: str, count: int) -> list:
+    font = ImageFont.load_default(size=13)
+    paths = []
+    for index in range(count):
+        size = SIZES[index % len(SIZES)]
+        # Some captures have an alpha channel, as on macOS
+        image = Image.new('RGBA' if index % 3 == 0 else 'RGB', size, (250, 250, 250))
+        draw = ImageDraw.Draw(image)
+        for y in range(8, size[1] - 16, 18):
+            draw.text((12 + (y * 7 + index) % 40, y), f"{index} line {y} " + "request timeout cache " * 12,
+                      fill=(20, 20, 20), font=font)
+        path = os.path.join(directory, f"large{index:03d}.png")
+        image.save(path, compress_level=1)
+        paths.append(path)
+    return paths
+
+class Ticker:
+    """Stands in for the Tk main loop: wakes every interval and records how late it ran."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.lags = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            due = time.perf_counter() + self.interval
+            time.sleep(self.interval)
+            self.lags.append(max(0.0, time.perf_counter() - due))
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+def encode_here(path: str) -> bytes:
+    handle = SharedImage(path, upload_side(True))
+    try:
+        return encode_upload(handle, True)[0]
+    finally:
+        handle.release()
+
+def run(paths: list, threads: int, encode) -> dict:
+    """Encode every path from threads threads; return images/sec, ticker lag and the payloads."""
+    with Ticker() as ticker, ThreadPoolExecutor(threads) as executor:
+        start = time.perf_counter()
+        payloads = list(executor.map(encode, paths))
+        elapsed = time.perf_counter() - start
+    return {'rate': len(paths) / elapsed, 'lag_p95': percentile(ticker.lags, 0.95),
+            'lag_max': max(ticker.lags, default=0.0), 'payloads': payloads}
+
+def first_image(path: str, workers: int, preload: bool) -> float:
+    """Seconds from creating a pool, after a short idle spell, to the first encoded image."""
+    pool = PreprocessPool(workers, preload)
+    time.sleep(1.0)  # The app starts its pool well before the first screenshot
+    start = time.perf_counter()
+    pool.encode(path, True)
+    elapsed = time.perf_counter() - start
+    pool.close()
+    return elapsed
+
+def report(name: str, stats: dict, baseline: float):
+    print(f"{name:26s} {stats['rate']:6.2f} images/s  x{stats['rate'] / baseline:4.2f}  "
+          f"ticker lag p95 {stats['lag_p95'] * 1000:6.1f} ms  max {stats['lag_max'] * 1000:6.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--images', type=int, default=24)
+    parser.add_argument('--threads', type=int, default=4, help='OCR worker threads encoding at once')
+    parser.add_argument('--workers', default='', help='comma-separated pool sizes, default 1, 2, 4 ... CPUs')
+    args = parser.parse_args()
+
+    cpus = os.cpu_count() or 1
+    sizes = [int(size) for size in args.workers.split(',') if size] or \
+        sorted({1, cpus} | {2 ** power for power in range(1, 8) if 2 ** power < cpus})
+    failures = []
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_screenshots(directory, args.images)
+        print(f"{len(paths)} screenshots up to {max(SIZES)[0]}x{max(SIZES)[1]}, {args.threads} threads, {cpus} CPUs")
+        encode_here(paths[0])  # Load the codecs before timing
+        threaded = run(paths, args.threads, encode_here)
+        report('threads, in process', threaded, threaded['rate'])
+
+        best = 0.0
+        for workers in sizes:
+            pool = PreprocessPool(workers)
+            pool.encode(paths[0], True)
+            stats = run(paths, args.threads, lambda path: pool.encode(path, True)[0])
+            report(f"{workers} worker process(es)", stats, threaded['rate'])
+            best = max(best, stats['rate'])
+            if stats['payloads'] != threaded['payloads']:
+                failures.append(f"{workers} worker(s) produced different payloads than encoding in process")
+
+            # Screenshots the preview already decoded go through shared memory
+            store = ImageStore(DECODE_MAX_SIDE)
+            handles = {path: store.acquire(path) for path in paths}
+            for handle in handles.values():
+                handle.base()
+            before = pool.stats()['shared']
+            shared = run(paths, args.threads, lambda path: pool.encode(path, True, handles[path])[0])
+            report(f"{workers} worker(s), after preview", shared, threaded['rate'])
+            print(f"{'':26s} {pool.stats()['shared'] - before} of {len(paths)} handed over in shared memory")
+            if shared['payloads'] != [encode_upload(handle, True)[0] for handle in handles.values()]:
+                failures.append(f"{workers} worker(s) encoded shared decodes differently than in process")
+            for path in paths:
+                store.release(path)
+            pool.close()
+
+        cold = first_image(paths[0], sizes[-1], preload=False)
+        warm = first_image(paths[0], sizes[-1], preload=True)
+        print(f"first image with {sizes[-1]} worker(s): cold pool {cold * 1000:.0f} ms, preloaded {warm * 1000:.0f} ms")
+
+    if cpus > 1 and best <= threaded['rate']:
+        failures.append("no pool size encoded faster than the threads")
+    for failure in failures:
+        print(failure)
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
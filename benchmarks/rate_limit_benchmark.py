@@ -0,0 +1,159 @@
+"""
+Drive OCRService through the request scheduler against a rate-limited fake
+Vision API.
+
+    python benchmarks/rate_limit_benchmark.py [--limit 20] [--requests 200]
+
+The fake API accepts --limit images per second and answers anything more
+with 429. Scenarios send the same load with no scheduler, with the limit
+configured, and with twice the limit configured (left to the adaptive
+slowdown), then mix a batch flood with interactive requests to compare the
+two lanes' queueing delay, and finally check the persistent unit ledger and
+the monthly budget. Exits non-zero when the matched scheduler still gets
+429s, the ledger disagrees with the images the API accepted, or interactive
+requests wait longer than batch ones.
+"""
+import argparse
+import base64
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+os.environ.setdefault('API_KEY', 'benchmark')
+os.environ.setdefault('WATCH_DIR', tempfile.gettempdir())
+
+from PIL import Image
+from fake_vision import FakeVisionServer
+from ocr_service import OCRService
+from request_scheduler import BATCH, INTERACTIVE, RequestScheduler, UnitLedger, lane
+
+def tiny_image() -> str:
+    output = io.BytesIO()
+    Image.new('L', (32, 16), 255).save(output, format='PNG')
+    return base64.b64encode(output.getvalue()).decode('utf-8')
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+@contextmanager
+def quiet():
+    """Silence the per-request logging of OCRService."""
+    stdout, sys.stdout = sys.stdout, io.StringIO()
+    try:
+        yield
+    finally:
+        sys.stdout = stdout
+
+def make_service(server: FakeVisionServer, scheduler: RequestScheduler) -> OCRService:
+    service = OCRService('benchmark', endpoint=server.url, scheduler=scheduler)
+    service.retry_delay = 0.05
+    service.retry_max_delay = 0.5
+    service.hedge_enabled = False
+    return service
+
+def flood(service: OCRService, content: str, count: int, concurrency: int, lane_name: str = BATCH) -> list:
+    """Send count one-image requests; returns (seconds, ok) per request."""
+    def one(_):
+        start = time.monotonic()
+        with lane(lane_name):
+            result = service.annotate_contents([content])[0]
+        return time.monotonic() - start, result is not None
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        return list(executor.map(one, range(count)))
+
+def run_load(name: str, limit: float, scheduler: RequestScheduler, count: int, concurrency: int, content: str):
+    server = FakeVisionServer(text='ok', latency=0.01, rate_limit=limit, retry_after=0.2, seed=1).start()
+    service = make_service(server, scheduler)
+    start = time.monotonic()
+    try:
+        with quiet():
+            outcomes = flood(service, content, count, concurrency)
+    finally:
+        server.stop()
+    elapsed = time.monotonic() - start
+    ok = sum(1 for _, success in outcomes if success)
+    stats = scheduler.stats()
+    print(f"{name:26s} ok {ok:4d}/{count:<4d} {ok / elapsed:6.1f} img/s  429s {server.rate_limited:4d}  "
+          f"retries {service.stats()['retries']:4d}  rate factor {stats['rate_factor']:.2f}")
+    return server.rate_limited
+
+def run_lanes(limit: float, count: int, concurrency: int, content: str) -> tuple:
+    server = FakeVisionServer(text='ok', latency=0.01, rate_limit=limit, retry_after=0.2, seed=1).start()
+    scheduler = RequestScheduler(per_second=limit)
+    service = make_service(server, scheduler)
+    interactive = []
+    try:
+        with quiet():
+            background = threading.Thread(target=flood, args=(service, content, count, concurrency))
+            background.start()
+            time.sleep(0.5)
+            # A screenshot every 0.2 s while the batch backlog is queued
+            while background.is_alive() and len(interactive) < 20:
+                interactive.append(flood(service, content, 1, 1, INTERACTIVE)[0][0])
+                time.sleep(0.2)
+            background.join()
+    finally:
+        server.stop()
+    stats = scheduler.stats()
+    print(f"{'interactive during flood':26s} p50 {percentile(interactive, 0.5) * 1000:7.1f} ms  "
+          f"p95 {percentile(interactive, 0.95) * 1000:7.1f} ms  "
+          f"avg wait {stats['interactive_wait_avg'] * 1000:7.1f} ms vs batch {stats['batch_wait_avg'] * 1000:7.1f} ms")
+    return stats['interactive_wait_avg'], stats['batch_wait_avg']
+
+def run_ledger(content: str) -> bool:
+    with tempfile.TemporaryDirectory() as directory:
+        ledger_path = os.path.join(directory, 'units.json')
+        server = FakeVisionServer(text='ok', seed=1).start()
+        try:
+            with quiet():
+                service = make_service(server, RequestScheduler(ledger=UnitLedger(ledger_path)))
+                for _ in range(5):
+                    service.annotate_contents([content] * 4)
+                # A fresh process reading the same ledger, with a budget of 30 units
+                budget = RequestScheduler(period_limit=30, ledger=UnitLedger(ledger_path))
+                service = make_service(server, budget)
+                answered = sum(1 for _ in range(10) if service.annotate_contents([content] * 4)[0] is not None)
+        finally:
+            server.stop()
+        units = UnitLedger(ledger_path).units()
+    print(f"{'ledger and budget':26s} units {units} for {server.images_served} images served; "
+          f"with 30-unit budget {answered}/10 requests sent, {budget.stats()['rejected']} refused")
+    return units == server.images_served and units <= 30
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--limit', type=float, default=20, help='images per second the fake API accepts')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    args = parser.parse_args()
+
+    content = tiny_image()
+    throttled = {}
+    for name, scheduler in (('no scheduler', RequestScheduler()),
+                            ('matched limit', RequestScheduler(per_second=args.limit)),
+                            ('2x limit, adaptive', RequestScheduler(per_second=2 * args.limit))):
+        throttled[name] = run_load(name, args.limit, scheduler, args.requests, args.concurrency, content)
+    interactive_wait, batch_wait = run_lanes(args.limit, args.requests, args.concurrency, content)
+    ledger_ok = run_ledger(content)
+
+    failures = []
+    if throttled['matched limit']:
+        failures.append("the matched scheduler was still rate limited")
+    if interactive_wait > batch_wait:
+        failures.append("interactive requests waited longer than batch ones")
+    if not ledger_ok:
+        failures.append("the unit ledger does not match the images served")
+    for failure in failures:
+        print(failure)
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
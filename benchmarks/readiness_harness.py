@@ -0,0 +1,102 @@
+"""
+Simulate screenshot writers against the real FileWatcher and report how long
+each complete file takes to reach the callback.
+
+    python benchmarks/readiness_harness.py [--runs 5]
+
+Scenarios: a single fast write, a slow writer that pauses longer than the
+settle time between chunks, and the write-to-temp-then-rename pattern. Exits
+non-zero if a file is delivered before it is complete or never delivered.
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+os.environ.setdefault('API_KEY', 'benchmark')
+os.environ.setdefault('WATCH_DIR', tempfile.gettempdir())
+
+from PIL import Image
+from file_watcher import FileWatcher
+
+def make_png(size=(1920, 1080)) -> bytes:
+    output = io.BytesIO()
+    Image.effect_noise(size, 64).convert('RGB').save(output, format='PNG')
+    return output.getvalue()
+
+def write_fast(path: str, data: bytes):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+def write_slow(path: str, data: bytes, chunks: int = 6, pause: float = 0.15):
+    step = len(data) // chunks + 1
+    with open(path, 'wb') as f:
+        for offset in range(0, len(data), step):
+            f.write(data[offset:offset + step])
+            f.flush()
+            time.sleep(pause)
+
+def write_rename(path: str, data: bytes):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+SCENARIOS = {
+    'fast write': write_fast,
+    'slow writer': write_slow,
+    'temp + rename': write_rename
+}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--wait', type=float, default=5.0, help='seconds to wait for each delivery')
+    args = parser.parse_args()
+
+    data = make_png()
+    watch_dir = tempfile.mkdtemp(prefix='readiness-')
+    delivered = {}
+    events = {}
+
+    def on_ready(file_path: str):
+        delivered[file_path] = (time.monotonic(), os.path.getsize(file_path))
+        events[file_path].set()
+
+    watcher = FileWatcher(watch_dir, on_ready)
+    watcher.start()
+    failures = 0
+    try:
+        for name, writer in SCENARIOS.items():
+            latencies = []
+            for run in range(args.runs):
+                path = os.path.join(watch_dir, f"{name.replace(' ', '_').replace('+', '')}_{run}.png")
+                events[path] = threading.Event()
+                writer(path, data)
+                written_at = time.monotonic()
+
+                if not events[path].wait(args.wait):
+                    print(f"  {name}: MISSED {path}")
+                    failures += 1
+                    continue
+                ready_at, size = delivered[path]
+                if size != len(data):
+                    print(f"  {name}: PREMATURE delivery at {size}/{len(data)} bytes")
+                    failures += 1
+                latencies.append(max(0.0, ready_at - written_at) * 1000)
+
+            if latencies:
+                latencies.sort()
+                print(f"{name:14s} median {latencies[len(latencies) // 2]:7.1f} ms   "
+                      f"max {latencies[-1]:7.1f} ms   ({len(latencies)}/{args.runs} delivered)")
+    finally:
+        watcher.stop()
+
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Exercise OCRService retries, hedging and the circuit breaker against a
+fault-injecting fake Vision API.
+
+    python benchmarks/retry_benchmark.py [--requests 200]
+
+Scenarios: a slow tail (with and without hedging), random 503s, 429s with
+Retry-After, and an API that is down. Reports success rate, tail latency and
+the service's retry/hedge/circuit counters.
+"""
+import argparse
+import base64
+import io
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+os.environ.setdefault('API_KEY', 'benchmark')
+os.environ.setdefault('WATCH_DIR', tempfile.gettempdir())
+
+from PIL import Image
+from fake_vision import FakeVisionServer
+from ocr_service import OCRService
+
+SCENARIOS = [
+    ('slow tail, no hedge', dict(latency=0.02, slow_rate=0.03, slow_latency=1.0), dict(hedge=False)),
+    ('slow tail, hedged', dict(latency=0.02, slow_rate=0.03, slow_latency=1.0), dict(hedge=True)),
+    ('20% 503s', dict(latency=0.02, error_rate=0.2), dict(hedge=False)),
+    ('20% 429s', dict(latency=0.02, throttle_rate=0.2, retry_after=0.1), dict(hedge=False)),
+    ('API down', dict(error_rate=1.0), dict(hedge=False)),
+]
+
+def tiny_image() -> str:
+    output = io.BytesIO()
+    Image.new('L', (32, 16), 255).save(output, format='PNG')
+    return base64.b64encode(output.getvalue()).decode('utf-8')
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+def run(name, server_options, service_options, count, concurrency, content):
+    server = FakeVisionServer(text='ok', seed=1, **server_options).start()
+    service = OCRService('benchmark', endpoint=server.url)
+    service.retry_delay = 0.05
+    service.retry_max_delay = 0.5
+    service.hedge_enabled = service_options['hedge']
+    service.hedge_min_delay = 0.05
+
+    def one(_):
+        start = time.monotonic()
+        result = service.annotate_contents([content])[0]
+        return time.monotonic() - start, result is not None
+
+    try:
+        # Silence the per-request logging of OCRService
+        stdout, sys.stdout = sys.stdout, io.StringIO()
+        with ThreadPoolExecutor(concurrency) as executor:
+            outcomes = list(executor.map(one, range(count)))
+    finally:
+        sys.stdout = stdout
+        server.stop()
+
+    latencies = [latency for latency, _ in outcomes]
+    successes = sum(1 for _, ok in outcomes if ok)
+    stats = service.stats()
+    print(f"{name:22s} ok {successes:4d}/{count:<4d} p50 {percentile(latencies, 0.5) * 1000:7.1f} ms  "
+          f"p95 {percentile(latencies, 0.95) * 1000:7.1f} ms  p99 {percentile(latencies, 0.99) * 1000:7.1f} ms  "
+          f"http {server.requests_served:4d}  retries {stats['retries']:3d}  hedges {stats['hedges']:3d} "
+          f"(won {stats['hedge_wins']:3d})  circuit {stats['circuit_state']} x{stats['circuit_opened']}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=4)
+    args = parser.parse_args()
+
+    content = tiny_image()
+    for name, server_options, service_options in SCENARIOS:
+        run(name, server_options, service_options, args.requests, args.concurrency, content)
+
+if __name__ == '__main__':
+    main()
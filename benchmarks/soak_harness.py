@@ -0,0 +1,190 @@
+"""
+Push thousands of synthetic screenshots through the OCR pipeline and check
+that memory stays flat.
+
+    python benchmarks/soak_harness.py [--screenshots 2000] [--batch 50] [--no-trace]
+
+Runs the daemon's pipeline in this process (watcher, intake queue, worker
+pool, OCR cache, journal, near-duplicate detection and the cloud service)
+against a fake Vision API, plus the result window's preview renderer asked
+for a preview of every result, as an unattended desktop session would. The
+OCR cache is shrunk to --cache-kb so that its index, bounded by the size on
+disk, is full before growth is measured.
+
+Screenshots, each different, are written --batch at a time; after each batch
+has been delivered the garbage is collected and resident size, traced Python
+memory and live images are sampled. After a warm-up of --warmup of the run,
+the growth per 1000 screenshots is fitted to the samples. Reports it with the
+OCR job allocation peaks, the live object counts at the end and the
+allocation sites that grew most after the warm-up, and exits non-zero when
+traced or resident memory grows faster than the limits, decoded screenshots
+are left alive or more images are alive than the retention caps allow.
+"""
+import argparse
+import gc
+import os
+import queue
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from PIL import Image, ImageDraw
+from fake_vision import FakeVisionServer
+
+def write_screenshot(directory: str, index: int) -> str:
+    image = Image.new('RGB', (960, 540), (255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    for line in range(6):
+        draw.text((20, 20 + 24 * line), f"screenshot {index} line {line} " * 3, fill=(0, 0, 0))
+    path = os.path.join(directory, f"soak{index:05d}.png")
+    image.save(path + '.part', format='PNG')
+    os.replace(path + '.part', path)
+    return path
+
+def slope(points: list) -> float:
+    """Least squares slope of (x, y) points."""
+    count = len(points)
+    mean_x = sum(x for x, _ in points) / count
+    mean_y = sum(y for _, y in points) / count
+    spread = sum((x - mean_x) ** 2 for x, _ in points)
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / spread if spread else 0.0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--screenshots', type=int, default=2000)
+    parser.add_argument('--batch', type=int, default=50, help='screenshots written before each sample')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--warmup', type=float, default=0.25, help='share of the run before growth is measured')
+    parser.add_argument('--max-traced-kb', type=float, default=256, help='allowed traced growth per 1000 screenshots')
+    parser.add_argument('--max-rss-kb', type=float, default=4096, help='allowed resident growth per 1000 screenshots')
+    parser.add_argument('--cache-kb', type=int, default=64,
+                        help='OCR cache size, small so its index stops growing during the warm-up')
+    parser.add_argument('--no-trace', action='store_true', help='sample resident size only, without tracemalloc')
+    args = parser.parse_args()
+
+    server = FakeVisionServer(text='soak', latency=0.005).start()
+    with tempfile.TemporaryDirectory() as directory:
+        watch_dir = os.path.join(directory, 'screenshots')
+        os.makedirs(watch_dir)
+        # Configuration is read when config is first imported, so set it up before that
+        os.environ.update(API_KEY='benchmark', WATCH_DIR=watch_dir, OCR_VISION_ENDPOINT=server.url,
+                          OCR_CACHE_DIR=os.path.join(directory, 'cache'), OCR_UNIT_LEDGER='', OCR_WARM_CONNECTIONS='0',
+                          OCR_RATE_PER_SECOND='0', OCR_RATE_PER_MINUTE='0', OCR_WORKERS=str(args.workers))
+        from daemon import OCRDaemon
+        from image_store import ImageStore
+        from journal import JobJournal
+        from memory import memory, rss_bytes
+        from result_window import PreviewRenderer
+        from config import DECODE_MAX_SIDE, UI_MAX_PREVIEWS, UI_MAX_PHOTOS, DEDUP_RECENT
+
+        if not args.no_trace:
+            memory.start()
+        journal = JobJournal(os.path.join(directory, 'journal.jsonl'))
+        ocr_daemon = OCRDaemon(watch_dir, 'benchmark', workers=args.workers, journal=journal)
+        events = ocr_daemon.broker.subscribe()
+        cache = getattr(getattr(ocr_daemon.backend, 'ocr_service', ocr_daemon.backend), 'cache', None)
+        if cache is not None:
+            cache.max_bytes = args.cache_kb * 1024
+        # Previews are made on the background thread and kept by the renderer, as in the app;
+        # this thread stands in for the Tk main loop
+        calls = queue.Queue()
+        image_store = ImageStore(DECODE_MAX_SIDE)
+        previews = PreviewRenderer(image_store, lambda func, *a: calls.put((func, a)), UI_MAX_PREVIEWS, UI_MAX_PHOTOS)
+
+        def run_calls():
+            while True:
+                try:
+                    func, call_args = calls.get_nowait()
+                except queue.Empty:
+                    return
+                func(*call_args)
+
+        if not ocr_daemon.start():
+            raise SystemExit(f"Could not watch {watch_dir}")
+
+        samples = []  # (screenshots done, rss, traced, live images)
+        warmup_samples = max(1, int(args.screenshots / args.batch * args.warmup))
+        growth = []
+        written = delivered = failed = 0
+        start = time.monotonic()
+        try:
+            while written < args.screenshots:
+                batch = min(args.batch, args.screenshots - written)
+                for _ in range(batch):
+                    write_screenshot(watch_dir, written)
+                    written += 1
+                deadline = time.monotonic() + 60
+                while delivered < written and time.monotonic() < deadline:
+                    run_calls()
+                    try:
+                        event = events.get(timeout=0.05)
+                    except queue.Empty:
+                        continue
+                    delivered += 1
+                    if event['status'] != 'ok':
+                        failed += 1
+                    previews.request(event['path'], lambda path: None)
+                if delivered < written:
+                    print(f"only {delivered} of {written} screenshots delivered, giving up")
+                    break
+                # Let the last previews finish
+                while previews.stats()['preparing'] and time.monotonic() < deadline:
+                    run_calls()
+                    time.sleep(0.01)
+                gc.collect()
+                stats = memory.stats()
+                samples.append((delivered, rss_bytes() or 0, stats.get('traced', 0),
+                                memory.live_objects().get('PIL.Image.Image', 0)))
+                if not args.no_trace and len(samples) == warmup_samples:
+                    # Baseline for the allocation sites that grow from here on
+                    memory.snapshot()
+                if len(samples) % 10 == 0:
+                    print(f"{delivered:6d} screenshots  RSS {samples[-1][1] / 2 ** 20:6.1f} MiB  "
+                          f"traced {samples[-1][2] / 2 ** 20:6.2f} MiB  live images {samples[-1][3]}")
+        finally:
+            elapsed = time.monotonic() - start
+            if not args.no_trace and len(samples) > warmup_samples:
+                growth = memory.snapshot(limit=8).get('growth', [])
+            ocr_daemon.stop()
+            previews.stop()
+            report = memory.report()
+            journal.close()
+            server.stop()
+
+    measured = samples[warmup_samples - 1:]
+    rss_growth = slope([(done, rss) for done, rss, _, _ in measured]) * 1000 / 1024 if len(measured) > 1 else 0.0
+    traced_growth = slope([(done, traced) for done, _, traced, _ in measured]) * 1000 / 1024 if len(measured) > 1 else 0.0
+    job_peak = report['job_peak']
+    print(f"{delivered} screenshots in {elapsed:.0f} s ({failed} failed), {len(samples)} samples")
+    print(f"growth after warm-up per 1000 screenshots: RSS {rss_growth:.0f} KiB, traced {traced_growth:.0f} KiB")
+    if job_peak['count']:
+        print(f"OCR job allocation peak p50 {job_peak['p50'] / 2 ** 20:.1f} MiB  p95 {job_peak['p95'] / 2 ** 20:.1f} MiB  "
+              f"max {job_peak['max'] / 2 ** 20:.1f} MiB")
+    print(f"live at the end: {report['live']}, previews {previews.stats()}")
+    if growth:
+        print("allocation sites that grew most after warm-up:")
+        for site in growth:
+            print(f"  {site['bytes_diff'] / 1024:+9.1f} KiB {site['count_diff']:+7d} blocks  {site['site']}")
+
+    failures = []
+    if delivered < args.screenshots:
+        failures.append(f"{args.screenshots - delivered} screenshots were not delivered")
+    if len(measured) < 4:
+        failures.append("too few samples after warm-up to measure growth, use more screenshots or smaller batches")
+    if not args.no_trace and traced_growth > args.max_traced_kb:
+        failures.append(f"traced memory grew {traced_growth:.0f} KiB per 1000 screenshots (limit {args.max_traced_kb:.0f})")
+    if rss_growth > args.max_rss_kb:
+        failures.append(f"resident memory grew {rss_growth:.0f} KiB per 1000 screenshots (limit {args.max_rss_kb:.0f})")
+    if report['live'].get('image_store.SharedImage', 0):
+        failures.append(f"{report['live']['image_store.SharedImage']} decoded screenshot handles were left alive")
+    # Kept previews, the near-duplicate references (brightness and colour each) and the jobs' own images
+    if report['live'].get('PIL.Image.Image', 0) > UI_MAX_PREVIEWS + 2 * DEDUP_RECENT + args.workers:
+        failures.append(f"{report['live']['PIL.Image.Image']} images alive, more than the caps allow")
+    for failure in failures:
+        print(failure)
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""
+Compare confirm-to-result latency and API usage with and without
+speculative OCR.
+
+    python benchmarks/speculation_benchmark.py [--screenshots 40] [--think 0.8] [--latency 0.4] [--cancel-rate 0.2]
+
+Screenshots arrive every --interval seconds. A simulated user looks at each
+one for a lognormal think time around --think seconds, then confirms it or,
+with probability --cancel-rate, cancels it. Without speculation OCR starts at
+the confirmation; with it, OCR starts on arrival and Cancel aborts the job.
+OCR goes through the real worker pool and OCR service to a fake Vision API
+with --latency seconds per request. Results are delivered on the main
+thread through a queue, as the Tk dispatcher does. Reports the wait after
+Confirm (p50/p95), the latency speculation saved, and the API units spent on
+cancelled screenshots, hedged second copies included. Exits non-zero when
+speculation does not shorten the median wait or its waste is not reported.
+"""
+import argparse
+import heapq
+import io
+import os
+import queue
+import random
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+os.environ.setdefault('API_KEY', 'benchmark')
+os.environ.setdefault('WATCH_DIR', tempfile.gettempdir())
+os.environ['OCR_UNIT_LEDGER'] = ''
+
+from PIL import Image, ImageDraw
+from fake_vision import FakeVisionServer
+from ocr_service import OCRService
+from ocr_worker import OCRWorkerPool
+from speculation import SpeculativeOCR
+
+def write_screenshots(directory: str, count: int) -> list:
+    paths = []
+    for index in range(count):
+        image = Image.new('RGB', (800, 500), (255, 255, 255))
+        ImageDraw.Draw(image).text((20, 20), f"screenshot {index}", fill=(0, 0, 0))
+        path = os.path.join(directory, f"shot{index:04d}.png")
+        image.save(path)
+        paths.append(path)
+    return paths
+
+@contextmanager
+def quiet():
+    """Silence the per-request logging of OCRService."""
+    stdout, sys.stdout = sys.stdout, io.StringIO()
+    try:
+        yield
+    finally:
+        sys.stdout = stdout
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+def simulate_user(paths: list, interval: float, think: float, cancel_rate: float, seed: int) -> list:
+    """Return (time, action, path) events: arrival, then confirm or cancel after the think time."""
+    rng = random.Random(seed)
+    events = []
+    for index, path in enumerate(paths):
+        arrival = index * interval
+        decision = 'cancel' if rng.random() < cancel_rate else 'confirm'
+        events.append((arrival, 'arrive', path))
+        events.append((arrival + rng.lognormvariate(0, 0.5) * think, decision, path))
+    heapq.heapify(events)
+    return events
+
+def run(paths: list, events: list, server: FakeVisionServer, speculative: bool, workers: int) -> dict:
+    calls = queue.Queue()
+    service = OCRService('benchmark', endpoint=server.url)
+    pool = OCRWorkerPool(service, workers, 256, lambda func, *args: calls.put((func, args)))
+    confirmed_at, waits = {}, []
+
+    def on_result(path, result):
+        waits.append(time.monotonic() - confirmed_at[path])
+
+    speculation = SpeculativeOCR(pool, on_result) if speculative else None
+    events = list(events)
+    decisions = sum(1 for _, action, _ in events if action == 'confirm')
+    units_before = server.images_served
+    start = time.monotonic()
+    with quiet():
+        while events or len(waits) < decisions:
+            # Run delivered results, like the Tk dispatcher, until the next user action is due
+            timeout = max(0.0, start + events[0][0] - time.monotonic()) if events else 0.05
+            try:
+                func, args = calls.get(timeout=timeout)
+                func(*args)
+                continue
+            except queue.Empty:
+                pass
+            if not events:
+                continue
+            _, action, path = heapq.heappop(events)
+            if action == 'arrive':
+                if speculation is not None:
+                    speculation.start(path)
+            elif action == 'confirm':
+                confirmed_at[path] = time.monotonic()
+                if speculation is None or not speculation.confirm(path):
+                    pool.submit(path, on_result)
+            elif speculation is not None:
+                speculation.cancel(path)
+        # Let aborted jobs still in flight report what they cost
+        deadline = time.monotonic() + 5
+        while speculation is not None and speculation.stats()['cancelled_running'] and time.monotonic() < deadline:
+            try:
+                func, args = calls.get(timeout=0.05)
+                func(*args)
+            except queue.Empty:
+                pass
+    pool.stop()
+    stats = speculation.stats() if speculation is not None else {}
+    stats.update(wait_p50=percentile(waits, 0.5), wait_p95=percentile(waits, 0.95),
+                 units=server.images_served - units_before, skipped=pool.stats()['cancelled'],
+                 hedges=service.stats()['hedges'])
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--screenshots', type=int, default=40)
+    parser.add_argument('--interval', type=float, default=0.5, help='seconds between screenshots')
+    parser.add_argument('--think', type=float, default=0.8, help='median seconds before Confirm or Cancel')
+    parser.add_argument('--latency', type=float, default=0.4, help='median fake API latency')
+    parser.add_argument('--cancel-rate', type=float, default=0.2)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_screenshots(directory, args.screenshots)
+        events = simulate_user(paths, args.interval, args.think, args.cancel_rate, args.seed)
+        results = {}
+        for name, speculative in (('on confirm', False), ('speculative', True)):
+            server = FakeVisionServer(text='ok', latency=args.latency, latency_dist='lognormal', seed=args.seed).start()
+            try:
+                results[name] = run(paths, events, server, speculative, args.workers)
+            finally:
+                server.stop()
+            stats = results[name]
+            print(f"{name:12s} wait after Confirm p50 {stats['wait_p50'] * 1000:7.1f} ms  "
+                  f"p95 {stats['wait_p95'] * 1000:7.1f} ms  API units {stats['units']:3d}  hedged {stats['hedges']:2d}")
+
+    stats = results['speculative']
+    print(f"speculation: {stats['confirmed']} confirmed, {stats['ready_at_confirm']} already done at Confirm, "
+          f"saved {stats['saved_avg'] * 1000:.0f} ms on average ({stats['saved_seconds']:.1f} s in total); "
+          f"{stats['cancelled']} cancelled, {stats['skipped']} before starting, "
+          f"{stats['wasted_units']:.0f} API units wasted")
+
+    failures = []
+    if stats['wait_p50'] >= results['on confirm']['wait_p50']:
+        failures.append("speculation did not shorten the wait after Confirm")
+    # Hedged copies differ between the runs; the waste must cover the extra first copies,
+    # plus at most the hedges of the speculative run (those of cancelled jobs are waste too)
+    extra = (stats['units'] - stats['hedges']) - (results['on confirm']['units'] - results['on confirm']['hedges'])
+    if not 0 <= round(stats['wasted_units']) - extra <= stats['hedges']:
+        failures.append("the wasted units do not match the extra API usage")
+    for failure in failures:
+        print(failure)
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
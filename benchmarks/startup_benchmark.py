@@ -0,0 +1,128 @@
+"""
+Measure cold-start cost: module import time and time until the first
+directory watch is active.
+
+    python benchmarks/startup_benchmark.py [--runs 5] [--import-budget 100] [--watch-budget 800]
+
+Each measurement runs in a fresh interpreter. Import time comes from
+`python -X importtime`; the slowest imports of the median run are listed so a
+regression can be traced to the module that caused it. Time-to-first-watch
+starts the headless daemon (and the Tk app when a display is available) and
+waits for "Started watching directory" on its output.
+
+Exits non-zero when a median exceeds its budget (milliseconds).
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SRC = os.path.join(ROOT, 'src')
+WATCH_MARKER = 'Started watching directory'
+
+def child_env(watch_dir: str) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.setdefault('API_KEY', 'benchmark')
+    env['WATCH_DIR'] = watch_dir
+    env['OCR_CACHE_DIR'] = os.path.join(watch_dir, '.cache')
+    return env
+
+def import_profile(module: str, env: Dict[str, str]) -> Tuple[float, List[Tuple[float, float, str]]]:
+    """Import module in a new interpreter; return total ms and (self ms, cumulative ms, name) rows."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=SRC, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    rows = []
+    total = None
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        row = (int(self_us) / 1000, int(cumulative_us) / 1000, name.rstrip())
+        rows.append(row)
+        if name.strip() == module:
+            total = row[1]
+    return total, rows
+
+def time_to_first_watch(script: str, args: List[str], env: Dict[str, str], timeout: float) -> Optional[float]:
+    """Start script and return ms until it reports an active watch, or None if it never does."""
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-u', os.path.join(SRC, script)] + args, cwd=SRC, env=env,
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    elapsed = None
+    try:
+        deadline = start + timeout
+        for line in process.stdout:
+            if WATCH_MARKER in line:
+                elapsed = (time.perf_counter() - start) * 1000
+                break
+            if time.perf_counter() > deadline:
+                break
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return elapsed
+
+def print_top(rows: List[Tuple[float, float, str]], count: int):
+    print(f"    {'self ms':>8} {'cum ms':>8}  module")
+    for self_ms, cumulative_ms, name in sorted(rows, key=lambda row: row[0], reverse=True)[:count]:
+        print(f"    {self_ms:8.1f} {cumulative_ms:8.1f}  {name.strip()}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure import time and time-to-first-watch.')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=12, help='slowest imports to list per entry point')
+    parser.add_argument('--import-budget', type=float, default=100.0, help='median ms to import main')
+    parser.add_argument('--watch-budget', type=float, default=800.0, help='median ms until the daemon watches')
+    parser.add_argument('--timeout', type=float, default=30.0)
+    args = parser.parse_args()
+
+    failures = []
+    with tempfile.TemporaryDirectory() as watch_dir:
+        env = child_env(watch_dir)
+
+        for module in ('main', 'daemon', 'batch'):
+            profiles = [import_profile(module, env) for _ in range(args.runs)]
+            profiles.sort(key=lambda profile: profile[0])
+            median_total, median_rows = profiles[len(profiles) // 2]
+            print(f"import {module}: median {median_total:.1f} ms "
+                  f"(min {profiles[0][0]:.1f}, max {profiles[-1][0]:.1f})")
+            print_top(median_rows, args.top)
+            if module == 'main' and median_total > args.import_budget:
+                failures.append(f"import main {median_total:.1f} ms > {args.import_budget:.0f} ms")
+
+        targets = [('daemon', 'daemon.py', ['--port', '0'])]
+        if os.environ.get('DISPLAY'):
+            targets.append(('ui', 'main.py', []))
+        else:
+            print("\nNo DISPLAY, skipping time-to-first-watch of the Tk app")
+        for label, script, script_args in targets:
+            samples = [time_to_first_watch(script, script_args, env, args.timeout) for _ in range(args.runs)]
+            if None in samples:
+                failures.append(f"{label} never reported an active watch")
+                continue
+            median = statistics.median(samples)
+            print(f"\ntime to first watch ({label}): median {median:.0f} ms "
+                  f"(min {min(samples):.0f}, max {max(samples):.0f})")
+            if label == 'daemon' and median > args.watch_budget:
+                failures.append(f"daemon first watch {median:.0f} ms > {args.watch_budget:.0f} ms")
+
+    if failures:
+        print("\nStartup budget exceeded:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print("\nWithin startup budget")
+
+if __name__ == "__main__":
+    main()
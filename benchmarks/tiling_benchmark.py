@@ -0,0 +1,112 @@
+"""
+Compare whole-image and tiled OCR of very large screenshots with small text.
+
+    python benchmarks/tiling_benchmark.py [--sizes 3840x2160,5120x2880,7680x2160] [--font-size 13] [--latency 0.8]
+
+Renders screenshots full of small words at known positions and OCRs each
+with plain OCRService (one downscaled upload) and with TiledOCR against a
+local fake Vision API in word mode, where words on lines shorter than
+--min-text-height uploaded pixels come back unreadable. Reports readable
+word recall, duplicated words, requests, upload size and time. The fake
+recognizes every request in one Python process, so on top of --latency the
+times include its own CPU work, which grows with the uploaded pixels.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+os.environ.setdefault('API_KEY', 'benchmark')
+os.environ.setdefault('WATCH_DIR', tempfile.gettempdir())
+
+from PIL import Image, ImageDraw, ImageFont
+from fake_vision import FakeVisionServer
+from ocr_service import OCRService
+from tiled_ocr import TiledOCR
+from metrics import metrics
+
+WORDS = ("error warning import config service request response timeout cache "
+         "thread window screenshot value return true false none index").split()
+
+def render(path: str, size: tuple, font_size: int, rng: random.Random) -> list:
+    """Fill an image with lines of words and return the word boxes."""
+    image = Image.new('RGB', size, (250, 250, 250))
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=font_size)
+    space = draw.textlength('  ', font=font)
+    boxes = []
+    y = 10
+    while y + 2 * font_size < size[1]:
+        x = 10
+        while True:
+            word = rng.choice(WORDS)
+            box = draw.textbbox((x, y), word, font=font)
+            if box[2] > size[0] - 10:
+                break
+            draw.text((x, y), word, fill=(20, 20, 20), font=font)
+            boxes.append(box)
+            x = box[2] + space
+        y += int(font_size * 1.8)
+    image.save(path)
+    return boxes
+
+def score(result, boxes: list) -> tuple:
+    """Return (readable words found, duplicates) by matching word centres to rendered boxes."""
+    found, duplicates = set(), 0
+    for text, left, top, right, bottom in (result or {}).get('layout', ()):
+        if text == '?':
+            continue
+        x, y = (left + right) / 2, (top + bottom) / 2
+        for index, box in enumerate(boxes):
+            if box[0] - 2 <= x <= box[2] + 2 and box[1] - 2 <= y <= box[3] + 2:
+                if index in found:
+                    duplicates += 1
+                found.add(index)
+                break
+    return len(found), duplicates
+
+def run(backend, path: str) -> dict:
+    metrics.reset()
+    start = time.perf_counter()
+    result = backend.perform_ocr(path)
+    elapsed = time.perf_counter() - start
+    counters = metrics.snapshot()['counters']
+    return {'result': result, 'seconds': elapsed, 'requests': counters.get('api_requests', 0),
+            'upload_bytes': counters.get('upload_bytes', 0)}
+
+def main():
+    parser = argparse.ArgumentParser(description='Whole-image vs tiled OCR of large screenshots.')
+    parser.add_argument('--sizes', default='3840x2160,5120x2880,7680x2160')
+    parser.add_argument('--font-size', type=int, default=13)
+    parser.add_argument('--min-text-height', type=int, default=8, help='smallest readable line height in px')
+    parser.add_argument('--latency', type=float, default=0.8, help='fake API latency in seconds')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    server = FakeVisionServer(latency=args.latency, words=True, min_text_height=args.min_text_height).start()
+    service = OCRService('benchmark', endpoint=server.url)
+    tiled = TiledOCR(service, service)
+    print(f"{'size':<11} {'mode':<6} {'recall':>7} {'dupes':>6} {'requests':>8} {'upload KB':>10} "
+          f"{'seconds':>8}")
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            for size_text in args.sizes.split(','):
+                size = tuple(int(value) for value in size_text.split('x'))
+                path = os.path.join(directory, f"screen_{size_text}.png")
+                boxes = render(path, size, args.font_size, rng)
+                for mode, backend in (('whole', service), ('tiled', tiled)):
+                    measured = run(backend, path)
+                    found, duplicates = score(measured['result'], boxes)
+                    print(f"{size_text:<11} {mode:<6} {found / len(boxes):>7.1%} {duplicates:>6} "
+                          f"{measured['requests']:>8} {measured['upload_bytes'] / 1024:>10.0f} "
+                          f"{measured['seconds']:>8.2f}")
+    finally:
+        tiled.stop()
+        server.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""
+Measure connection reuse, warm-up, keep-alive and body compression of the
+Vision API transport against a local HTTPS stand-in.
+
+    python benchmarks/transport_benchmark.py [--connect-latency 0.1] [--concurrency 16] [--uplink-mbps 10]
+
+The fake API serves HTTPS with a self-signed certificate (made with the
+openssl command line tool) and charges --connect-latency for every new
+connection on top of the TLS handshake, as the round trips to a distant
+endpoint would. Scenarios:
+
+  * first request from a cold transport vs one warmed up at startup
+  * a request after an idle spell longer than the server's idle timeout,
+    with and without keep-alive pings
+  * bursts of --concurrency requests with requests' default pool of 10
+    connections vs a pool sized to the OCR concurrency
+  * bytes sent per screenshot-sized body with and without gzip, the time
+    spent on loopback and the upload time that saves on a --uplink-mbps link
+
+Exits non-zero when warming up does not make the first request faster, the
+keep-alive does not avoid a new connection after the idle spell, the sized
+pool opens more connections than it holds, gzip does not shrink the bodies,
+or compression stays on for an endpoint that refuses it.
+"""
+import argparse
+import base64
+import io
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+os.environ.setdefault('API_KEY', 'benchmark')
+os.environ.setdefault('WATCH_DIR', tempfile.gettempdir())
+os.environ['OCR_UNIT_LEDGER'] = ''
+
+from PIL import Image, ImageDraw
+from fake_vision import FakeVisionServer
+from ocr_service import OCRService
+from transport import VisionTransport
+from config import TRANSPORT_POOL_SIZE, TRANSPORT_GZIP_MIN_BYTES
+
+def make_certificate(directory: str) -> str:
+    """Write a self-signed certificate and key for 127.0.0.1 into one PEM file and return its path."""
+    openssl = shutil.which('openssl')
+    if openssl is None:
+        sys.exit("The openssl command line tool is needed to make a test certificate")
+    key_path = os.path.join(directory, 'key.pem')
+    cert_path = os.path.join(directory, 'cert.pem')
+    subprocess.run([openssl, 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                    '-subj', '/CN=127.0.0.1', '-addext', 'subjectAltName=IP:127.0.0.1',
+                    '-keyout', key_path, '-out', cert_path], check=True, capture_output=True)
+    pem_path = os.path.join(directory, 'server.pem')
+    with open(pem_path, 'w') as pem:
+        for path in (cert_path, key_path):
+            with open(path) as part:
+                pem.write(part.read())
+    return pem_path
+
+def screenshot_content(index: int = 0) -> str:
+    image = Image.new('RGB', (1280, 800), (255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    for row in range(0, 800, 24):
+        draw.text((16, row), f"screenshot {index} line {row // 24} lorem ipsum dolor sit amet " * 3, fill=(0, 0, 0))
+    output = io.BytesIO()
+    image.save(output, format='PNG')
+    return base64.b64encode(output.getvalue()).decode('utf-8')
+
+@contextmanager
+def quiet():
+    """Silence the per-request logging of OCRService."""
+    stdout, sys.stdout = sys.stdout, io.StringIO()
+    try:
+        yield
+    finally:
+        sys.stdout = stdout
+
+def make_service(server: FakeVisionServer, transport: VisionTransport) -> OCRService:
+    service = OCRService('benchmark', endpoint=server.url, transport=transport)
+    service.hedge_enabled = False
+    return service
+
+def transport_for(server: FakeVisionServer, pem: str, pool_size: int = TRANSPORT_POOL_SIZE, **kwargs):
+    return VisionTransport(server.url, pool_size, verify=pem, compress_min_bytes=TRANSPORT_GZIP_MIN_BYTES, **kwargs)
+
+def timed_request(service: OCRService, content: str) -> float:
+    start = time.perf_counter()
+    with quiet():
+        if service.annotate_contents([content])[0] is None:
+            raise RuntimeError("the fake Vision API did not answer")
+    return time.perf_counter() - start
+
+def wait_for_warmup(transport: VisionTransport, connections: int, timeout: float = 10):
+    deadline = time.monotonic() + timeout
+    while transport.stats()['warmups'] < connections and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+def run_first_request(pem: str, connect_latency: float, content: str) -> tuple:
+    server = FakeVisionServer(text='ok', certfile=pem, connect_latency=connect_latency).start()
+    try:
+        cold = timed_request(make_service(server, transport_for(server, pem)), content)
+        warmed_transport = transport_for(server, pem, warm_connections=2)
+        warmed_transport.warm()
+        wait_for_warmup(warmed_transport, 2)
+        warm = timed_request(make_service(server, warmed_transport), content)
+    finally:
+        server.stop()
+    handshake = warmed_transport.stats()['handshake_p50']
+    print(f"{'first request':28s} cold {cold * 1000:7.1f} ms  warmed {warm * 1000:7.1f} ms  "
+          f"(handshake p50 {handshake * 1000:.1f} ms)")
+    return cold, warm
+
+def run_idle(pem: str, connect_latency: float, content: str) -> dict:
+    reconnects = {}
+    for name, keepalive in (('no keep-alive', 0), ('keep-alive', 0.3)):
+        server = FakeVisionServer(text='ok', certfile=pem, connect_latency=connect_latency, idle_timeout=0.5).start()
+        transport = transport_for(server, pem, keepalive=keepalive)
+        service = make_service(server, transport)
+        try:
+            timed_request(service, content)
+            transport.warm()
+            time.sleep(1.5)
+            before = transport.stats()['connections']
+            after_idle = timed_request(service, content)
+        finally:
+            transport.close()
+            server.stop()
+        stats = transport.stats()
+        reconnects[name] = stats['connections'] - before
+        print(f"{'after 1.5 s idle, ' + name:28s} {after_idle * 1000:7.1f} ms  "
+              f"new connections {reconnects[name]}  pings {stats['pings']}")
+    return reconnects
+
+def run_bursts(pem: str, connect_latency: float, concurrency: int, bursts: int, content: str) -> dict:
+    results = {}
+    for name, pool_size in (('default pool of 10', 10), (f'pool sized to {TRANSPORT_POOL_SIZE}', TRANSPORT_POOL_SIZE)):
+        server = FakeVisionServer(text='ok', certfile=pem, connect_latency=connect_latency, latency=0.1).start()
+        transport = transport_for(server, pem, pool_size=pool_size)
+        service = make_service(server, transport)
+        latencies = []
+        try:
+            with quiet(), ThreadPoolExecutor(concurrency) as executor:
+                # Screenshots arrive in bursts; between them every connection sits idle in the pool
+                for _ in range(bursts):
+                    latencies += executor.map(lambda _: timed_request(service, content), range(concurrency))
+                    time.sleep(0.2)
+        finally:
+            server.stop()
+        stats = transport.stats()
+        results[pool_size] = stats
+        latencies.sort()
+        print(f"{name:28s} p50 {latencies[len(latencies) // 2] * 1000:6.1f} ms  "
+              f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:6.1f} ms  reuse {stats['reuse_rate']:.0%}  "
+              f"connections {stats['connections']:4d}")
+    return results
+
+def run_gzip(pem: str, contents: list, uplink_mbps: float) -> tuple:
+    sent = {}
+    for name, compress in (('plain', False), ('gzip', True)):
+        server = FakeVisionServer(text='ok', certfile=pem).start()
+        transport = transport_for(server, pem, compress=compress)
+        service = make_service(server, transport)
+        try:
+            timed_request(service, contents[0])  # Connect and import outside the timing
+            before = server.bytes_received
+            latencies = sorted(timed_request(service, content) for content in contents)
+        finally:
+            server.stop()
+        sent[name] = server.bytes_received - before
+        # Loopback has no bandwidth limit; estimate the upload time on a real uplink
+        upload = sent[name] * 8 / (uplink_mbps * 1e6) / len(contents)
+        print(f"{'bodies, ' + name:28s} {sent[name] / len(contents) / 1024:6.0f} KiB per request  "
+              f"p50 {latencies[len(latencies) // 2] * 1000:5.1f} ms on loopback, "
+              f"+{upload * 1000:5.1f} ms upload at {uplink_mbps:g} Mbit/s")
+
+    # An endpoint that refuses compressed bodies gets them plain from then on
+    server = FakeVisionServer(text='ok', certfile=pem, accept_gzip=False).start()
+    transport = transport_for(server, pem)
+    service = make_service(server, transport)
+    try:
+        with quiet():
+            fallback_ok = all(service.annotate_contents([content])[0] is not None for content in contents[:3])
+    finally:
+        server.stop()
+    print(f"{'gzip refused by endpoint':28s} answered {fallback_ok}, compression now {transport.compress}")
+    return sent['plain'], sent['gzip'], fallback_ok and not transport.compress
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--connect-latency', type=float, default=0.1, help='seconds per new connection')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--bursts', type=int, default=10)
+    parser.add_argument('--uplink-mbps', type=float, default=10, help='uplink speed for the upload time estimate')
+    args = parser.parse_args()
+    # Pool overflow is expected in the default-pool scenario
+    logging.getLogger('urllib3').setLevel(logging.ERROR)
+
+    failures = []
+    with tempfile.TemporaryDirectory() as directory:
+        pem = make_certificate(directory)
+        contents = [screenshot_content(index) for index in range(10)]
+        cold, warm = run_first_request(pem, args.connect_latency, contents[0])
+        reconnects = run_idle(pem, args.connect_latency, contents[0])
+        pools = run_bursts(pem, args.connect_latency, args.concurrency, args.bursts, contents[0])
+        plain, packed, fallback_ok = run_gzip(pem, contents, args.uplink_mbps)
+
+    if warm >= cold:
+        failures.append("warming up did not make the first request faster")
+    if reconnects['keep-alive'] or not reconnects['no keep-alive']:
+        failures.append("keep-alive pings did not keep the connection open")
+    if pools[TRANSPORT_POOL_SIZE]['connections'] > TRANSPORT_POOL_SIZE:
+        failures.append("the sized pool opened more connections than it holds")
+    if packed >= plain:
+        failures.append("gzip did not shrink the request bodies")
+    if not fallback_ok:
+        failures.append("compression was not turned off for an endpoint that refuses it")
+    for failure in failures:
+        print(failure)
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
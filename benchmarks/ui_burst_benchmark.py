@@ -0,0 +1,153 @@
+"""
+Measure what a burst of screenshots costs the UI with the single result window.
+
+    python benchmarks/ui_burst_benchmark.py [--burst 50] [--size 2560x1440]
+
+Writes --burst synthetic screenshots and queues one OCR result per screenshot
+in the ResultWindow, the way OCRUI does when a burst of jobs finishes, then
+shows every item in turn. Reports the Tk-thread time per queued and per
+shown item (first vs last tenth of the burst, which should match), the time
+previews spend being prepared off the Tk thread, and how many resized
+previews and PhotoImages are retained at most. Without a DISPLAY only the
+background preview preparation and its retention bound are measured.
+Exits non-zero when more previews or PhotoImages are retained than
+configured, or when the last items cost more than twice the first ones.
+"""
+import argparse
+import os
+import queue
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+os.environ.setdefault('API_KEY', 'benchmark')
+os.environ.setdefault('WATCH_DIR', tempfile.gettempdir())
+
+from PIL import Image, ImageDraw
+from image_store import ImageStore
+from metrics import metrics
+from result_window import PreviewRenderer
+from text_layout import TextLayout
+from config import DECODE_MAX_SIDE, UI_MAX_PREVIEWS, UI_MAX_PHOTOS
+
+def write_screenshots(directory: str, count: int, size) -> list:
+    paths = []
+    for index in range(count):
+        image = Image.new('RGB', size, (255, 255, 255))
+        draw = ImageDraw.Draw(image)
+        for row in range(0, size[1], 40):
+            draw.text((20, row), f"screenshot {index} line {row // 40} " * 6, fill=(0, 0, 0))
+        path = os.path.join(directory, f"shot{index:04d}.png")
+        image.save(path)
+        paths.append(path)
+    return paths
+
+def fake_result(index: int) -> dict:
+    words = [[f"word{index}_{column}", 20 + 90 * column, 20 + 40 * row, 100 + 90 * column, 34 + 40 * row]
+             for row in range(30) for column in range(20)]
+    layout = TextLayout.from_words(words)
+    return {'text': layout.text(), 'layout': layout}
+
+def mean_ms(samples: list) -> float:
+    return 1000 * sum(samples) / len(samples) if samples else 0.0
+
+def run_headless(paths: list) -> int:
+    """Prepare every preview through a queue standing in for the Tk dispatcher."""
+    calls = queue.Queue()
+    store = ImageStore(DECODE_MAX_SIDE)
+    renderer = PreviewRenderer(store, lambda func, *args: calls.put((func, args)), UI_MAX_PREVIEWS, UI_MAX_PHOTOS)
+    ready = []
+    most = 0
+    start = time.perf_counter()
+    for path in paths:
+        renderer.request(path, ready.append)
+    while len(ready) < len(paths):
+        func, args = calls.get()
+        func(*args)
+        most = max(most, renderer.stats()['previews'])
+    elapsed = time.perf_counter() - start
+    renderer.stop()
+    print(f"previews prepared off the Tk thread: {len(ready)} in {elapsed:.2f}s "
+          f"({1000 * elapsed / len(paths):.1f} ms each), at most {most} retained (limit {UI_MAX_PREVIEWS}), "
+          f"{len(store)} decodes left open")
+    return most
+
+def run_tk(paths: list) -> tuple:
+    import tkinter as tk
+    from result_window import ResultWindow, TrayItem
+    from ui import TkDispatcher
+
+    root = tk.Tk()
+    root.withdraw()
+    dispatcher = TkDispatcher(root, 10)
+    store = ImageStore(DECODE_MAX_SIDE)
+    renderer = PreviewRenderer(store, dispatcher, UI_MAX_PREVIEWS, UI_MAX_PHOTOS)
+    window = ResultWindow(root, renderer, {'Google': 'https://www.google.com/search?q='},
+                          on_confirm=lambda path: None, on_cancel=lambda path: None,
+                          on_send=lambda preset, text: None, on_copy=lambda text: None, on_exit=root.quit)
+    most_photos = 0
+    add_times, show_times = [], []
+    for index, path in enumerate(paths):
+        # The job holds the shared decode while its result is queued, as in OCRUI
+        store.acquire(path)
+        result = fake_result(index)
+        start = time.perf_counter()
+        window.add(TrayItem(path, TrayItem.RESULT, result))
+        root.update()
+        add_times.append(time.perf_counter() - start)
+        store.release(path)
+
+    # Let the background previews arrive, then work through the tray like a user
+    deadline = time.monotonic() + 60
+    while renderer.stats()['preparing'] and time.monotonic() < deadline:
+        root.update()
+        time.sleep(0.01)
+    while len(window):
+        start = time.perf_counter()
+        window._act(None)
+        root.update()
+        show_times.append(time.perf_counter() - start)
+        most_photos = max(most_photos, renderer.stats()['photos'])
+    renderer.stop()
+    root.destroy()
+
+    tenth = max(1, len(paths) // 10)
+    print(f"queue a result: first {mean_ms(add_times[:tenth]):.1f} ms, last {mean_ms(add_times[-tenth:]):.1f} ms")
+    print(f"show next item: first {mean_ms(show_times[:tenth]):.1f} ms, last {mean_ms(show_times[-tenth:]):.1f} ms")
+    print(f"at most {most_photos} PhotoImages cached (limit {UI_MAX_PHOTOS}) plus the one on screen")
+    growth = max(mean_ms(add_times[-tenth:]) / max(mean_ms(add_times[:tenth]), 1e-3),
+                 mean_ms(show_times[-tenth:]) / max(mean_ms(show_times[:tenth]), 1e-3))
+    return most_photos, growth
+
+def main():
+    parser = argparse.ArgumentParser(description='Result window cost and memory bound under a burst.')
+    parser.add_argument('--burst', type=int, default=50)
+    parser.add_argument('--size', default='2560x1440')
+    args = parser.parse_args()
+    size = tuple(int(part) for part in args.size.split('x'))
+
+    failures = []
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_screenshots(directory, args.burst, size)
+        if run_headless(paths) > UI_MAX_PREVIEWS:
+            failures.append("more previews retained than UI_MAX_PREVIEWS")
+        if os.environ.get('DISPLAY'):
+            most_photos, growth = run_tk(paths)
+            if most_photos > UI_MAX_PHOTOS:
+                failures.append("more PhotoImages cached than UI_MAX_PHOTOS")
+            if growth > 2:
+                failures.append(f"per-item UI cost grew {growth:.1f}x over the burst")
+        else:
+            print("No DISPLAY, skipping the Tk part")
+
+    stages = metrics.snapshot()['stages']
+    for stage in ('decode', 'resize', 'preview', 'ui_render'):
+        if stage in stages:
+            print(f"{stage:<10} {stages[stage]['count']:>5} x p50 {stages[stage]['p50'] * 1000:.1f} ms")
+    for failure in failures:
+        print(failure)
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
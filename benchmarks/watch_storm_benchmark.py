@@ -0,0 +1,136 @@
+"""
+Dump a storm of screenshots into watched directories and report how the
+watcher's bounded intake copes with a slow consumer.
+
+    python benchmarks/watch_storm_benchmark.py [--files 2000] [--roots 2] [--overflow drop_oldest]
+
+Files are written (half of them with temp + rename) into nested folders under
+several roots watched recursively, a few with excluded names. The consumer
+takes --work seconds per file with at most --in-flight files open, like the
+UI's dialogs or the daemon's workers. Reports the watcher counters, the
+longest the observer thread was kept busy by one event, and the resident
+memory growth. Exits non-zero if any written file is neither handed on,
+dropped nor spilled.
+"""
+import argparse
+import io
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+os.environ.setdefault('API_KEY', 'benchmark')
+os.environ.setdefault('WATCH_DIR', tempfile.gettempdir())
+
+from PIL import Image
+from file_watcher import FileWatcher, ScreenshotHandler
+from intake import OVERFLOW_POLICIES
+
+def make_png(size=(64, 64)) -> bytes:
+    output = io.BytesIO()
+    Image.effect_noise(size, 64).convert('RGB').save(output, format='PNG')
+    return output.getvalue()
+
+def rss_kb() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def main():
+    parser = argparse.ArgumentParser(description='Watcher intake behaviour under a burst of new files.')
+    parser.add_argument('--files', type=int, default=2000)
+    parser.add_argument('--roots', type=int, default=2)
+    parser.add_argument('--queue-size', type=int, default=256)
+    parser.add_argument('--overflow', default='drop_oldest', choices=OVERFLOW_POLICIES)
+    parser.add_argument('--in-flight', type=int, default=8)
+    parser.add_argument('--work', type=float, default=0.002, help='consumer seconds per file')
+    parser.add_argument('--wait', type=float, default=30.0, help='seconds to wait for the storm to drain')
+    args = parser.parse_args()
+
+    # Time each watchdog callback to see how long the observer thread is blocked
+    longest = [0.0]
+    for name in ('on_created', 'on_modified', 'on_closed', 'on_moved'):
+        def timed(self, event, _handler=getattr(ScreenshotHandler, name)):
+            start = time.perf_counter()
+            _handler(self, event)
+            longest[0] = max(longest[0], time.perf_counter() - start)
+        setattr(ScreenshotHandler, name, timed)
+
+    data = make_png()
+    with tempfile.TemporaryDirectory() as base:
+        roots = [os.path.join(base, f"root{index}") for index in range(args.roots)]
+        for root in roots:
+            os.makedirs(os.path.join(root, 'nested', 'deeper'))
+        spill_path = os.path.join(base, 'spill.txt')
+
+        handed = []
+        lock = threading.Lock()
+
+        def consume(file_path: str):
+            def finish():
+                time.sleep(args.work)
+                with lock:
+                    handed.append(file_path)
+                watcher.done(file_path)
+            threading.Thread(target=finish, daemon=True).start()
+
+        watcher = FileWatcher(roots, consume, recursive=True, exclude=('*-ignore.*',),
+                              queue_size=args.queue_size, overflow=args.overflow,
+                              spill_path=spill_path, max_in_flight=args.in_flight)
+        if not watcher.start():
+            sys.exit("Could not start the watcher")
+        rss_before = rss_kb()
+
+        written, excluded = [], 0
+        start = time.perf_counter()
+        for index in range(args.files):
+            folder = os.path.join(roots[index % args.roots], ('', 'nested', os.path.join('nested', 'deeper'))[index % 3])
+            if index % 50 == 49:
+                with open(os.path.join(folder, f"shot{index}-ignore.png"), 'wb') as f:
+                    f.write(data)
+                excluded += 1
+                continue
+            path = os.path.join(folder, f"shot{index}.png")
+            if index % 2:
+                with open(path + '.tmp', 'wb') as f:
+                    f.write(data)
+                os.replace(path + '.tmp', path)
+            else:
+                with open(path, 'wb') as f:
+                    f.write(data)
+            written.append(path)
+        write_seconds = time.perf_counter() - start
+
+        deadline = time.monotonic() + args.wait
+        while time.monotonic() < deadline:
+            stats = watcher.stats()
+            if stats['waiting'] == 0 and stats['in_flight'] == 0 and \
+                    stats['queued'] + stats['spilled'] >= len(written):
+                break
+            time.sleep(0.05)
+        time.sleep(0.2)
+        drain_seconds = time.perf_counter() - start
+        watcher.stop()
+        stats = watcher.stats()
+        rss_after = rss_kb()
+        spilled = open(spill_path).read().split() if os.path.exists(spill_path) else []
+
+    with lock:
+        handed_set = set(handed)
+    accounted = len(handed_set) + stats['dropped'] + len(spilled)
+    print(f"{len(written)} files written in {write_seconds:.2f}s ({excluded} excluded names), "
+          f"drained after {drain_seconds:.2f}s")
+    for name in ('events', 'coalesced', 'excluded', 'queued', 'dropped', 'spilled', 'waiting', 'in_flight'):
+        print(f"  {name:<10} {stats.get(name, 0):>7}")
+    print(f"  handed on  {len(handed_set):>7} (duplicates {len(handed) - len(handed_set)})")
+    print(f"longest observer callback {longest[0] * 1000:.2f} ms")
+    print(f"max RSS growth {rss_after - rss_before} KB")
+
+    missing = len(written) - accounted
+    if missing > 0 or len(handed) != len(handed_set):
+        print(f"{missing} files lost, {len(handed) - len(handed_set)} handed on twice")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Headless bulk OCR over existing screenshots.
+
+    python src/batch.py [DIRECTORY] [--output results.jsonl] [--workers 8] [--no-recursive]
+    python src/batch.py --files-from spill.txt
+
+--files-from reads one path per line instead of scanning a directory, e.g.
+the spill file the watcher writes when WATCH_OVERFLOW=spill.
+
+Results are appended to the output file as one JSON object per line. Files
+already recorded there with status "ok" are skipped, so an interrupted run
+can be resumed by starting it again with the same output file.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Iterable, Iterator, List, Optional, Set
+from file_watcher import is_supported_file
+from services import build_ocr_backend
+from history import HistoryIndex
+from metrics import metrics
+from request_scheduler import BATCH, lane
+from config import load_config, OCR_WORKERS, METRICS_FILE, HISTORY_ENABLED, HISTORY_DB
+
+def find_screenshots(directory: str, recursive: bool = True) -> Iterator[str]:
+    """Yield supported image files under directory in a stable order."""
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if is_supported_file(name):
+                yield os.path.abspath(os.path.join(root, name))
+        if not recursive:
+            break
+
+def read_file_list(list_path: str) -> List[str]:
+    """Return the supported image paths listed one per line, first occurrence only."""
+    seen = {}
+    with open(list_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            path = line.strip()
+            if path and is_supported_file(path):
+                seen.setdefault(os.path.abspath(path), None)
+    return list(seen)
+
+def load_processed(output_path: str) -> Set[str]:
+    """Return the paths already processed successfully in an earlier run."""
+    processed = set()
+    if not os.path.exists(output_path):
+        return processed
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line cut short by an interrupted run
+                continue
+            if not isinstance(record, dict) or not isinstance(record.get('path'), str):
+                # Not a record this tool wrote
+                continue
+            if record.get('status') == 'ok':
+                processed.add(record['path'])
+    return processed
+
+class Progress:
+    """Print throughput and ETA to stderr at most once per interval."""
+
+    def __init__(self, total: int, interval: float = 1.0):
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.failed = 0
+        self.started = time.monotonic()
+        self._last_report = 0.0
+
+    def update(self, ok: bool, force: bool = False):
+        self.done += 1
+        if not ok:
+            self.failed += 1
+        now = time.monotonic()
+        if not force and now - self._last_report < self.interval and self.done < self.total:
+            return
+        self._last_report = now
+        elapsed = max(now - self.started, 1e-9)
+        rate = self.done / elapsed
+        eta = (self.total - self.done) / rate if rate else 0
+        sys.stderr.write(f"\r{self.done}/{self.total} done, {self.failed} failed, "
+                         f"{rate:.1f} img/s, ETA {int(eta // 60)}m{int(eta % 60):02d}s ")
+        sys.stderr.flush()
+
+def run_batch(directory: str, output_path: str, workers: int, recursive: bool,
+              history: Optional[HistoryIndex] = None, files: Optional[Iterable[str]] = None,
+              skip_indexed: bool = False) -> int:
+    """OCR every screenshot under directory (or in files) not in output_path yet; returns the number of failures.
+
+    With a history index, results are also indexed; with skip_indexed, files
+    it already has are skipped too (for filling the index, not an output file).
+    """
+    config = load_config()
+    processed = load_processed(output_path)
+    if skip_indexed and history is not None:
+        processed |= history.indexed_paths()
+    candidates = find_screenshots(directory, recursive) if files is None else files
+    pending = [path for path in candidates if path not in processed]
+    print(f"{len(processed)} already processed, {len(pending)} to go", file=sys.stderr)
+    if not pending:
+        return 0
+
+    backend = build_ocr_backend(config['api_key'], history=history)
+    progress = Progress(len(pending))
+    write_lock = threading.Lock()
+
+    def process(file_path: str):
+        start = time.monotonic()
+        try:
+            # Bulk work yields to interactive screenshots sharing the API limits
+            with lane(BATCH):
+                result = backend.perform_ocr(file_path)
+        except Exception as e:
+            print(f"OCR failed for {file_path}: {e}", file=sys.stderr)
+            result = None
+        record = {
+            'path': file_path,
+            'status': 'ok' if result else 'failed',
+            'text': result['text'] if result else None,
+            'backend': (result or {}).get('backend', backend.name),
+            'seconds': round(time.monotonic() - start, 3)
+        }
+        with write_lock:
+            output.write(json.dumps(record, ensure_ascii=False) + '\n')
+            output.flush()
+            progress.update(result is not None)
+
+    with open(output_path, 'a', encoding='utf-8') as output, ThreadPoolExecutor(workers) as executor:
+        # Keep a bounded number of jobs in flight instead of queueing every file up front
+        in_flight = set()
+        for file_path in pending:
+            if len(in_flight) >= workers * 2:
+                _, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            in_flight.add(executor.submit(process, file_path))
+        wait(in_flight)
+
+    sys.stderr.write('\n')
+    return progress.failed
+
+def main():
+    parser = argparse.ArgumentParser(description='OCR existing screenshots in bulk without a display.')
+    parser.add_argument('directory', nargs='?', help='directory to scan (default: WATCH_DIR)')
+    parser.add_argument('--output', default='ocr_results.jsonl', help='JSONL file to append results to')
+    parser.add_argument('--workers', type=int, default=OCR_WORKERS, help='concurrent OCR jobs')
+    parser.add_argument('--no-recursive', action='store_true', help='only scan the top-level directory')
+    parser.add_argument('--files-from', metavar='FILE', help='OCR the paths listed in FILE instead of scanning')
+    parser.add_argument('--metrics', default=METRICS_FILE,
+                        help='write per-stage timings here when done (*.prom for Prometheus text, else JSON)')
+    args = parser.parse_args()
+
+    directory = args.directory or load_config()['watch_dir']
+    files = None
+    if args.files_from:
+        files = [path for path in read_file_list(args.files_from) if os.path.isfile(path)]
+    history = HistoryIndex(HISTORY_DB) if HISTORY_ENABLED else None
+    failures = run_batch(directory, args.output, max(1, args.workers), not args.no_recursive, history, files)
+    if args.metrics:
+        metrics.write_snapshot(args.metrics)
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
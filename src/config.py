@@ -1,52 +1,178 @@
 import os
-from typing import Dict
-from dotenv import load_dotenv
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Mapping, Optional
 
-# Load environment variables
-load_dotenv()
+# Importing this module has no side effects: .env is read once without touching
+# os.environ, nothing is printed, and missing settings are only reported by
+# load_config().
 
-# Debug: Print current working directory and check if .env exists
-current_dir = os.getcwd()
-env_path = os.path.join(current_dir, '.env')
+def _find_dotenv() -> Optional[str]:
+    """Look for .env next to this file and its parents, then in the working directory."""
+    directory = os.path.dirname(os.path.abspath(__file__))
+    while True:
+        candidate = os.path.join(directory, '.env')
+        if os.path.isfile(candidate):
+            return candidate
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            break
+        directory = parent
+    candidate = os.path.join(os.getcwd(), '.env')
+    return candidate if os.path.isfile(candidate) else None
 
-# API Configuration
-API_KEY = os.getenv('API_KEY')
-print(f"API_KEY found: {'Yes' if API_KEY else 'No'}")
+@lru_cache(maxsize=None)
+def environment() -> Mapping[str, str]:
+    """Variables from .env overlaid by the process environment, read once."""
+    values = {}
+    dotenv_path = _find_dotenv()
+    if dotenv_path:
+        # Only pay for importing python-dotenv when there is a file to parse
+        from dotenv import dotenv_values
+        values.update({key: value for key, value in dotenv_values(dotenv_path).items() if value is not None})
+    values.update(os.environ)
+    return MappingProxyType(values)
 
-if not API_KEY:
-    raise ValueError("API_KEY environment variable is not set")
-
-# Screenshot Directory Configuration
-WATCH_DIR = os.getenv('WATCH_DIR')
-if not WATCH_DIR:
-    raise ValueError("WATCH_DIR environment variable is not set")
-print(f"WATCH_DIR found: {WATCH_DIR}")
+def _env(name: str, default: Optional[str] = None) -> Optional[str]:
+    return environment().get(name, default)
 
 # Image Processing Configuration
 MAX_IMAGE_SIZE = 1024  # Maximum dimension for image compression
 IMAGE_QUALITY = 85  # JPEG quality for compressed images
+ADAPTIVE_ENCODING = _env('OCR_ADAPTIVE_ENCODING', '1') != '0'  # Pick format/size per image
+ENCODE_MAX_SIDE = 2048  # Longest side sent for screenshots dense with small text
+ENCODE_WEBP = _env('OCR_ENCODE_WEBP', '0') != '0'  # Use WebP instead of JPEG for photo-like images
+PREPROCESS_WORKERS = int(_env('OCR_PREPROCESS_WORKERS', '0'))  # Processes that decode and encode uploads, 0 for none
+PREPROCESS_PRELOAD = _env('OCR_PREPROCESS_PRELOAD', '1') != '0'  # Start them at launch instead of on first use
+DECODE_MAX_SIDE = max(ENCODE_MAX_SIDE if ADAPTIVE_ENCODING else MAX_IMAGE_SIZE, 800)  # Largest side needed by upload and preview
 
 # UI Configuration
 DEFAULT_WINDOW_SIZE = (800, 600)
 
 # OCR Configuration
 MAX_RETRIES = 3
-RETRY_DELAY = 1  # seconds
+RETRY_DELAY = 1  # seconds, base of the exponential backoff
+RETRY_MAX_DELAY = 10  # seconds, cap of a single backoff
 TIMEOUT = 30  # seconds for API requests
+VISION_ENDPOINT = _env('OCR_VISION_ENDPOINT', 'https://vision.googleapis.com/v1/images:annotate')  # Override to use a proxy or local fake
+HEDGE_ENABLED = _env('OCR_HEDGE', '1') != '0'  # Send a second copy of requests slower than p95
+HEDGE_MIN_SAMPLES = 20  # Latency samples needed before hedging starts
+HEDGE_MIN_DELAY = 0.5  # seconds, never hedge earlier than this
+HEDGE_MAX_RATIO = 0.1  # At most this share of requests is hedged (hedges cost API units)
+CIRCUIT_FAILURE_THRESHOLD = 5  # Consecutive failed requests before failing fast
+CIRCUIT_RESET_TIMEOUT = 30  # seconds before a trial request is let through
+OCR_FEATURE = "TEXT_DETECTION"  # Use only TEXT_DETECTION (free feature)
+LANGUAGE_HINTS = ["en"]
 
-def load_config() -> Dict:
-    """Load configuration from environment variables and return as a dictionary."""
-    # Load environment variables from .env file
-    load_dotenv()
-    
+# Rate Limit Configuration (a unit is one image sent for TEXT_DETECTION)
+RATE_PER_SECOND = float(_env('OCR_RATE_PER_SECOND', '10'))  # Units sent per second, 0 for no limit
+RATE_PER_MINUTE = float(_env('OCR_RATE_PER_MINUTE', '600'))  # Units sent per minute, 0 for no limit
+QUOTA_MONTHLY_UNITS = int(_env('OCR_MONTHLY_UNITS', '0'))  # Refuse requests past this many units a month, 0 for no cap
+QUOTA_LEDGER = _env('OCR_UNIT_LEDGER', os.path.join(os.path.expanduser('~'), '.local', 'share', 'auto-screenshot-ocr', 'units.json'))
+
+# OCR Backend Configuration
+OCR_MODE = _env('OCR_MODE', 'cloud')  # cloud, local, race or local_first
+TESSERACT_CMD = _env('TESSERACT_CMD', 'tesseract')
+TESSERACT_LANG = _env('TESSERACT_LANG', 'eng')
+LOCAL_MAX_PIXELS = 1920 * 1080  # Larger images go straight to the cloud in local_first mode
+LOCAL_MIN_CONFIDENCE = 70  # Mean word confidence (0-100) needed to keep a local result
+
+# File Readiness Configuration
+READY_SETTLE_TIME = float(_env('READY_SETTLE_TIME', '0.03'))  # seconds without writes before a file is checked
+READY_TIMEOUT = float(_env('READY_TIMEOUT', '15'))  # seconds before giving up on an incomplete file
+
+# Worker Configuration
+OCR_WORKERS = int(_env('OCR_WORKERS', '4'))  # Concurrent OCR jobs
+OCR_QUEUE_SIZE = 64  # Pending OCR jobs before new ones are rejected
+UI_POLL_INTERVAL = 50  # ms between checks for finished jobs on the Tk main loop
+UI_MAX_PREVIEWS = int(_env('OCR_MAX_PREVIEWS', '8'))  # Downscaled previews kept for screenshots waiting in the result window
+UI_MAX_PHOTOS = int(_env('OCR_MAX_PHOTOS', '2'))  # Tk PhotoImages kept besides the one on screen
+UI_MAX_RESULTS = int(_env('OCR_MAX_RESULTS', '50'))  # Results waiting in the tray; the oldest is dismissed beyond this
+SPECULATIVE_OCR = _env('OCR_SPECULATIVE', '0') != '0'  # OCR screenshots while their confirmation is pending
+
+# Memory Configuration
+MEMORY_TRACE_FRAMES = int(_env('OCR_TRACEMALLOC', '0'))  # Trace allocations from launch with this many frames, 0 for on demand
+MEMORY_REPORT_FILE = _env('OCR_MEMORY_REPORT', os.path.join(os.path.expanduser('~'), '.local', 'share', 'auto-screenshot-ocr', 'memory.json'))
+
+# Watch Configuration
+WATCH_RECURSIVE = _env('WATCH_RECURSIVE', '0') != '0'  # Also watch the subdirectories of every root
+WATCH_INCLUDE = tuple(glob.strip() for glob in _env('WATCH_INCLUDE', '').split(',') if glob.strip())  # Globs a file must match
+WATCH_EXCLUDE = tuple(glob.strip() for glob in _env('WATCH_EXCLUDE', '').split(',') if glob.strip())  # Globs of files to ignore
+WATCH_QUEUE_SIZE = int(_env('WATCH_QUEUE_SIZE', '256'))  # Ready files waiting to be handed on
+WATCH_OVERFLOW = _env('WATCH_OVERFLOW', 'drop_oldest')  # drop_oldest, newest_only or spill when the queue is full
+WATCH_SPILL_FILE = _env('WATCH_SPILL_FILE', os.path.join(os.path.expanduser('~'), '.local', 'share', 'auto-screenshot-ocr', 'spill.txt'))
+WATCH_MAX_IN_FLIGHT = int(_env('WATCH_MAX_IN_FLIGHT', str(2 * OCR_WORKERS)))  # Files handed on and not finished yet
+
+# Daemon Configuration
+DAEMON_HOST = '127.0.0.1'  # Only listen locally
+DAEMON_PORT = int(_env('OCR_DAEMON_PORT', '8765'))
+DAEMON_SOCKET = _env('OCR_DAEMON_SOCKET')  # Unix socket path, replaces the TCP port when set
+DAEMON_TOKEN = _env('OCR_DAEMON_TOKEN')  # Bearer token the TCP API requires; generated into DAEMON_TOKEN_FILE when unset
+DAEMON_TOKEN_FILE = _env('OCR_DAEMON_TOKEN_FILE', os.path.join(os.path.expanduser('~'), '.local', 'share', 'auto-screenshot-ocr', 'daemon-token'))
+DAEMON_MAX_BODY = int(_env('OCR_DAEMON_MAX_BODY', str(50 * 1024 * 1024)))  # Largest POST body accepted, in bytes
+
+# History Configuration
+HISTORY_ENABLED = _env('OCR_HISTORY', '1') != '0'  # Keep every result in a searchable index
+HISTORY_DB = _env('OCR_HISTORY_DB', os.path.join(os.path.expanduser('~'), '.local', 'share', 'auto-screenshot-ocr', 'history.db'))
+HISTORY_SEARCH_LIMIT = 50  # Results listed in the search window
+
+# Journal Configuration
+JOURNAL_ENABLED = _env('OCR_JOURNAL', '1') != '0'  # Log every job so a restart resumes unfinished ones
+JOURNAL_PATH = _env('OCR_JOURNAL_PATH', os.path.join(os.path.expanduser('~'), '.local', 'share', 'auto-screenshot-ocr', 'journal.jsonl'))
+JOURNAL_FSYNC = _env('OCR_JOURNAL_FSYNC', '0') != '0'  # fsync every record to survive power loss, not just crashes
+JOURNAL_COMPACT_EVERY = 1000  # Records appended between rewrites of the journal
+JOURNAL_MARGIN = 2 * READY_TIMEOUT  # seconds of finished jobs kept on compaction, for files still being written
+
+# Metrics Configuration
+METRICS_LOG = _env('OCR_METRICS_LOG')  # Append a JSON line per timed stage to this file, '-' for stderr
+METRICS_FILE = _env('OCR_METRICS_FILE')  # Write a metrics snapshot here on exit (*.prom for Prometheus text)
+
+# Batch Configuration
+BATCH_ENABLED = _env('OCR_BATCH', '1') != '0'
+BATCH_MAX_IMAGES = 16  # Vision API accepts at most 16 images per request
+BATCH_MAX_BYTES = 8 * 1024 * 1024  # base64 payload per request, API limit is 10 MB
+BATCH_MAX_WAIT = 0.05  # seconds to wait for more images before sending
+
+# Near-Duplicate Configuration
+DEDUP_ENABLED = _env('OCR_DEDUP', '1') != '0'  # Re-OCR only the changed regions of near-duplicate screenshots
+DEDUP_RECENT = 64  # Recent screenshots kept for matching
+DEDUP_MAX_DISTANCE = 10  # Max differing dHash bits (of 64) to consider two screenshots near-duplicates
+DEDUP_DIFF_SIDE = 1024  # Longest side of the brightness and colour copy kept for region diffs
+DEDUP_TILE = 16  # px tiles of that copy compared when diffing
+DEDUP_MAX_CHANGED = 0.4  # Changed share of the image above which a full OCR is cheaper
+
+# Tiling Configuration
+TILING_ENABLED = _env('OCR_TILING', '1') != '0'  # OCR very large screenshots as overlapping full-resolution tiles
+TILE_MIN_SIDE = int(_env('OCR_TILE_MIN_SIDE', '3000'))  # Screenshots with a longer side than this are tiled
+TILE_SIDE = 1536  # Tile size in original pixels, uploaded without downscaling small text
+TILE_OVERLAP = 256  # px shared by neighbouring tiles, longer than a word so each is whole in one tile
+TILE_WORKERS = 8  # Tile requests in flight at once
+
+# Transport Configuration
+# Requests in flight at once: worker jobs or tiles, each possibly with a hedged copy
+TRANSPORT_POOL_SIZE = int(_env('OCR_POOL_SIZE', str(2 * max(OCR_WORKERS, TILE_WORKERS))))
+TRANSPORT_WARM_CONNECTIONS = int(_env('OCR_WARM_CONNECTIONS', '2'))  # Connections opened at startup, 0 to not warm up
+TRANSPORT_KEEPALIVE = float(_env('OCR_KEEPALIVE', '60'))  # seconds idle before a connection is pinged, 0 to not ping
+TRANSPORT_GZIP = _env('OCR_GZIP', '1') != '0'  # gzip request bodies when that makes them smaller
+TRANSPORT_GZIP_MIN_BYTES = 16 * 1024  # Smaller bodies are sent as they are
+
+# Cache Configuration
+CACHE_ENABLED = _env('OCR_CACHE', '1') != '0'
+CACHE_DIR = _env('OCR_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'auto-screenshot-ocr'))
+CACHE_MAX_BYTES = 50 * 1024 * 1024  # Total size of cached results on disk
+CACHE_MAX_AGE = 30 * 24 * 3600  # seconds since last access
+
+@lru_cache(maxsize=None)
+def load_config() -> Mapping:
+    """Return the application configuration, validated once and cached."""
     # Get API key from environment
-    api_key = os.getenv('API_KEY')
+    api_key = _env('API_KEY')
     if not api_key:
         raise ValueError("API_KEY not found in environment variables")
     
-    # Get watch directory from environment
-    watch_dir = os.getenv('WATCH_DIR')
-    if not watch_dir:
+    # Get watch directories from environment, several separated by os.pathsep
+    watch_dirs = tuple(path for path in (_env('WATCH_DIR') or '').split(os.pathsep) if path)
+    if not watch_dirs:
         raise ValueError("WATCH_DIR not found in environment variables")
     
     # Web presets configuration
@@ -56,8 +182,9 @@ def load_config() -> Dict:
         "Google Translate": "https://translate.google.com/?text="
     }
     
-    return {
+    return MappingProxyType({
         'api_key': api_key,
-        'watch_dir': watch_dir,
-        'web_presets': web_presets
-    } 
\ No newline at end of file
+        'watch_dir': watch_dirs[0],
+        'watch_dirs': watch_dirs,
+        'web_presets': MappingProxyType(web_presets)
+    })
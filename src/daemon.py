@@ -0,0 +1,447 @@
+"""
+Headless OCR daemon: watches WATCH_DIR and serves OCR over a local HTTP API.
+
+    python src/daemon.py [--host 127.0.0.1] [--port 8765] [--socket /path/to/ocr.sock] [--journal PATH]
+
+Endpoints:
+    POST /ocr      {"path": "..."} or raw image bytes (Content-Type: image/*)
+                   -> {"status": "ok", "text": ...}
+                   ?priority=batch queues the API request behind interactive ones
+    GET  /events   newline-delimited JSON stream of results for new screenshots
+    GET  /stats    worker pool and OCR service counters
+    GET  /search?q=...&limit=20&offset=0   ranked full-text search of the OCR history
+    GET  /metrics  per-stage timing histograms and counters as Prometheus text
+                   (?format=json for a JSON snapshot)
+    GET  /memory   resident size, OCR job allocation peaks and live image counts
+                   (?snapshot=1 for the top allocation sites and their growth
+                   since the last snapshot; the first one starts tracing)
+    GET  /health   liveness check
+
+On TCP every endpoint but /health needs an "Authorization: Bearer <token>"
+header with OCR_DAEMON_TOKEN, or the token generated into OCR_DAEMON_TOKEN_FILE
+(readable only by the owner) when that is unset, and a Host header naming
+the loopback address, so neither other local users nor web pages (through DNS
+rebinding) can use it. The Unix socket is only accessible to its owner and
+needs neither. Paths given to POST /ocr must be inside a watched directory.
+
+Nothing here imports tkinter, so it runs on display-less servers.
+"""
+import argparse
+import hmac
+import json
+import os
+import queue
+import secrets
+import signal
+import socketserver
+import tempfile
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional, Sequence, Union
+from file_watcher import FileWatcher
+from ocr_worker import OCRWorkerPool
+from services import build_ocr_backend
+from metrics import metrics
+from memory import memory
+from history import HistoryIndex, unrecorded
+from request_scheduler import LANES, INTERACTIVE, lane
+from journal import JobJournal, OCR_DONE, DELIVERED
+from config import (load_config, OCR_WORKERS, OCR_QUEUE_SIZE, DAEMON_HOST, DAEMON_PORT, DAEMON_SOCKET,
+                    DAEMON_TOKEN, DAEMON_TOKEN_FILE, DAEMON_MAX_BODY,
+                    METRICS_FILE, HISTORY_ENABLED, HISTORY_DB, WATCH_MAX_IN_FLIGHT, JOURNAL_ENABLED, JOURNAL_PATH,
+                    JOURNAL_FSYNC, JOURNAL_COMPACT_EVERY, JOURNAL_MARGIN, MEMORY_TRACE_FRAMES, MEMORY_REPORT_FILE)
+
+# Host header values a browser sends for the loopback address; anything else is a rebound DNS name
+LOOPBACK_HOSTS = {'localhost', '127.0.0.1', '::1'}
+
+def load_token(path: str) -> str:
+    """Read the API token from path, or generate one there readable only by the owner."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            token = f.read().strip()
+        if token:
+            return token
+    except FileNotFoundError:
+        pass
+    token = secrets.token_urlsafe(32)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(token + '\n')
+    return token
+
+def remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except OSError as e:
+        print(f"Error removing {path}: {e}")
+
+class ResultBroker:
+    """Fan results out to streaming subscribers without letting a slow one block the rest."""
+
+    def __init__(self, max_backlog: int = 100):
+        self.max_backlog = max_backlog
+        self.dropped = 0
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self) -> queue.Queue:
+        subscriber = queue.Queue(maxsize=self.max_backlog)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: queue.Queue):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, event: Dict):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(event)
+            except queue.Full:
+                self.dropped += 1
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+class OCRDaemon:
+    """FileWatcher + OCR backend + worker pool, publishing results to a broker."""
+
+    def __init__(self, watch_dir: Union[str, Sequence[str]], api_key: str, workers: int = OCR_WORKERS,
+                 history: Optional[HistoryIndex] = None, journal: Optional[JobJournal] = None):
+        self.watch_dir = watch_dir
+        self.history = history
+        self.journal = journal
+        self.backend = build_ocr_backend(api_key, history=history)
+        self.broker = ResultBroker()
+        # Results are delivered straight on the worker thread; there is no UI loop
+        self.worker_pool = OCRWorkerPool(self.backend, workers, OCR_QUEUE_SIZE,
+                                         lambda func, *args: func(*args))
+        # A burst of new files waits in the watcher's bounded queue, not in the worker pool's
+        self.file_watcher = FileWatcher(watch_dir, self._on_new_screenshot, max_in_flight=WATCH_MAX_IN_FLIGHT,
+                                        journal=journal)
+        self.started_at = time.time()
+
+    def start(self) -> bool:
+        return self.file_watcher.start()
+
+    def stop(self):
+        self.file_watcher.stop()
+        self.worker_pool.stop()
+
+    def _on_new_screenshot(self, file_path: str):
+        queued_at = time.monotonic()
+
+        def on_done(path: str, result: Optional[Dict[str, str]]):
+            self.file_watcher.done(path)
+            if self.journal is not None:
+                self.journal.record(path, OCR_DONE)
+            self.broker.publish(self._event(path, result, time.monotonic() - queued_at))
+            if self.journal is not None:
+                self.journal.record(path, DELIVERED)
+
+        if not self.worker_pool.submit(file_path, on_done):
+            self.file_watcher.done(file_path)
+
+    def _event(self, file_path: str, result: Optional[Dict[str, str]], seconds: float) -> Dict:
+        return {
+            'path': file_path,
+            'status': 'ok' if result else 'failed',
+            'text': result['text'] if result else None,
+            'backend': (result or {}).get('backend', self.backend.name),
+            'timestamp': time.time(),
+            'seconds': round(seconds, 3)
+        }
+
+    def is_watched(self, file_path: str) -> bool:
+        """Whether file_path, symlinks resolved, is inside one of the watched directories."""
+        real_path = os.path.realpath(file_path)
+        for root in self.file_watcher.watch_dirs:
+            real_root = os.path.realpath(root)
+            if os.path.commonpath([real_root, real_path]) == real_root:
+                return True
+        return False
+
+    def ocr_file(self, file_path: str, timeout: float,
+                 on_finished: Optional[Callable[[], None]] = None) -> Optional[Dict]:
+        """OCR one file through the worker pool and wait for the result.
+
+        on_finished is called once the job is over, which may be after the
+        wait timed out, or right away if the queue is full.
+        """
+        done = threading.Event()
+        holder = {}
+        start = time.monotonic()
+
+        def on_done(path: str, result: Optional[Dict[str, str]]):
+            holder['event'] = self._event(path, result, time.monotonic() - start)
+            done.set()
+            if on_finished:
+                on_finished()
+
+        if not self.worker_pool.submit(file_path, on_done):
+            if on_finished:
+                on_finished()
+            return None
+        if not done.wait(timeout):
+            return {'path': file_path, 'status': 'timeout'}
+        return holder['event']
+
+    def stats(self) -> Dict:
+        stats = {
+            'uptime': round(time.time() - self.started_at, 1),
+            'watch_dirs': self.file_watcher.watch_dirs,
+            'subscribers': len(self.broker),
+            'events_dropped': self.broker.dropped,
+            'watch': self.file_watcher.stats(),
+            'workers': self.worker_pool.stats(),
+            'memory': memory.stats()
+        }
+        if self.journal is not None:
+            stats['journal'] = self.journal.stats()
+        service = getattr(self.backend, 'ocr_service', self.backend)
+        if hasattr(service, 'stats'):
+            stats['service'] = service.stats()
+        return stats
+
+class DaemonRequestHandler(BaseHTTPRequestHandler):
+    server_version = "OCRDaemon/1.0"
+
+    @property
+    def ocr_daemon(self) -> OCRDaemon:
+        return self.server.ocr_daemon
+
+    def _authorized(self) -> bool:
+        """Check the Host header and the token on TCP; answers the request itself when they are wrong."""
+        allowed_hosts = self.server.allowed_hosts
+        if allowed_hosts is not None:
+            host = urllib.parse.urlsplit('//' + self.headers.get('Host', '')).hostname
+            if host not in allowed_hosts:
+                self._send_json(403, {'error': 'unexpected Host header'})
+                return False
+        token = self.server.token
+        if token is not None and self.path != '/health':
+            scheme, _, given = self.headers.get('Authorization', '').partition(' ')
+            if scheme.lower() != 'bearer' or not hmac.compare_digest(given.strip().encode(), token.encode()):
+                self._send_json(401, {'error': 'missing or wrong token'})
+                return False
+        return True
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        url = urllib.parse.urlsplit(self.path)
+        if self.path == '/health':
+            self._send_json(200, {'status': 'ok'})
+        elif self.path == '/stats':
+            self._send_json(200, self.ocr_daemon.stats())
+        elif self.path == '/events':
+            self._stream_events()
+        elif url.path == '/search':
+            self._search(urllib.parse.parse_qs(url.query))
+        elif url.path == '/memory':
+            snapshot = urllib.parse.parse_qs(url.query).get('snapshot') == ['1']
+            self._send_json(200, memory.report(snapshot))
+        elif url.path == '/metrics':
+            if urllib.parse.parse_qs(url.query).get('format') == ['json']:
+                self._send_json(200, metrics.snapshot())
+            else:
+                self._send_text(200, metrics.to_prometheus(), 'text/plain; version=0.0.4')
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        url = urllib.parse.urlsplit(self.path)
+        if url.path != '/ocr':
+            self._send_json(404, {'error': 'not found'})
+            return
+        priority = urllib.parse.parse_qs(url.query).get('priority', [INTERACTIVE])[0]
+        if priority not in LANES:
+            self._send_json(400, {'error': f'priority must be one of {", ".join(LANES)}'})
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            length = -1
+        if length < 0:
+            self._send_json(400, {'error': 'bad Content-Length'})
+            return
+        if length > self.server.max_body:
+            # The body is left unread, so the connection cannot be reused
+            self.close_connection = True
+            self._send_json(413, {'error': f'body larger than {self.server.max_body} bytes'})
+            return
+        body = self.rfile.read(length)
+        content_type = self.headers.get('Content-Type', '')
+        if content_type.startswith('image/'):
+            suffix = '.' + content_type.split('/', 1)[1].split(';')[0].replace('jpeg', 'jpg')
+            fd, temp_path = tempfile.mkstemp(suffix=suffix)
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(body)
+            except OSError:
+                os.remove(temp_path)
+                raise
+            # The upload is not kept, so it stays out of the history; it is removed once
+            # the job is over, which may be after this request has timed out
+            with lane(priority), unrecorded():
+                event = self.ocr_daemon.ocr_file(temp_path, self.server.request_timeout,
+                                                 lambda: remove_quietly(temp_path))
+            if event is not None:
+                event['path'] = None
+        else:
+            try:
+                file_path = json.loads(body)['path']
+            except (ValueError, KeyError, TypeError):
+                self._send_json(400, {'error': 'expected {"path": ...} or an image body'})
+                return
+            if not isinstance(file_path, str) or not self.ocr_daemon.is_watched(file_path):
+                self._send_json(403, {'error': 'path is not in a watched directory'})
+                return
+            if not os.path.isfile(file_path):
+                self._send_json(404, {'error': f'no such file: {file_path}'})
+                return
+            with lane(priority):
+                event = self.ocr_daemon.ocr_file(file_path, self.server.request_timeout)
+
+        if event is None:
+            self._send_json(503, {'error': 'OCR queue is full'})
+        else:
+            self._send_json(200, event)
+
+    def _search(self, query: Dict):
+        if self.ocr_daemon.history is None:
+            self._send_json(404, {'error': 'history is disabled'})
+            return
+        try:
+            limit = int(query.get('limit', ['20'])[0])
+            offset = int(query.get('offset', ['0'])[0])
+        except ValueError:
+            self._send_json(400, {'error': 'limit and offset must be numbers'})
+            return
+        hits = self.ocr_daemon.history.search(query.get('q', [''])[0], limit, max(0, offset))
+        self._send_json(200, {'results': [hit._asdict() for hit in hits]})
+
+    def _stream_events(self):
+        subscriber = self.ocr_daemon.broker.subscribe()
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-ndjson')
+            self.send_header('Cache-Control', 'no-cache')
+            self.end_headers()
+            self.wfile.flush()
+            while True:
+                try:
+                    event = subscriber.get(timeout=15)
+                    line = json.dumps(event, ensure_ascii=False) + '\n'
+                except queue.Empty:
+                    # Blank keep-alive line so dead clients are noticed
+                    line = '\n'
+                self.wfile.write(line.encode('utf-8'))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            self.ocr_daemon.broker.unsubscribe(subscriber)
+
+    def _send_json(self, status: int, payload: Dict):
+        self._send_text(status, json.dumps(payload, ensure_ascii=False), 'application/json')
+
+    def _send_text(self, status: int, text: str, content_type: str):
+        data = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self) -> str:
+        # Unix socket peers have no address tuple
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        pass
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def create_server(ocr_daemon: OCRDaemon, host: str, port: int, socket_path: Optional[str],
+                  request_timeout: float = 60.0, token: Optional[str] = None, max_body: int = DAEMON_MAX_BODY):
+    """Create the HTTP server on a Unix socket if socket_path is given, else on host:port.
+
+    On TCP, requests need token; the Host header is checked when host is a
+    loopback address (elsewhere clients may name the machine any way).
+    """
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        # Created owner-only: a chmod after bind would leave a window in which anyone may connect
+        umask = os.umask(0o177)
+        try:
+            server = UnixHTTPServer(socket_path, DaemonRequestHandler)
+        finally:
+            os.umask(umask)
+        server.token = server.allowed_hosts = None
+    else:
+        if not token:
+            raise ValueError("the TCP API needs a token")
+        server = ThreadingHTTPServer((host, port), DaemonRequestHandler)
+        server.token = token
+        server.allowed_hosts = LOOPBACK_HOSTS | {host} if host in LOOPBACK_HOSTS else None
+    server.ocr_daemon = ocr_daemon
+    server.request_timeout = request_timeout
+    server.max_body = max_body
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description='Headless OCR daemon with a local HTTP API.')
+    parser.add_argument('--host', default=DAEMON_HOST)
+    parser.add_argument('--port', type=int, default=DAEMON_PORT)
+    parser.add_argument('--socket', default=DAEMON_SOCKET, help='serve on this Unix socket instead of TCP')
+    parser.add_argument('--journal', default=os.path.splitext(JOURNAL_PATH)[0] + '-daemon.jsonl',
+                        help='job journal, kept apart from the desktop app\'s so both can run')
+    args = parser.parse_args()
+
+    config = load_config()
+    if MEMORY_TRACE_FRAMES:
+        memory.start(MEMORY_TRACE_FRAMES)
+    memory.report_on_signal(MEMORY_REPORT_FILE)
+    history = HistoryIndex(HISTORY_DB) if HISTORY_ENABLED else None
+    journal = JobJournal(args.journal, JOURNAL_FSYNC, JOURNAL_COMPACT_EVERY, JOURNAL_MARGIN) if JOURNAL_ENABLED else None
+    ocr_daemon = OCRDaemon(config['watch_dirs'], config['api_key'], history=history, journal=journal)
+    if not ocr_daemon.start():
+        raise SystemExit(1)
+
+    token = None if args.socket else DAEMON_TOKEN or load_token(DAEMON_TOKEN_FILE)
+    server = create_server(ocr_daemon, args.host, args.port, args.socket, token=token)
+    where = args.socket or f"http://{args.host}:{server.server_address[1]}"
+    print(f"OCR daemon listening on {where}")
+    if not args.socket and not DAEMON_TOKEN:
+        print(f"API token in {DAEMON_TOKEN_FILE}")
+
+    # Turn SIGTERM into a clean shutdown like Ctrl+C
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print("Shutting down OCR daemon...")
+        server.server_close()
+        ocr_daemon.stop()
+        if METRICS_FILE:
+            metrics.write_snapshot(METRICS_FILE)
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+if __name__ == "__main__":
+    main()
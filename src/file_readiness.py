@@ -0,0 +1,152 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+from metrics import metrics
+
+# Bytes that must appear at the end of a completely written file
+_TRAILERS = {
+    '.png': b'IEND',
+    '.jpg': b'\xff\xd9',
+    '.jpeg': b'\xff\xd9'
+}
+
+class ReadinessDetector:
+    """Decide when a newly created file is completely written.
+
+    Each create/modify event (re)starts a settle_time debounce. When it expires
+    the file is ready if it is non-empty and ends with its format trailer
+    (PNG IEND, JPEG EOI); other formats need an unchanged size/mtime across two
+    checks. Close-after-write and rename events skip the debounce because the
+    writer is already done.
+    """
+
+    def __init__(self, callback: Callable[[str], None], settle_time: float, timeout: float):
+        self.callback = callback
+        self.settle_time = settle_time
+        self.timeout = timeout
+        self._pending: Dict[str, dict] = {}
+        self._heap = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="file-readiness", daemon=True)
+        self._thread.start()
+
+    def track(self, file_path: str, renamed: bool = False) -> bool:
+        """Start tracking a new file; renamed files are checked right away.
+
+        Returns False if the file was already tracked (the event is coalesced).
+        """
+        with self._condition:
+            new = file_path not in self._pending
+            if new:
+                self._pending[file_path] = {'first_seen': time.monotonic(), 'signature': None}
+            self._schedule(file_path, 0 if renamed else self.settle_time)
+            return new
+
+    def touch(self, file_path: str, closed: bool = False) -> bool:
+        """Record a write to a tracked file, debouncing the readiness check.
+
+        Returns True if the file is tracked.
+        """
+        with self._condition:
+            if file_path in self._pending:
+                self._schedule(file_path, 0 if closed else self.settle_time)
+                return True
+            return False
+
+    def discard(self, file_path: str):
+        """Stop tracking a file that was moved away or deleted."""
+        with self._condition:
+            self._pending.pop(file_path, None)
+
+    def is_pending(self, file_path: str) -> bool:
+        with self._condition:
+            return file_path in self._pending
+
+    def _schedule(self, file_path: str, delay: float):
+        due = time.monotonic() + delay
+        self._pending[file_path]['due'] = due
+        heapq.heappush(self._heap, (due, next(self._counter), file_path))
+        self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._running and (not self._heap or self._heap[0][0] > time.monotonic()):
+                    wait = self._heap[0][0] - time.monotonic() if self._heap else None
+                    self._condition.wait(wait)
+                if not self._running:
+                    return
+                due, _, file_path = heapq.heappop(self._heap)
+                state = self._pending.get(file_path)
+                # Skip entries superseded by a later event for the same file
+                if state is None or state['due'] != due:
+                    continue
+
+            ready = self._check(file_path, state)
+            if ready:
+                self.callback(file_path)
+
+    def _check(self, file_path: str, state: dict) -> bool:
+        """Check one file; returns True when it should be handed to the callback."""
+        signature = self._signature(file_path)
+        trailer = self._has_trailer(file_path)
+        if signature is None or signature[0] == 0 or trailer is False:
+            ready = False
+        elif trailer is None:
+            # Unknown format: fall back to size/mtime stability
+            ready = signature == state['signature']
+        else:
+            ready = True
+
+        with self._condition:
+            if self._pending.get(file_path) is not state:
+                return False
+            if ready:
+                del self._pending[file_path]
+                metrics.observe('readiness', time.monotonic() - state['first_seen'])
+                return True
+            if time.monotonic() - state['first_seen'] > self.timeout:
+                del self._pending[file_path]
+                metrics.inc('files_not_ready')
+                print(f"File not ready after {self.timeout} seconds: {file_path}")
+                return False
+            state['signature'] = signature
+            self._schedule(file_path, self.settle_time)
+            return False
+
+    @staticmethod
+    def _signature(file_path: str) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        return (stat.st_size, stat.st_mtime_ns)
+
+    @staticmethod
+    def _has_trailer(file_path: str) -> Optional[bool]:
+        """Check that the file is readable and ends like a complete image.
+
+        Returns None for formats without a known trailer.
+        """
+        trailer = _TRAILERS.get(os.path.splitext(file_path)[1].lower())
+        try:
+            with open(file_path, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                f.seek(max(0, f.tell() - 32))
+                tail = f.read()
+        except OSError:
+            return False
+        if trailer is None:
+            return None
+        return trailer in tail
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        self._thread.join(timeout=1.0)
@@ -1,74 +1,186 @@
+import fnmatch
 import os
-import time
+import threading
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
-from typing import Callable, List
+from typing import Callable, Dict, List, Optional, Sequence, Union
+from file_readiness import ReadinessDetector
+from intake import IntakeQueue
+from journal import JobJournal, DETECTED, DISCARDED
+from metrics import metrics
+from move_records import MoveRecordPruner
+from config import (READY_SETTLE_TIME, READY_TIMEOUT, WATCH_RECURSIVE, WATCH_INCLUDE, WATCH_EXCLUDE,
+                    WATCH_QUEUE_SIZE, WATCH_OVERFLOW, WATCH_SPILL_FILE)
+
+SUPPORTED_EXTENSIONS = ['.png', '.jpg', '.jpeg']
+
+def is_supported_file(file_path: str, supported_extensions: List[str] = SUPPORTED_EXTENSIONS) -> bool:
+    """Check if the file has a supported extension."""
+    return any(file_path.lower().endswith(ext) for ext in supported_extensions)
+
+def matches_any(file_path: str, patterns: Sequence[str]) -> bool:
+    """Match globs against the file name and the full path ('*' also matches '/')."""
+    name = os.path.basename(file_path)
+    return any(fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(file_path, pattern) for pattern in patterns)
 
 class ScreenshotHandler(FileSystemEventHandler):
-    def __init__(self, callback: Callable[[str], None], supported_extensions: List[str] = ['.png', '.jpg', '.jpeg']):
+    def __init__(self, callback: Callable[[str], None], supported_extensions: List[str] = SUPPORTED_EXTENSIONS,
+                 settle_time: float = READY_SETTLE_TIME, timeout: float = READY_TIMEOUT,
+                 include: Sequence[str] = (), exclude: Sequence[str] = (), recursive: bool = False):
         self.callback = callback
         self.supported_extensions = supported_extensions
-        self.processing_files = set()
+        self.include = include
+        self.exclude = exclude
+        self.recursive = recursive
+        self.readiness = ReadinessDetector(callback, settle_time, timeout)
+        self._counts = {'events': 0, 'coalesced': 0, 'excluded': 0}
+        self._lock = threading.Lock()
 
     def on_created(self, event):
+        self._count('events')
+        if event.is_directory:
+            self._scan(event.src_path)
+        elif self._is_supported_file(event.src_path):
+            self._track(event.src_path)
+
+    def on_modified(self, event):
+        self._count('events')
+        if not event.is_directory and self.readiness.touch(event.src_path):
+            self._count('coalesced')
+
+    def on_closed(self, event):
+        self._count('events')
+        if not event.is_directory and self.readiness.touch(event.src_path, closed=True):
+            self._count('coalesced')
+
+    def on_moved(self, event):
+        # Covers the "write to a temp file, then rename" pattern
+        self._count('events')
+        if event.is_directory:
+            self._scan(event.dest_path)
+            return
+        self.readiness.discard(event.src_path)
+        if self._is_supported_file(event.dest_path):
+            self._track(event.dest_path, renamed=True)
+
+    def on_deleted(self, event):
+        self._count('events')
         if not event.is_directory:
-            file_path = event.src_path
-            if self._is_supported_file(file_path) and file_path not in self.processing_files:
-                self.processing_files.add(file_path)
-                try:
-                    # Wait for file to be completely written
-                    max_attempts = 10
-                    attempt = 0
-                    while attempt < max_attempts:
-                        if os.path.exists(file_path) and os.path.getsize(file_path) > 0:
-                            # Additional wait to ensure file is completely written
-                            time.sleep(1.0)
-                            try:
-                                # Try to open the file to verify it's readable
-                                with open(file_path, 'rb') as f:
-                                    f.read(1)
-                                break
-                            except:
-                                time.sleep(0.5)
-                        else:
-                            time.sleep(0.5)
-                        attempt += 1
-                    
-                    if attempt < max_attempts:
-                        self.callback(file_path)
-                    else:
-                        print(f"File not ready after {max_attempts} attempts: {file_path}")
-                finally:
-                    self.processing_files.remove(file_path)
+            self.readiness.discard(event.src_path)
+
+    def _track(self, file_path: str, renamed: bool = False):
+        if not self.readiness.track(file_path, renamed):
+            self._count('coalesced')
+
+    def _scan(self, directory: str):
+        """Pick up images in a directory that appeared at once (moved in, unpacked) under a recursive watch."""
+        if not self.recursive:
+            return
+        for root, _, names in os.walk(directory):
+            for name in names:
+                file_path = os.path.join(root, name)
+                if self._is_supported_file(file_path):
+                    self._track(file_path, renamed=True)
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counts[name] += 1
+        metrics.inc(f"watch_{name}")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counts)
 
     def _is_supported_file(self, file_path: str) -> bool:
-        """Check if the file has a supported extension."""
-        return any(file_path.lower().endswith(ext) for ext in self.supported_extensions)
+        """Check the extension and the include/exclude globs."""
+        if not is_supported_file(file_path, self.supported_extensions):
+            return False
+        if (self.include and not matches_any(file_path, self.include)) or matches_any(file_path, self.exclude):
+            self._count('excluded')
+            return False
+        return True
 
 class FileWatcher:
-    def __init__(self, watch_dir: str, callback: Callable[[str], None], supported_extensions: List[str] = ['.png', '.jpg', '.jpeg']):
-        self.watch_dir = watch_dir
+    """Watch one or more directories and hand each completely written screenshot to callback.
+
+    Ready files pass through a bounded IntakeQueue (see intake.py); with
+    max_in_flight set, call done(path) once a handed-on file is finished.
+    With a journal, every ready file is logged as detected and start()
+    first queues the jobs the previous run left unfinished or missed.
+    """
+
+    def __init__(self, watch_dir: Union[str, Sequence[str]], callback: Callable[[str], None],
+                 supported_extensions: List[str] = SUPPORTED_EXTENSIONS, recursive: bool = WATCH_RECURSIVE,
+                 include: Sequence[str] = WATCH_INCLUDE, exclude: Sequence[str] = WATCH_EXCLUDE,
+                 queue_size: int = WATCH_QUEUE_SIZE, overflow: str = WATCH_OVERFLOW,
+                 spill_path: Optional[str] = WATCH_SPILL_FILE, max_in_flight: Optional[int] = None,
+                 journal: Optional[JobJournal] = None):
+        self.watch_dirs = [watch_dir] if isinstance(watch_dir, str) else list(watch_dir)
+        self.watch_dir = self.watch_dirs[0]
         self.callback = callback
         self.supported_extensions = supported_extensions
+        self.recursive = recursive
+        self.include = include
+        self.exclude = exclude
+        self.journal = journal
+        on_drop = (lambda path: journal.record(path, DISCARDED)) if journal is not None else None
+        self.intake = IntakeQueue(callback, queue_size, overflow, spill_path, max_in_flight, on_drop)
         self.observer = None
         self.handler = None
+        self.move_records = MoveRecordPruner()
 
     def start(self):
-        """Start watching the directory for new files."""
-        if not os.path.exists(self.watch_dir):
-            print(f"Watch directory does not exist: {self.watch_dir}")
+        """Start watching the directories for new files; True if at least one is watched."""
+        roots = [root for root in self.watch_dirs if os.path.isdir(root)]
+        for root in self.watch_dirs:
+            if root not in roots:
+                print(f"Watch directory does not exist: {root}")
+        if not roots:
             return False
 
-        self.handler = ScreenshotHandler(self.callback, self.supported_extensions)
+        self.handler = ScreenshotHandler(self._on_ready, self.supported_extensions,
+                                         include=self.include, exclude=self.exclude, recursive=self.recursive)
         self.observer = Observer()
-        self.observer.schedule(self.handler, self.watch_dir, recursive=False)
+        for root in roots:
+            self.observer.schedule(self.handler, root, recursive=self.recursive)
         self.observer.start()
-        print(f"Started watching directory: {self.watch_dir}")
+        for root in roots:
+            print(f"Started watching directory: {root}{' (recursive)' if self.recursive else ''}")
+        if self.journal is not None:
+            # Watching first, so nothing written meanwhile falls between the scan and the events
+            for file_path in self.journal.reconcile(roots, self._wanted, self.recursive):
+                self.intake.put(file_path)
         return True
 
+    def _on_ready(self, file_path: str):
+        if self.journal is not None:
+            self.journal.record(file_path, DETECTED)
+        self.intake.put(file_path)
+        self.move_records.maybe_prune(self.observer)
+
+    def _wanted(self, file_path: str) -> bool:
+        return (is_supported_file(file_path, self.supported_extensions)
+                and (not self.include or matches_any(file_path, self.include))
+                and not matches_any(file_path, self.exclude))
+
+    def done(self, file_path: str):
+        """Report that a handed-on file has been dealt with."""
+        self.intake.done(file_path)
+
+    def stats(self) -> Dict[str, int]:
+        """Counters of events seen, coalesced, excluded, queued, dropped and spilled."""
+        stats = self.handler.stats() if self.handler else {}
+        intake = self.intake.stats()
+        # Events coalesced by the readiness debounce and by the queue
+        stats['coalesced'] = stats.get('coalesced', 0) + intake.pop('coalesced')
+        stats.update(intake)
+        return stats
+
     def stop(self):
-        """Stop watching the directory."""
+        """Stop watching the directories."""
         if self.observer:
             self.observer.stop()
             self.observer.join()
-            print("Stopped watching directory") 
\ No newline at end of file
+            self.handler.readiness.stop()
+            print("Stopped watching directory")
+        self.intake.stop()
@@ -0,0 +1,269 @@
+"""
+Searchable history of OCR results in a local SQLite FTS5 index.
+
+    python src/history.py search "connection refused" [--limit 20]
+    python src/history.py import [DIRECTORY] [--workers 8] [--no-recursive]
+    python src/history.py import-jsonl results.jsonl
+    python src/history.py stats
+
+`import` OCRs the screenshots of a folder that are not in the index yet;
+`import-jsonl` indexes the output of batch.py without calling the API again.
+"""
+import argparse
+import contextvars
+import hashlib
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Set
+from ocr_backend import OCRBackend
+from ocr_job import when_confirmed
+from config import HISTORY_DB
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    created REAL NOT NULL,
+    backend TEXT,
+    text TEXT NOT NULL,
+    UNIQUE (path, content_hash)
+);
+CREATE INDEX IF NOT EXISTS results_created ON results (created);
+CREATE VIRTUAL TABLE IF NOT EXISTS results_fts USING fts5(
+    text, content='results', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS results_ai AFTER INSERT ON results BEGIN
+    INSERT INTO results_fts (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS results_ad AFTER DELETE ON results BEGIN
+    INSERT INTO results_fts (results_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+CREATE TRIGGER IF NOT EXISTS results_au AFTER UPDATE ON results BEGIN
+    INSERT INTO results_fts (results_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    INSERT INTO results_fts (rowid, text) VALUES (new.id, new.text);
+END;
+"""
+
+class SearchHit(NamedTuple):
+    path: str
+    created: float
+    snippet: str
+    text: str
+
+def content_hash(file_path: str) -> str:
+    """SHA-256 of the file content."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def to_fts_query(query: str) -> str:
+    """Turn free text into an FTS5 query: all words must match, the last one as a prefix.
+
+    Words are quoted so punctuation typed by the user (quotes, colons, dashes)
+    cannot produce a syntax error.
+    """
+    words = re.findall(r'\w+', query)
+    if not words:
+        return ''
+    terms = [f'"{word}"' for word in words]
+    if not query[-1:].isspace():
+        # Still typing the last word
+        terms[-1] += '*'
+    return ' '.join(terms)
+
+class HistoryIndex:
+    """Persistent OCR results with ranked full-text search, safe to share between threads."""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        if db_path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def add(self, file_path: str, text: str, backend: Optional[str] = None,
+            digest: Optional[str] = None, created: Optional[float] = None) -> bool:
+        """Index one result; returns False if this exact file content was already indexed."""
+        return self.add_many([(file_path, text, backend, digest, created)]) == 1
+
+    def add_many(self, records: Iterable[tuple]) -> int:
+        """Index (path, text, backend, digest, created) tuples in one transaction.
+
+        A missing digest is computed from the file and a missing created time
+        is taken from its mtime. Returns the number of new entries.
+        """
+        rows = []
+        for file_path, text, backend, digest, created in records:
+            if not text:
+                continue
+            try:
+                digest = digest or content_hash(file_path)
+                created = created or os.path.getmtime(file_path)
+            except OSError as e:
+                print(f"Error reading {file_path} for history: {e}")
+                continue
+            rows.append((os.path.abspath(file_path), digest, created, backend, text))
+
+        if not rows:
+            return 0
+        with self._lock, self._conn:
+            # rowcount leaves out the rows written by the FTS triggers
+            return self._conn.executemany('INSERT OR IGNORE INTO results (path, content_hash, created, backend, text) '
+                                          'VALUES (?, ?, ?, ?, ?)', rows).rowcount
+
+    def search(self, query: str, limit: int = 20, offset: int = 0) -> List[SearchHit]:
+        """Return the best matches for query, most relevant first (BM25); offset pages through the rest."""
+        match = to_fts_query(query)
+        if not match:
+            return []
+        with self._lock:
+            # FTS5 sorts by rank itself and only the rows returned are joined and snippeted
+            rows = self._conn.execute(
+                "SELECT r.path, r.created, snippet(results_fts, 0, '[', ']', '...', 12), r.text "
+                "FROM results_fts JOIN results r ON r.id = results_fts.rowid "
+                "WHERE results_fts MATCH ? ORDER BY rank LIMIT ? OFFSET ?",
+                (match, limit, offset)).fetchall()
+        return [SearchHit(*row) for row in rows]
+
+    def recent(self, limit: int = 20) -> List[SearchHit]:
+        """Return the newest entries."""
+        with self._lock:
+            rows = self._conn.execute('SELECT path, created, substr(text, 1, 120), text FROM results '
+                                      'ORDER BY created DESC LIMIT ?', (limit,)).fetchall()
+        return [SearchHit(*row) for row in rows]
+
+    def indexed_paths(self) -> Set[str]:
+        with self._lock:
+            return {row[0] for row in self._conn.execute('SELECT DISTINCT path FROM results')}
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT count(*) FROM results').fetchone()[0]
+
+    def optimize(self):
+        """Merge the FTS index segments; worth running after a large import."""
+        with self._lock, self._conn:
+            self._conn.execute("INSERT INTO results_fts (results_fts) VALUES ('optimize')")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+_recording = contextvars.ContextVar('ocr_history_recording', default=True)
+
+@contextmanager
+def unrecorded() -> Iterator[None]:
+    """Keep results of the OCR done in this block (and threads started from its context) out of the history.
+
+    For images that are not kept, such as uploads to the daemon, whose paths
+    would lead nowhere.
+    """
+    token = _recording.set(False)
+    try:
+        yield
+    finally:
+        _recording.reset(token)
+
+class HistoryRecorder(OCRBackend):
+    """Backend wrapper that indexes every successful result as it is produced."""
+
+    def __init__(self, backend: OCRBackend, index: HistoryIndex):
+        self.backend = backend
+        self.index = index
+        self.name = backend.name
+
+    def perform_ocr(self, file_path: str) -> Optional[Dict[str, str]]:
+        result = self.backend.perform_ocr(file_path)
+        if result and _recording.get():
+            # A speculative result is only indexed once the user confirms the screenshot
+            when_confirmed(lambda: self._index(file_path, result))
+        return result
+
+    def _index(self, file_path: str, result: Dict[str, str]):
+        try:
+            self.index.add(file_path, result['text'], result.get('backend', self.name))
+        except sqlite3.Error as e:
+            print(f"Error indexing OCR result: {e}")
+
+    def is_available(self) -> bool:
+        return self.backend.is_available()
+
+    def __getattr__(self, name):
+        # Expose stop(), stats and the wrapped services of the inner backend
+        return getattr(self.backend, name)
+
+def import_jsonl(index: HistoryIndex, jsonl_path: str) -> int:
+    """Index the successful records of a batch.py output file."""
+    import json
+    records = []
+    with open(jsonl_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if not isinstance(record, dict) or not isinstance(record.get('path'), str):
+                continue
+            if record.get('status') == 'ok' and record.get('text') and os.path.exists(record['path']):
+                records.append((record['path'], record['text'], record.get('backend'), None, None))
+    added = index.add_many(records)
+    index.optimize()
+    return added
+
+def format_hit(hit: SearchHit) -> str:
+    when = time.strftime('%Y-%m-%d %H:%M', time.localtime(hit.created))
+    return f"{when}  {hit.path}\n    {' '.join(hit.snippet.split())}"
+
+def main():
+    parser = argparse.ArgumentParser(description='Search and build the OCR history index.')
+    parser.add_argument('--db', default=HISTORY_DB, help='index database file')
+    commands = parser.add_subparsers(dest='command', required=True)
+    search = commands.add_parser('search', help='ranked full-text search')
+    search.add_argument('query', nargs='+')
+    search.add_argument('--limit', type=int, default=20)
+    search.add_argument('--offset', type=int, default=0, help='skip this many of the best matches')
+    bulk = commands.add_parser('import', help='OCR and index screenshots not indexed yet')
+    bulk.add_argument('directory', nargs='?', help='directory to scan (default: WATCH_DIR)')
+    bulk.add_argument('--workers', type=int, default=None)
+    bulk.add_argument('--no-recursive', action='store_true')
+    jsonl = commands.add_parser('import-jsonl', help='index results written by batch.py')
+    jsonl.add_argument('path')
+    commands.add_parser('stats', help='number of indexed results')
+    args = parser.parse_args()
+
+    index = HistoryIndex(args.db)
+    if args.command == 'search':
+        start = time.perf_counter()
+        hits = index.search(' '.join(args.query), args.limit, args.offset)
+        for hit in hits:
+            print(format_hit(hit))
+        print(f"{len(hits)} result(s) in {(time.perf_counter() - start) * 1000:.1f} ms", file=sys.stderr)
+    elif args.command == 'import':
+        from batch import run_batch
+        from config import load_config, OCR_WORKERS
+        directory = args.directory or load_config()['watch_dir']
+        # batch.py skips what the index already has and records new results through HistoryRecorder
+        failures = run_batch(directory, os.devnull, max(1, args.workers or OCR_WORKERS),
+                             not args.no_recursive, history=index, skip_indexed=True)
+        index.optimize()
+        print(f"{len(index)} result(s) indexed")
+        sys.exit(1 if failures else 0)
+    elif args.command == 'import-jsonl':
+        print(f"{import_jsonl(index, args.path)} new result(s), {len(index)} indexed")
+    else:
+        print(f"{len(index)} result(s) indexed in {args.db}")
+
+if __name__ == "__main__":
+    main()
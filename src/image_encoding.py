@@ -0,0 +1,118 @@
+import io
+from array import array
+from typing import NamedTuple, Optional, Tuple
+from PIL import Image, features
+
+# Side length of the sample used to analyse colours
+SAMPLE_SIDE = 256
+# Height of the full width band used to measure text lines
+PROBE_HEIGHT = 768
+# Mean HSV saturation (0-255) below which the image is sent as grayscale
+GRAYSCALE_MAX_SATURATION = 24
+# Share of pixels covered by the 16 most common colours in flat UI screenshots
+FLAT_MIN_COVERAGE = 0.8
+# Grey level distance from the background colour that counts as ink
+INK_CONTRAST = 60
+# Height in pixels a text line should keep after resizing
+TARGET_TEXT_HEIGHT = 12
+# Never shrink below this longest side
+MIN_SIDE = 640
+
+class EncodingChoice(NamedTuple):
+    format: str  # PNG, JPEG or WEBP
+    size: Tuple[int, int]
+    grayscale: bool
+    quality: int
+    text_height: Optional[float]  # median line height in original pixels
+
+def _sample(image: Image.Image) -> Image.Image:
+    factor = max(1, max(image.size) // SAMPLE_SIDE)
+    sample = image.reduce(factor) if factor > 1 else image
+    if sample.mode not in ('RGB', 'L'):
+        sample = sample.convert('RGB')
+    return sample
+
+def text_line_height(gray: Image.Image) -> Optional[float]:
+    """Estimate the median height of text lines from the row ink projection."""
+    background = max(range(256), key=gray.histogram().__getitem__)
+    ink = gray.point(lambda value: 255 if abs(value - background) > INK_CONTRAST else 0)
+    # Float mode keeps a single ink pixel from rounding away in the row mean
+    rows = array('f', ink.convert('F').resize((1, ink.height), Image.Resampling.BOX).tobytes())
+
+    heights = []
+    top = None
+    for y, value in enumerate(list(rows) + [0]):
+        if value and top is None:
+            top = y
+        elif not value and top is not None:
+            heights.append(y - top)
+            top = None
+
+    # Bands taller than a third of the probe are pictures, not text lines
+    heights = sorted(h for h in heights if 2 <= h <= gray.height / 3)
+    return heights[len(heights) // 2] if heights else None
+
+def choose_encoding(image: Image.Image, original_size: Tuple[int, int], base_side: int,
+                    max_side: int, quality: int, allow_webp: bool = False) -> EncodingChoice:
+    """Choose format, colour mode and resolution for one image.
+
+    image may be a reduced decode of the file; original_size is the size on disk
+    and is never exceeded, so small crops are not upscaled. The longest side is
+    picked so text lines keep about TARGET_TEXT_HEIGHT pixels, between MIN_SIDE
+    and max_side; without measurable text lines base_side is used. Flat UI
+    content is sent as PNG, photo-like content as JPEG (or WebP if allowed).
+    """
+    sample = _sample(image)
+    grayscale = sample.mode == 'L'
+    if not grayscale:
+        saturation = sample.convert('HSV').getchannel('S').histogram()
+        mean = sum(index * count for index, count in enumerate(saturation)) / max(1, sum(saturation))
+        grayscale = mean < GRAYSCALE_MAX_SATURATION
+
+    colors = sorted(sample.getcolors(sample.width * sample.height), reverse=True)
+    flat = sum(count for count, _ in colors[:16]) >= FLAT_MIN_COVERAGE * sample.width * sample.height
+
+    # Measure text on a full width band through the middle, at decoded resolution
+    scale = max(original_size) / max(image.size)
+    top = max(0, (image.height - PROBE_HEIGHT) // 2)
+    probe = image.crop((0, top, image.width, top + min(PROBE_HEIGHT, image.height)))
+    line_height = text_line_height(probe.convert('L'))
+
+    if line_height is None:
+        side = base_side
+    else:
+        line_height *= scale
+        side = int(max(original_size) * TARGET_TEXT_HEIGHT / line_height)
+        side = max(MIN_SIDE, min(max_side, side))
+    side = min(side, max(original_size))
+    ratio = side / max(original_size)
+    size = (max(1, int(original_size[0] * ratio)), max(1, int(original_size[1] * ratio)))
+
+    # Flat UI screenshots compress better and stay sharper as lossless PNG
+    if flat:
+        image_format = 'PNG'
+    elif allow_webp and features.check('webp'):
+        image_format = 'WEBP'
+    else:
+        image_format = 'JPEG'
+
+    return EncodingChoice(image_format, size, grayscale, quality, line_height)
+
+def encode(image: Image.Image, choice: EncodingChoice) -> bytes:
+    """Encode an image that has already been resized to choice.size."""
+    if choice.grayscale:
+        image = image.convert('L')
+    elif image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    output = io.BytesIO()
+    if choice.format == 'PNG':
+        # A 256 colour palette keeps flat screenshots visually lossless and much smaller
+        if image.mode == 'RGB':
+            image = image.quantize(256)
+        image.save(output, format='PNG')
+    elif choice.format == 'WEBP':
+        image.save(output, format='WEBP', quality=choice.quality, method=0)
+    else:
+        image.save(output, format='JPEG', quality=choice.quality, optimize=True)
+    return output.getvalue()
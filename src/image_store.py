@@ -0,0 +1,126 @@
+import threading
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+from metrics import metrics
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+class SharedImage:
+    """A screenshot decoded once and shared by the preview, upload and editor."""
+
+    def __init__(self, file_path: str, max_side: int):
+        self.file_path = file_path
+        self.max_side = max_side
+        self.original_size: Optional[Tuple[int, int]] = None
+        self._base: Optional['Image.Image'] = None
+        self._resized: Dict[Tuple[int, int], 'Image.Image'] = {}
+        self._lock = threading.Lock()
+
+    def _decode(self) -> 'Image.Image':
+        """Decode at the lowest resolution that still leaves a 1.5x margin over max_side."""
+        from PIL import Image
+        with Image.open(self.file_path) as img:
+            self.original_size = img.size
+            target = self._scaled(img.size, int(1.5 * self.max_side))
+            # JPEG can decode directly at 1/2, 1/4 or 1/8 scale
+            img.draft(img.mode, target)
+            img.load()
+            if img.mode == 'P':
+                img = img.convert('RGBA')
+            elif img.mode == '1':
+                img = img.convert('L')
+            factor = max(1, min(img.width // target[0], img.height // target[1]))
+            if factor > 1:
+                return img.reduce(factor)
+            return img.copy()
+
+    @classmethod
+    def from_image(cls, file_path: str, max_side: int, image: 'Image.Image',
+                   original_size: Tuple[int, int]) -> 'SharedImage':
+        """Wrap an image that was already decoded from file_path at original_size."""
+        handle = cls(file_path, max_side)
+        handle.original_size = original_size
+        handle._base = image
+        return handle
+
+    @staticmethod
+    def _scaled(size: Tuple[int, int], max_side: int) -> Tuple[int, int]:
+        ratio = min(1.0, max_side / max(size))
+        return (max(1, int(size[0] * ratio)), max(1, int(size[1] * ratio)))
+
+    def base(self) -> 'Image.Image':
+        """Return the shared decoded image, decoding it on first use."""
+        with self._lock:
+            if self._base is None:
+                with metrics.timer('decode'):
+                    self._base = self._decode()
+            return self._base
+
+    def decoded(self) -> Optional['Image.Image']:
+        """Return the decoded image if something already decoded it, without decoding."""
+        with self._lock:
+            return self._base
+
+    def size(self) -> Tuple[int, int]:
+        """Return the size of the image on disk."""
+        self.base()
+        return self.original_size
+
+    def resized(self, size: Tuple[int, int]) -> 'Image.Image':
+        """Return the image resized to size, reusing earlier resizes."""
+        base = self.base()
+        with self._lock:
+            image = self._resized.get(size)
+            if image is None:
+                from PIL import Image
+                if base.size == size:
+                    image = base
+                else:
+                    with metrics.timer('resize'):
+                        image = base.resize(size, Image.Resampling.LANCZOS)
+                self._resized[size] = image
+            return image
+
+    def release(self):
+        """Drop the decoded data."""
+        with self._lock:
+            self._base = None
+            self._resized.clear()
+
+class ImageStore:
+    """Reference-counted SharedImage handles keyed by file path."""
+
+    def __init__(self, max_side: int):
+        self.max_side = max_side
+        self._images: Dict[str, list] = {}  # path -> [SharedImage, refcount]
+        self._lock = threading.Lock()
+
+    def acquire(self, file_path: str) -> SharedImage:
+        """Get the shared handle for a file, creating it if needed."""
+        with self._lock:
+            entry = self._images.get(file_path)
+            if entry is None:
+                entry = self._images[file_path] = [SharedImage(file_path, self.max_side), 0]
+            entry[1] += 1
+            return entry[0]
+
+    def get(self, file_path: str) -> Optional[SharedImage]:
+        """Return the handle for a file that is already in use, without taking a reference."""
+        with self._lock:
+            entry = self._images.get(file_path)
+            return entry[0] if entry else None
+
+    def release(self, file_path: str):
+        """Drop one reference; memory is freed once the last user is done."""
+        with self._lock:
+            entry = self._images.get(file_path)
+            if entry is None:
+                return
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del self._images[file_path]
+                entry[0].release()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._images)
@@ -0,0 +1,282 @@
+import math
+import threading
+from array import array
+from collections import deque
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple, TYPE_CHECKING
+from ocr_backend import OCRBackend
+from ocr_service import OCRService
+from image_store import ImageStore, SharedImage
+from perceptual_hash import BKTree, dhash
+from metrics import metrics
+from text_layout import Box, TextLayout
+from config import (MAX_IMAGE_SIZE, IMAGE_QUALITY, ENCODE_MAX_SIDE, ENCODE_WEBP, DEDUP_RECENT, DEDUP_MAX_DISTANCE,
+                    DEDUP_DIFF_SIDE, DEDUP_TILE, DEDUP_MAX_CHANGED)
+
+if TYPE_CHECKING:
+    from PIL import Image
+    import image_encoding
+
+# Change in brightness or colour that counts as a changed pixel. Low, so grey-on-grey
+# text and recolouring at the same brightness register; noisier (JPEG) copies end up
+# over DEDUP_MAX_CHANGED and get a full OCR
+DIFF_THRESHOLD = 4
+# Original-image pixels added around a changed region so glyphs are not cut
+REGION_PADDING = 8
+
+class DiffImage(NamedTuple):
+    """Small copy of a screenshot for diffing: brightness, and colour at half resolution as JPEG keeps it."""
+    luma: 'Image.Image'  # L
+    chroma: 'Image.Image'  # LA holding Cb and Cr
+
+def diff_image(image: 'Image.Image', max_side: int) -> DiffImage:
+    """Scale image to at most max_side and split it into brightness and half-size colour."""
+    from PIL import Image
+    ratio = min(1.0, max_side / max(image.size))
+    size = (max(1, int(image.width * ratio)), max(1, int(image.height * ratio)))
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    if image.size != size:
+        image = image.resize(size, Image.Resampling.BOX)
+    luma, cb, cr = image.convert('YCbCr').split()
+    half = (max(1, size[0] // 2), max(1, size[1] // 2))
+    chroma = Image.merge('LA', (cb.resize(half, Image.Resampling.BOX), cr.resize(half, Image.Resampling.BOX)))
+    return DiffImage(luma, chroma)
+
+def difference(previous: DiffImage, current: DiffImage) -> 'Image.Image':
+    """Per-pixel largest change of brightness or either colour channel, at the brightness size."""
+    from PIL import Image, ImageChops
+    chroma = ImageChops.lighter(*ImageChops.difference(previous.chroma, current.chroma).split())
+    return ImageChops.lighter(ImageChops.difference(previous.luma, current.luma),
+                              chroma.resize(current.luma.size, Image.Resampling.NEAREST))
+
+def changed_regions(changes: 'Image.Image', tile: int, threshold: int = DIFF_THRESHOLD) -> List[Box]:
+    """Return bounding boxes of connected groups of tiles with a change above threshold."""
+    from PIL import Image
+    width, height = changes.size
+    columns, rows = max(1, -(-width // tile)), max(1, -(-height // tile))
+    changed = changes.point(lambda value: 255 if value > threshold else 0)
+    # Mean per tile; any changed pixel makes it non-zero
+    means = array('f', changed.convert('F').resize((columns, rows), Image.Resampling.BOX).tobytes())
+    dirty = {(index // columns, index % columns) for index, value in enumerate(means) if value > 0}
+
+    regions = []
+    while dirty:
+        # Flood fill one group of neighbouring tiles
+        stack = [dirty.pop()]
+        top, left, bottom, right = rows, columns, 0, 0
+        while stack:
+            row, column = stack.pop()
+            top, left = min(top, row), min(left, column)
+            bottom, right = max(bottom, row + 1), max(right, column + 1)
+            for neighbour in ((row - 1, column), (row + 1, column), (row, column - 1), (row, column + 1)):
+                if neighbour in dirty:
+                    dirty.remove(neighbour)
+                    stack.append(neighbour)
+        regions.append((left * width // columns, top * height // rows,
+                        right * width // columns, bottom * height // rows))
+    return regions
+
+def _center_inside(word: Sequence, box: Box) -> bool:
+    x, y = (word[1] + word[3]) / 2, (word[2] + word[4]) / 2
+    return box[0] <= x < box[2] and box[1] <= y < box[3]
+
+class _Reference:
+    """A recently OCR'd screenshot that later ones can be diffed against."""
+
+    __slots__ = ('hash', 'size', 'diff', 'result', 'stale')
+
+    def __init__(self, value: int, size: Tuple[int, int], diff: DiffImage, result: Dict):
+        self.hash = value
+        self.size = size
+        self.diff = diff
+        self.result = result
+        self.stale = False
+
+class RecentImages:
+    """The last max_entries screenshots, searchable by perceptual hash distance."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = deque()
+        self._tree = BKTree()
+        self._stale = 0
+        self._lock = threading.Lock()
+
+    def add(self, reference: _Reference):
+        with self._lock:
+            self._entries.append(reference)
+            self._tree.add(reference.hash, reference)
+            if len(self._entries) > self.max_entries:
+                # BK-trees cannot delete; mark the entry, free its image and result, and rebuild
+                # once half the tree is stale
+                evicted = self._entries.popleft()
+                evicted.stale = True
+                evicted.diff = evicted.result = None
+                self._stale += 1
+                if self._stale > self.max_entries:
+                    self._tree = BKTree()
+                    for entry in self._entries:
+                        self._tree.add(entry.hash, entry)
+                    self._stale = 0
+
+    def nearest(self, value: int, size: Tuple[int, int], radius: int) -> Optional[_Reference]:
+        """Return the closest live entry of the same size within radius, newest on ties."""
+        with self._lock:
+            # Copies, so an entry evicted while the caller diffs against it keeps its image
+            matches = [(distance, _Reference(reference.hash, reference.size, reference.diff, reference.result))
+                       for distance, reference in self._tree.search(value, radius)
+                       if not reference.stale and reference.size == size]
+        if not matches:
+            return None
+        best = min(distance for distance, _ in matches)
+        return [reference for distance, reference in matches if distance == best][-1]
+
+class IncrementalOCR(OCRBackend):
+    """OCR only what changed since a near-duplicate screenshot.
+
+    An exact copy is served from the cache before anything is decoded.
+    Otherwise each screenshot gets a dHash; a match among recent screenshots
+    (same size, few differing bits) is diffed tile by tile in brightness and
+    colour, the changed regions are cropped from the new image and OCR'd in
+    one request, and their words replace the matched result's words in
+    those regions. The matched result is reused as it is only when the
+    small copies are identical. Anything else goes to the wrapped backend.
+    """
+
+    name = 'cloud'
+
+    def __init__(self, backend: OCRBackend, ocr_service: OCRService, image_store: ImageStore,
+                 max_entries: int = DEDUP_RECENT, max_distance: int = DEDUP_MAX_DISTANCE,
+                 diff_side: int = DEDUP_DIFF_SIDE, tile: int = DEDUP_TILE,
+                 max_changed: float = DEDUP_MAX_CHANGED):
+        """backend does full OCR; ocr_service (usually inside it) sends the region requests."""
+        self.backend = backend
+        self.ocr_service = ocr_service
+        self.image_store = image_store
+        self.max_distance = max_distance
+        self.diff_side = diff_side
+        self.tile = tile
+        self.max_changed = max_changed
+        self.recent = RecentImages(max_entries)
+
+    def perform_ocr(self, file_path: str) -> Optional[Dict[str, str]]:
+        # Misses are counted by the backend or below, whichever OCRs the image
+        cache_key, cached = self.ocr_service.lookup_cache(file_path, count_miss=False)
+        if cached is not None:
+            return cached
+        handle = self.image_store.acquire(file_path)
+        try:
+            try:
+                with metrics.timer('dedup_hash'):
+                    diff = diff_image(handle.base(), self.diff_side)
+                    value = dhash(diff.luma)
+            except Exception as e:
+                print(f"Error hashing image: {e}")
+                return self.backend.perform_ocr(file_path)
+
+            result = None
+            match = self.recent.nearest(value, handle.size(), self.max_distance)
+            if match is not None and match.result.get('layout') is not None:
+                result = self._incremental(handle, diff, match)
+                if result is not None:
+                    metrics.inc('cache_misses')
+                    self.ocr_service.store_cache(cache_key, result)
+            if result is None:
+                result = self.backend.perform_ocr(file_path)
+            if result:
+                self.recent.add(_Reference(value, handle.size(), diff, result))
+            return result
+        finally:
+            self.image_store.release(file_path)
+
+    def _incremental(self, handle: SharedImage, diff: DiffImage, match: _Reference) -> Optional[Dict]:
+        """Patch the matched result with OCR of the changed regions, or None to do a full OCR."""
+        with metrics.timer('dedup_diff'):
+            changes = difference(match.diff, diff)
+            regions = changed_regions(changes, self.tile)
+            if not regions and changes.getbbox() is not None:
+                # Nothing above the threshold, but not the same image either: re-read every change
+                regions = changed_regions(changes, self.tile, 0)
+        if not regions:
+            metrics.inc('dedup_unchanged')
+            return dict(match.result)
+
+        width, height = handle.size()
+        to_original = width / changes.width
+        changed_area = sum((right - left) * (bottom - top) for left, top, right, bottom in regions)
+        if changed_area * to_original ** 2 > self.max_changed * width * height:
+            metrics.inc('dedup_too_different')
+            return None
+
+        previous = match.result['layout']
+        boxes = []
+        for left, top, right, bottom in regions:
+            box = [max(0, int(left * to_original) - REGION_PADDING), max(0, int(top * to_original) - REGION_PADDING),
+                   min(width, int(right * to_original) + REGION_PADDING),
+                   min(height, int(bottom * to_original) + REGION_PADDING)]
+            # Grow the region over words it cuts through so they are re-read whole
+            for word in previous.words_in(tuple(box), partial=True):
+                box = [min(box[0], word[1]), min(box[1], word[2]), max(box[2], word[3]), max(box[3], word[4])]
+            boxes.append(tuple(box))
+
+        contents, scales, origins = [], [], []
+        upload, choice = self._upload_image(handle)
+        for box in boxes:
+            content, scale, origin = self._encode_region(handle, upload, choice, box)
+            contents.append(content)
+            scales.append(scale)
+            origins.append(origin)
+        results = self.ocr_service.annotate_contents(contents, scales, keep_empty=True)
+        if any(result is None for result in results):
+            # A region without a result failed (regions without text get an empty one);
+            # patching the rest would drop its old words and cache text with a hole in it
+            metrics.inc('dedup_incomplete')
+            return None
+
+        words = [word for word in previous if not any(_center_inside(word, box) for box in boxes)]
+        for (x, y), result in zip(origins, results):
+            for text, left, top, right, bottom in result['layout']:
+                words.append([text, round(left + x), round(top + y), round(right + x), round(bottom + y)])
+        if not words:
+            return None
+
+        metrics.inc('dedup_incremental')
+        metrics.inc('dedup_pixels_skipped', width * height - sum((b[2] - b[0]) * (b[3] - b[1]) for b in boxes))
+        layout = TextLayout.from_words(words)
+        return {"text": layout.text(), "layout": layout}
+
+    def _upload_image(self, handle: SharedImage) -> Tuple['Image.Image', 'image_encoding.EncodingChoice']:
+        """The screenshot resized and the encoding chosen as a full OCR would upload it."""
+        import image_encoding
+        if self.ocr_service.adaptive_encoding:
+            choice = image_encoding.choose_encoding(handle.base(), handle.size(), MAX_IMAGE_SIZE, ENCODE_MAX_SIDE,
+                                                    IMAGE_QUALITY, ENCODE_WEBP)
+        else:
+            # The fixed strategy: JPEG with the longest side at MAX_IMAGE_SIZE
+            width, height = handle.size()
+            ratio = min(MAX_IMAGE_SIZE / width, MAX_IMAGE_SIZE / height)
+            choice = image_encoding.EncodingChoice('JPEG', (int(width * ratio), int(height * ratio)), False,
+                                                   IMAGE_QUALITY, None)
+        return handle.resized(choice.size), choice
+
+    def _encode_region(self, handle: SharedImage, upload: 'Image.Image', choice: 'image_encoding.EncodingChoice',
+                       box: Box) -> Tuple[str, float, Tuple[float, float]]:
+        """Crop a region (original pixels) from the upload-size image and encode it.
+
+        Cropping after the resize and reusing the full image's encoding gives
+        the region the same pixels a full OCR would see; a thin crop has too
+        few lines to choose a resolution itself. Returns the content, its
+        scale and its origin in original pixels.
+        """
+        import image_encoding
+        ratio = upload.width / handle.size()[0]
+        # Round inwards so the crop does not pick up slivers of neighbouring lines
+        left, top = math.ceil(box[0] * ratio), math.ceil(box[1] * ratio)
+        crop = upload.crop((left, top, max(left + 1, int(box[2] * ratio)), max(top + 1, int(box[3] * ratio))))
+        with metrics.timer('encode', format=choice.format):
+            data = image_encoding.encode(crop, choice._replace(size=crop.size))
+        return self.ocr_service.encode_bytes(data), 1 / ratio, (left / ratio, top / ratio)
+
+    def stop(self):
+        if hasattr(self.backend, 'stop'):
+            self.backend.stop()
@@ -0,0 +1,124 @@
+import os
+import threading
+from collections import deque
+from typing import Callable, Dict, Optional
+from metrics import metrics
+
+OVERFLOW_POLICIES = ('drop_oldest', 'newest_only', 'spill')
+
+class IntakeQueue:
+    """Bounded queue between the file watcher and whoever processes new screenshots.
+
+    Ready files are handed to callback one at a time on a dedicated thread. With
+    max_in_flight set, at most that many files are handed on before done() is
+    called for them, so a burst waits here instead of piling up downstream.
+    A file already waiting is not queued twice. When the queue is full the
+    overflow policy applies:
+
+    - drop_oldest: forget the longest waiting file
+    - newest_only: forget every waiting file, keep only the new one
+    - spill: append the new file's path to spill_path for batch.py --files-from
+
+    on_drop(path) is called for every file dropped or spilled.
+    """
+
+    def __init__(self, callback: Callable[[str], None], max_size: int, policy: str = 'drop_oldest',
+                 spill_path: Optional[str] = None, max_in_flight: Optional[int] = None,
+                 on_drop: Optional[Callable[[str], None]] = None):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {policy}")
+        if policy == 'spill' and not spill_path:
+            raise ValueError("The spill overflow policy needs a spill file")
+        self.callback = callback
+        self.max_size = max_size
+        self.policy = policy
+        self.spill_path = spill_path
+        self.max_in_flight = max_in_flight
+        self.on_drop = on_drop
+        self._queue = deque()
+        self._queued = set()
+        self._in_flight = set()
+        self._counts = {'queued': 0, 'coalesced': 0, 'dropped': 0, 'spilled': 0}
+        self._condition = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="watch-intake", daemon=True)
+        self._thread.start()
+
+    def put(self, file_path: str):
+        """Queue a ready file; never blocks."""
+        spill = False
+        dropped = []
+        with self._condition:
+            if file_path in self._queued or file_path in self._in_flight:
+                self._count('coalesced')
+                return
+            if len(self._queue) >= self.max_size:
+                if self.policy == 'spill':
+                    spill = True
+                else:
+                    for _ in range(1 if self.policy == 'drop_oldest' else len(self._queue)):
+                        dropped.append(self._queue.popleft())
+                        self._queued.discard(dropped[-1])
+                    self._count('dropped', len(dropped))
+            if not spill:
+                self._queue.append(file_path)
+                self._queued.add(file_path)
+                self._count('queued')
+                self._condition.notify()
+        if spill:
+            self._spill(file_path)
+        if self.on_drop is not None:
+            for path in dropped + ([file_path] if spill else []):
+                self.on_drop(path)
+
+    def done(self, file_path: str):
+        """Mark a file handed to the callback as finished, letting the next one through."""
+        with self._condition:
+            self._in_flight.discard(file_path)
+            self._condition.notify()
+
+    def _spill(self, file_path: str):
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.spill_path)), exist_ok=True)
+            with open(self.spill_path, 'a', encoding='utf-8') as f:
+                f.write(file_path + '\n')
+        except OSError as e:
+            print(f"Error spilling {file_path}: {e}")
+            with self._condition:
+                self._count('dropped')
+            return
+        with self._condition:
+            self._count('spilled')
+
+    def _count(self, name: str, amount: int = 1):
+        # Called with the condition held
+        self._counts[name] += amount
+        metrics.inc(f"watch_{name}", amount)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._running and (not self._queue or (self.max_in_flight is not None
+                                                              and len(self._in_flight) >= self.max_in_flight)):
+                    self._condition.wait()
+                if not self._running:
+                    return
+                file_path = self._queue.popleft()
+                self._queued.discard(file_path)
+                if self.max_in_flight is not None:
+                    self._in_flight.add(file_path)
+            try:
+                self.callback(file_path)
+            except Exception as e:
+                print(f"Error handing on {file_path}: {e}")
+                self.done(file_path)
+
+    def stats(self) -> Dict[str, int]:
+        with self._condition:
+            return dict(self._counts, waiting=len(self._queue), in_flight=len(self._in_flight))
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        self._thread.join(timeout=1.0)
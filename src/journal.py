@@ -0,0 +1,183 @@
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from metrics import metrics
+
+# Job states, in the order a screenshot goes through them
+DETECTED = 'detected'
+OCR_DONE = 'ocr_done'
+DELIVERED = 'delivered'
+DISCARDED = 'discarded'  # Cancelled, dropped by the intake queue or deleted before it was done
+FINISHED = (DELIVERED, DISCARDED)
+
+class JobJournal:
+    """Append-only log of what happened to every screenshot, so a restart resumes where the last run stopped.
+
+    Each state change is one JSON line, written through to the OS before the
+    call returns, so a process killed with os._exit or a crash loses nothing;
+    set fsync to also survive a power cut. A torn last line is ignored on
+    load. On startup reconcile() returns the jobs to resume: files detected
+    but never delivered, and files that appeared in the watched directories
+    while nothing was running. The log is rewritten with only the jobs still
+    needed after every compact_every records.
+
+    Files newer than the 'since' watermark that the journal does not know
+    are taken as missed. Compaction keeps finished jobs detected less than
+    margin seconds before the new watermark, covering files that were still
+    being written (and not yet journaled) when it ran.
+    """
+
+    def __init__(self, path: str, fsync: bool = False, compact_every: int = 1000, margin: float = 60.0):
+        self.path = path
+        self.fsync = fsync
+        self.compact_every = compact_every
+        self.margin = margin
+        self.since: Optional[float] = None
+        self._jobs: Dict[str, Tuple[str, float]] = {}  # path -> (state, detected at)
+        self._appended = 0
+        self._compacted = 0  # Records left by the last compaction
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._load()
+        self._file = open(path, 'a', encoding='utf-8')
+        if self.since is None:
+            # A new journal: screenshots already in the directories are not jobs
+            self.since = time.time()
+            self._write({'e': 'since', 't': self.since})
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        event, timestamp = record['e'], record['t']
+                    except (ValueError, KeyError, TypeError):
+                        # Torn write from a crash
+                        continue
+                    self._appended += 1
+                    if event == 'since':
+                        self.since = timestamp
+                    elif event == DETECTED:
+                        self._jobs[record['p']] = (DETECTED, timestamp)
+                    elif record.get('p') in self._jobs:
+                        self._jobs[record['p']] = (event, self._jobs[record['p']][1])
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Error reading job journal {self.path}: {e}")
+
+    def _write(self, record: Dict):
+        # Called with the lock held
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self._appended += 1
+
+    def record(self, file_path: str, state: str):
+        """Log a state change; a file detected again starts a new job."""
+        now = time.time()
+        with self._lock:
+            if state == DETECTED:
+                self._jobs[file_path] = (DETECTED, now)
+            elif file_path in self._jobs:
+                self._jobs[file_path] = (state, self._jobs[file_path][1])
+            else:
+                return
+            try:
+                self._write({'p': file_path, 'e': state, 't': round(now, 3)})
+            except OSError as e:
+                print(f"Error writing job journal {self.path}: {e}")
+            if self._appended - self._compacted >= self.compact_every:
+                self._compact()
+        metrics.inc(f"journal_{state}")
+
+    def state(self, file_path: str) -> Optional[str]:
+        with self._lock:
+            job = self._jobs.get(file_path)
+            return job[0] if job else None
+
+    def pending(self) -> List[Tuple[str, str]]:
+        """(path, state) of the unfinished jobs, oldest first."""
+        with self._lock:
+            jobs = sorted(self._jobs.items(), key=lambda item: item[1][1])
+            return [(path, state) for path, (state, _) in jobs if state not in FINISHED]
+
+    def reconcile(self, roots: Sequence[str], wanted: Callable[[str], bool], recursive: bool = False) -> List[str]:
+        """Return the files to process again: unfinished jobs, then files missed while not running."""
+        resume = []
+        for file_path, _ in self.pending():
+            if os.path.isfile(file_path):
+                resume.append(file_path)
+            else:
+                self.record(file_path, DISCARDED)
+
+        with self._lock:
+            known, since = set(self._jobs), self.since
+        missed = []
+        for root in roots:
+            for directory, _, names in (os.walk(root) if recursive else [(root, None, os.listdir(root))]):
+                for name in names:
+                    file_path = os.path.join(directory, name)
+                    if file_path in known or not wanted(file_path):
+                        continue
+                    try:
+                        modified = os.path.getmtime(file_path)
+                    except OSError:
+                        continue
+                    if modified > since and os.path.isfile(file_path):
+                        missed.append((modified, file_path))
+        for _, file_path in sorted(missed):
+            self.record(file_path, DETECTED)
+            resume.append(file_path)
+
+        with self._lock:
+            self._compact()
+        if resume:
+            print(f"Resuming {len(resume)} screenshot(s) from the last run ({len(missed)} missed while stopped)")
+        return resume
+
+    def _compact(self):
+        """Rewrite the journal with only the jobs still needed; called with the lock held."""
+        since = time.time() - self.margin
+        if self.since is not None:
+            since = max(since, self.since)
+        jobs = {path: job for path, job in self._jobs.items() if job[0] not in FINISHED or job[1] >= since}
+        temp_path = f"{self.path}.tmp"
+        lines = 1
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(json.dumps({'e': 'since', 't': since}) + '\n')
+                for path, (state, detected) in jobs.items():
+                    f.write(json.dumps({'p': path, 'e': DETECTED, 't': detected}, ensure_ascii=False) + '\n')
+                    lines += 1
+                    if state != DETECTED:
+                        f.write(json.dumps({'p': path, 'e': state, 't': detected}, ensure_ascii=False) + '\n')
+                        lines += 1
+                f.flush()
+                os.fsync(f.fileno())
+            self._file.close()
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"Error compacting job journal {self.path}: {e}")
+            return
+        finally:
+            if self._file.closed:
+                self._file = open(self.path, 'a', encoding='utf-8')
+        self._jobs = jobs
+        self.since = since
+        self._appended = self._compacted = lines
+        metrics.inc('journal_compactions')
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            states = [state for state, _ in self._jobs.values()]
+            return {'jobs': len(states), 'pending': sum(1 for state in states if state not in FINISHED),
+                    'records': self._appended, 'since': self.since}
+
+    def close(self):
+        with self._lock:
+            self._file.close()
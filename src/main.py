@@ -1,8 +1,13 @@
 import os
 import tkinter as tk
-from ocr_service import OCRService
+from image_store import ImageStore
+from services import build_ocr_backend
 from ui import OCRUI
-from config import load_config
+from history import HistoryIndex
+from journal import JobJournal
+from memory import memory
+from config import (load_config, DECODE_MAX_SIDE, HISTORY_ENABLED, HISTORY_DB, JOURNAL_ENABLED, JOURNAL_PATH,
+                    JOURNAL_FSYNC, JOURNAL_COMPACT_EVERY, JOURNAL_MARGIN, MEMORY_TRACE_FRAMES, MEMORY_REPORT_FILE)
 import sys
 import atexit
 
@@ -25,17 +30,31 @@ def main():
         config = load_config()
         print("Configuration loaded successfully")
         
+        # Trace allocations from the start if asked to; kill -USR1 writes a memory report
+        if MEMORY_TRACE_FRAMES:
+            memory.start(MEMORY_TRACE_FRAMES)
+        memory.report_on_signal(MEMORY_REPORT_FILE)
+        
         # Create root window
         root = tk.Tk()
         root.withdraw()  # Hide the root window
         print("Root window created")
         
-        # Create OCR service
-        ocr_service = OCRService(config['api_key'])
-        print("OCR service initialized")
+        # Decoded screenshots shared between the UI and the OCR service
+        image_store = ImageStore(DECODE_MAX_SIDE)
+        
+        # Searchable history of every result
+        history = HistoryIndex(HISTORY_DB) if HISTORY_ENABLED else None
+        
+        # Job journal, so screenshots left unfinished by a crash or exit are resumed
+        journal = (JobJournal(JOURNAL_PATH, JOURNAL_FSYNC, JOURNAL_COMPACT_EVERY, JOURNAL_MARGIN)
+                   if JOURNAL_ENABLED else None)
+        
+        # Create OCR backend
+        ocr_backend = build_ocr_backend(config['api_key'], image_store, history)
         
         # Create UI with watch directory
-        app = OCRUI(root, ocr_service, config['web_presets'], config['watch_dir'])
+        app = OCRUI(root, ocr_backend, config['web_presets'], config['watch_dirs'], image_store, history, journal)
         print("UI created successfully")
         
         # Start the application
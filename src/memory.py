@@ -0,0 +1,178 @@
+import gc
+import json
+import os
+import signal
+import sys
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional
+from metrics import Histogram
+
+# Upper bounds in bytes for the allocation peak of one OCR job
+JOB_PEAK_BUCKETS = tuple(2 ** power for power in range(16, 31, 2))  # 64 KiB up to 1 GiB
+# Objects counted by live_objects(), by the module that defines them; modules never imported are skipped
+LIVE_TYPES = (('PIL.Image', 'Image'), ('PIL.ImageTk', 'PhotoImage'), ('image_store', 'SharedImage'),
+              ('tkinter', 'Toplevel'), ('tkinter', 'PhotoImage'))
+# Allocations made by the tracing itself are left out of snapshots
+_SNAPSHOT_FILTERS = (tracemalloc.Filter(False, tracemalloc.__file__),
+                     tracemalloc.Filter(False, '<frozen importlib._bootstrap*>'))
+
+def rss_bytes() -> Optional[int]:
+    """Resident set size of this process now, or None where /proc is not available."""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+def peak_rss_bytes() -> Optional[int]:
+    """Largest resident set size this process has had, or None on Windows."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+class MemoryMonitor:
+    """Memory figures for a process that stays up all day.
+
+    stats() is cheap enough for every /stats request: resident size, what
+    tracemalloc traces, the allocation peak of OCR jobs and gauges that
+    components register (previews kept, results in the tray, decoded images
+    held). report() adds a count of live images and windows found by walking
+    the garbage collector's objects, and with snapshot=True a tracemalloc
+    snapshot: the top allocation sites and their growth since the previous
+    snapshot. Tracing starts with start(), at launch with OCR_TRACEMALLOC or
+    on the first snapshot asked for; until then job peaks are not measured.
+
+    Job peaks come from the process-wide tracemalloc peak, which is reset when
+    a job starts with no other job running, so with jobs overlapping each
+    one's figure includes what the others allocated meanwhile.
+    """
+
+    def __init__(self):
+        self._gauges: Dict[str, Callable[[], object]] = {}
+        self._job_peaks = Histogram(JOB_PEAK_BUCKETS)
+        self._active_jobs = 0
+        self._last_snapshot: Optional[tracemalloc.Snapshot] = None
+        self._lock = threading.Lock()
+
+    def start(self, frames: int = 1):
+        """Start tracing allocations, keeping frames stack frames per allocation."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+
+    def stop(self):
+        tracemalloc.stop()
+        with self._lock:
+            self._last_snapshot = None
+
+    def gauge(self, name: str, func: Callable[[], object]):
+        """Report func() under name in stats(), e.g. the number of previews kept."""
+        with self._lock:
+            self._gauges[name] = func
+
+    @contextmanager
+    def job(self) -> Iterator[None]:
+        """Record the allocation peak of the enclosed OCR job while tracing."""
+        if not tracemalloc.is_tracing():
+            yield
+            return
+        with self._lock:
+            if not self._active_jobs:
+                tracemalloc.reset_peak()
+            self._active_jobs += 1
+            start = tracemalloc.get_traced_memory()[0]
+        try:
+            yield
+        finally:
+            peak = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else start
+            with self._lock:
+                self._active_jobs -= 1
+                self._job_peaks.observe(max(0, peak - start))
+
+    def stats(self) -> Dict:
+        """Resident size, traced memory, job peaks and the registered gauges."""
+        with self._lock:
+            gauges = dict(self._gauges)
+            job_peaks = self._job_peaks.snapshot()
+        stats = {'rss': rss_bytes(), 'peak_rss': peak_rss_bytes(), 'tracing': tracemalloc.is_tracing()}
+        if stats['tracing']:
+            stats['traced'], stats['traced_peak'] = tracemalloc.get_traced_memory()
+        del job_peaks['buckets']
+        stats['job_peak'] = job_peaks
+        for name, func in gauges.items():
+            try:
+                stats[name] = func()
+            except Exception as e:
+                stats[name] = f"error: {e}"
+        return stats
+
+    @staticmethod
+    def live_objects() -> Dict[str, int]:
+        """Count live instances of LIVE_TYPES; walks every object, so only on request."""
+        types = {}
+        for module_name, name in LIVE_TYPES:
+            cls = getattr(sys.modules.get(module_name), name, None)
+            if isinstance(cls, type):
+                types[f"{module_name}.{name}"] = cls
+        counts = dict.fromkeys(types, 0)
+        for obj in gc.get_objects():
+            for key, cls in types.items():
+                if isinstance(obj, cls):
+                    counts[key] += 1
+        return counts
+
+    def snapshot(self, limit: int = 15) -> Dict:
+        """Top allocation sites now and their growth since the last snapshot; starts tracing if needed."""
+        if not tracemalloc.is_tracing():
+            self.start()
+            return {'tracing': 'started, ask again for a snapshot'}
+        snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+        with self._lock:
+            previous, self._last_snapshot = self._last_snapshot, snapshot
+
+        def site(stat) -> Dict:
+            frame = stat.traceback[0]
+            entry = {'site': f"{frame.filename}:{frame.lineno}", 'bytes': stat.size, 'count': stat.count}
+            if hasattr(stat, 'size_diff'):
+                entry.update(bytes_diff=stat.size_diff, count_diff=stat.count_diff)
+            return entry
+
+        result = {'top': [site(stat) for stat in snapshot.statistics('lineno')[:limit]]}
+        if previous is not None:
+            result['growth'] = [site(stat) for stat in snapshot.compare_to(previous, 'lineno')[:limit]]
+        return result
+
+    def report(self, snapshot: bool = False, limit: int = 15) -> Dict:
+        """stats() plus live object counts, and a tracemalloc snapshot if asked for."""
+        report = self.stats()
+        report['live'] = self.live_objects()
+        if snapshot:
+            report['snapshot'] = self.snapshot(limit)
+        return report
+
+    def write_report(self, path: str, snapshot: bool = True):
+        """Write report() as JSON to path."""
+        data = json.dumps(self.report(snapshot), indent=2)
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            print(f"Memory report written to {path}")
+        except OSError as e:
+            print(f"Error writing memory report: {e}")
+
+    def report_on_signal(self, path: str):
+        """Write a report with a snapshot to path on SIGUSR1, where the platform has it."""
+        if not hasattr(signal, 'SIGUSR1'):
+            return
+        # Written on its own thread: the handler may interrupt code holding the gauges' locks
+        signal.signal(signal.SIGUSR1, lambda signum, frame: threading.Thread(
+            target=self.write_report, args=(path,), name="memory-report", daemon=True).start())
+
+# Process-wide monitor used by the pipeline modules
+memory = MemoryMonitor()
@@ -0,0 +1,159 @@
+import json
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Sequence
+from config import METRICS_LOG
+
+# Upper bounds in seconds, from fast image operations up to slow API calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class Histogram:
+    """Fixed-bucket latency histogram, cheap enough to update on every stage."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last slot counts values above every bound
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, fraction: float) -> Optional[float]:
+        """Estimate a quantile by interpolating inside the bucket that holds it."""
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.max
+                return min(self.max, lower + (upper - lower) * (rank - seen) / count)
+            seen += count
+        return self.max
+
+    def snapshot(self) -> Dict:
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        buckets['+Inf'] = self.count
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'max': round(self.max, 6),
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'buckets': buckets
+        }
+
+class MetricsRegistry:
+    """Per-stage timings and event counters shared by the whole pipeline.
+
+    Stages are timed with `with metrics.timer('decode'):` or recorded with
+    observe(); counters with inc(). When log_path is set every observation is
+    also appended there as one JSON object per line ('-' means stderr).
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS, log_path: Optional[str] = None):
+        self.buckets = tuple(buckets)
+        self.log_path = log_path
+        self.started_at = time.time()
+        self._histograms: Dict[str, Histogram] = {}
+        self._counters: Dict[str, float] = {}
+        self._log_file = None
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float, **fields):
+        """Record one duration for stage; extra fields only go to the structured log."""
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram(self.buckets)
+            histogram.observe(seconds)
+        if self.log_path:
+            self._log(dict(fields, stage=stage, seconds=round(seconds, 6)))
+
+    @contextmanager
+    def timer(self, stage: str, **fields) -> Iterator[None]:
+        """Time the enclosed block as one observation of stage, also when it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, **fields)
+
+    def inc(self, name: str, amount: float = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def _log(self, record: Dict):
+        record['ts'] = round(time.time(), 6)
+        line = json.dumps(record, ensure_ascii=False, default=str) + '\n'
+        with self._lock:
+            try:
+                if self._log_file is None:
+                    # Opened on first use so importing this module has no side effects
+                    self._log_file = sys.stderr if self.log_path == '-' else open(self.log_path, 'a', encoding='utf-8')
+                self._log_file.write(line)
+                self._log_file.flush()
+            except OSError as e:
+                print(f"Error writing metrics log: {e}")
+                self.log_path = None
+
+    def snapshot(self) -> Dict:
+        """Return every counter and stage histogram as plain data."""
+        with self._lock:
+            return {
+                'uptime': round(time.time() - self.started_at, 1),
+                'counters': dict(self._counters),
+                'stages': {stage: histogram.snapshot() for stage, histogram in sorted(self._histograms.items())}
+            }
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self, prefix: str = 'screenshot_ocr') -> str:
+        """Render the snapshot in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = []
+        for name, value in sorted(snapshot['counters'].items()):
+            metric = f"{prefix}_{name}_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+
+        metric = f"{prefix}_stage_seconds"
+        lines.append(f"# TYPE {metric} histogram")
+        for stage, histogram in snapshot['stages'].items():
+            for bound, count in histogram['buckets'].items():
+                lines.append(f'{metric}_bucket{{stage="{stage}",le="{bound}"}} {count}')
+            lines.append(f'{metric}_sum{{stage="{stage}"}} {histogram["sum"]}')
+            lines.append(f'{metric}_count{{stage="{stage}"}} {histogram["count"]}')
+        return '\n'.join(lines) + '\n'
+
+    def write_snapshot(self, path: str):
+        """Write the snapshot to path, as Prometheus text for *.prom files and JSON otherwise."""
+        data = self.to_prometheus() if path.endswith('.prom') else self.to_json()
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(data)
+        except OSError as e:
+            print(f"Error writing metrics snapshot: {e}")
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self.started_at = time.time()
+
+# Process-wide registry used by the pipeline modules
+metrics = MetricsRegistry(log_path=METRICS_LOG)
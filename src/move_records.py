@@ -0,0 +1,73 @@
+import time
+from typing import Optional
+from metrics import metrics
+
+try:
+    from watchdog.observers.inotify import InotifyEmitter
+except ImportError:
+    # inotify is Linux only; the other backends keep no move records
+    InotifyEmitter = None
+
+# Seconds between clearing the rename sources watchdog's inotify backend keeps
+MOVE_RECORD_AGE = 60.0
+
+class UnsupportedWatchdog(RuntimeError):
+    """The installed watchdog's inotify backend no longer looks the way MoveRecordPruner expects."""
+
+def inotify_backends(emitter) -> list:
+    """The watchdog Inotify objects behind an emitter: none for other backends.
+
+    Raises UnsupportedWatchdog when an inotify emitter lacks the attributes
+    this relies on, so a watchdog upgrade that changes them is noticed.
+    """
+    if InotifyEmitter is None or not isinstance(emitter, InotifyEmitter):
+        return []
+    # None while the emitter's thread is not running
+    buffer = getattr(emitter, '_inotify', None)
+    if buffer is None:
+        return []
+    inotify = getattr(buffer, '_inotify', None)
+    if (inotify is None or not hasattr(getattr(inotify, '_lock', None), '__enter__')
+            or not callable(getattr(inotify, 'clear_move_records', None))):
+        raise UnsupportedWatchdog("watchdog's inotify backend has changed; move records are not cleared")
+    return [inotify]
+
+class MoveRecordPruner:
+    """Clears the rename sources watchdog's inotify backend never forgets.
+
+    It keeps every IN_MOVED_FROM event by cookie to pair it with its
+    IN_MOVED_TO and never lets go of them, so each temp-then-rename save
+    would otherwise keep an event for the life of the process. Both halves
+    of a rename are read together, and the records only move the watches of
+    renamed directories, so clearing them between reads loses nothing in
+    practice. clear_move_records() is called under the lock the backend
+    holds while it reads and records events.
+    """
+
+    def __init__(self, interval: float = MOVE_RECORD_AGE):
+        self.interval = interval
+        self._pruned_at = time.monotonic()
+        self._supported = True
+
+    def maybe_prune(self, observer: Optional[object]):
+        """Prune if interval seconds have passed since the last time."""
+        now = time.monotonic()
+        if observer is None or not self._supported or now - self._pruned_at < self.interval:
+            return
+        self._pruned_at = now
+        try:
+            self.prune(observer)
+        except UnsupportedWatchdog as e:
+            self._supported = False
+            metrics.inc('watch_move_records_unsupported')
+            print(f"Warning: {e}")
+
+    def prune(self, observer) -> int:
+        """Clear the move records of every inotify emitter of observer; returns how many were cleared."""
+        cleared = 0
+        for emitter in list(observer.emitters):
+            for inotify in inotify_backends(emitter):
+                with inotify._lock:
+                    inotify.clear_move_records()
+                cleared += 1
+        return cleared
@@ -0,0 +1,106 @@
+import contextvars
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional
+
+class OCRBackend(ABC):
+    """Something that turns an image file into text."""
+
+    name = 'backend'
+
+    @abstractmethod
+    def perform_ocr(self, file_path: str) -> Optional[Dict[str, str]]:
+        """Return {"text": ...} for the image, or None if no text was recognized."""
+
+    def is_available(self) -> bool:
+        """Whether the backend can be used in this environment."""
+        return True
+
+class RaceBackend(OCRBackend):
+    """Run several backends at once and return the first non-empty result."""
+
+    name = 'race'
+
+    def __init__(self, backends: List[OCRBackend]):
+        self.backends = backends
+        self.wins = {backend.name: 0 for backend in backends}
+        self._executor = ThreadPoolExecutor(max_workers=4 * len(backends), thread_name_prefix="ocr-race")
+
+    def perform_ocr(self, file_path: str) -> Optional[Dict[str, str]]:
+        # Each backend runs in a copy of the caller's context, keeping its priority lane
+        context = contextvars.copy_context()
+        futures = {self._executor.submit(context.copy().run, backend.perform_ocr, file_path): backend
+                   for backend in self.backends}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"{futures[future].name} OCR failed: {e}")
+                continue
+            if result:
+                # Losers keep running in the background; their results are discarded
+                self.wins[futures[future].name] += 1
+                return dict(result, backend=futures[future].name)
+        return None
+
+class FallbackBackend(OCRBackend):
+    """Try a fast backend first and fall back to another one when it is not good enough."""
+
+    name = 'fallback'
+
+    def __init__(self, primary: OCRBackend, fallback: OCRBackend,
+                 should_try: Optional[Callable[[str], bool]] = None,
+                 accept: Optional[Callable[[Dict[str, str]], bool]] = None):
+        self.primary = primary
+        self.fallback = fallback
+        self.should_try = should_try or (lambda file_path: True)
+        self.accept = accept or (lambda result: bool(result.get('text')))
+        self.primary_hits = 0
+        self.fallbacks = 0
+
+    def perform_ocr(self, file_path: str) -> Optional[Dict[str, str]]:
+        if self.should_try(file_path):
+            try:
+                result = self.primary.perform_ocr(file_path)
+            except Exception as e:
+                print(f"{self.primary.name} OCR failed: {e}")
+                result = None
+            if result and self.accept(result):
+                self.primary_hits += 1
+                return dict(result, backend=self.primary.name)
+
+        self.fallbacks += 1
+        result = self.fallback.perform_ocr(file_path)
+        return dict(result, backend=self.fallback.name) if result else None
+
+def image_pixels(file_path: str) -> int:
+    """Return width * height without decoding the image."""
+    from PIL import Image
+    with Image.open(file_path) as img:
+        return img.width * img.height
+
+def create_backend(mode: str, cloud: OCRBackend, local: Optional[OCRBackend],
+                   local_max_pixels: int, local_min_confidence: float) -> OCRBackend:
+    """Build the backend for an OCR_MODE of cloud, local, race or local_first."""
+    if mode != 'cloud' and (local is None or not local.is_available()):
+        print(f"Local OCR is not available, OCR mode '{mode}' falls back to cloud")
+        return cloud
+
+    if mode == 'local':
+        return local
+    if mode == 'race':
+        return RaceBackend([local, cloud])
+    if mode == 'local_first':
+        def small_enough(file_path: str) -> bool:
+            try:
+                return image_pixels(file_path) <= local_max_pixels
+            except OSError:
+                return False
+        return FallbackBackend(
+            local, cloud,
+            should_try=small_enough,
+            accept=lambda result: bool(result.get('text')) and result.get('confidence', 0) >= local_min_confidence
+        )
+    if mode != 'cloud':
+        print(f"Unknown OCR mode '{mode}', using cloud")
+    return cloud
@@ -0,0 +1,115 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Optional, Dict, List
+from ocr_service import OCRService
+from ocr_backend import OCRBackend
+from request_scheduler import LANES, current_lane, lane
+from ocr_job import current_job, jobs
+
+class OCRBatcher(OCRBackend):
+    """Group concurrent OCR calls into multi-image Vision API requests."""
+
+    name = 'cloud'
+
+    def __init__(self, ocr_service: OCRService, max_images: int, max_bytes: int, max_wait: float):
+        self.ocr_service = ocr_service
+        self.max_images = max_images
+        self.max_bytes = max_bytes
+        self.max_wait = max_wait
+        self.batches_sent = 0
+        self.images_sent = 0
+        self._queue = queue.Queue()
+        self._carry = None  # Item that did not fit into the previous batch
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="ocr-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, file_path: str) -> Future:
+        """Queue an image for the next batch and return a future for its result."""
+        future = Future()
+        cache_key, cached = self.ocr_service.lookup_cache(file_path)
+        if cached is not None:
+            future.set_result(cached)
+            return future
+
+        try:
+            # Encode on the calling thread so concurrent callers compress in parallel
+            content, scale = self.ocr_service.prepare_image(file_path)
+        except Exception as e:
+            print(f"Error preparing image for batch: {e}")
+            future.set_result(None)
+            return future
+
+        self._queue.put((cache_key, content, future, scale, current_lane(), current_job()))
+        return future
+
+    def perform_ocr(self, file_path: str) -> Optional[Dict[str, str]]:
+        """Perform OCR on image through the batch queue, blocking until done."""
+        return self.submit(file_path).result()
+
+    def _collect(self) -> List[tuple]:
+        """Wait for the first item, then gather more until a batch limit is hit."""
+        first = self._carry if self._carry is not None else self._queue.get()
+        self._carry = None
+        if first is None:
+            return []
+
+        batch = [first]
+        batch_bytes = len(first[1])
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_images:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._carry = None
+                self._running = False
+                break
+            if batch_bytes + len(item[1]) > self.max_bytes:
+                self._carry = item
+                break
+            batch.append(item)
+            batch_bytes += len(item[1])
+        return batch
+
+    def _run(self):
+        while self._running or self._carry is not None:
+            batch = self._collect()
+            if not batch:
+                break
+            self._send(batch)
+
+    def _send(self, batch: List[tuple]):
+        # Images whose jobs were cancelled while they waited are not sent
+        for item in batch:
+            if item[5] is not None and item[5].cancelled:
+                item[2].set_result(None)
+        batch = [item for item in batch if item[5] is None or not item[5].cancelled]
+        if not batch:
+            return
+
+        # A batch waits in the lane of its most urgent image
+        urgent = min((item[4] for item in batch), key=LANES.index)
+        try:
+            with lane(urgent), jobs(*[item[5] for item in batch]):
+                results = self.ocr_service.annotate_contents([item[1] for item in batch], [item[3] for item in batch])
+        except Exception as e:
+            print(f"Batch OCR failed: {e}")
+            results = [None] * len(batch)
+
+        self.batches_sent += 1
+        self.images_sent += len(batch)
+        for (cache_key, _, future, _, _, _), result in zip(batch, results):
+            self.ocr_service.store_cache(cache_key, result)
+            future.set_result(result)
+
+    def stop(self):
+        """Flush pending images and stop the batching thread."""
+        self._queue.put(None)
+        self._thread.join(timeout=self.max_wait + self.ocr_service.timeout)
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Iterable
+from text_layout import result_from_json, result_to_json
+
+class OCRCache:
+    """Persistent OCR result cache keyed by image content and OCR parameters."""
+
+    def __init__(self, cache_dir: str, max_bytes: int, max_age: float):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (size, last access time), oldest first
+        self._total_bytes = 0
+        self._indexed = False  # The directory is scanned on first use, not at startup
+        self._lock = threading.Lock()
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(file_path: str, params: Iterable) -> str:
+        """Hash the file content together with the OCR parameters."""
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        digest.update(json.dumps(list(params), sort_keys=True).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _load_index(self):
+        """Rebuild the in-memory LRU index from the files on disk. Call with the lock held."""
+        if self._indexed:
+            return
+        self._indexed = True
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.json'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, name[:-len('.json')], stat.st_size))
+
+        # Last access time is kept in the file mtime
+        for last_access, key, size in sorted(entries):
+            self._entries[key] = (size, last_access)
+            self._total_bytes += size
+        self._evict()
+
+    def get(self, key: str) -> Optional[Dict[str, str]]:
+        """Return the cached result for key, or None on a miss."""
+        with self._lock:
+            self._load_index()
+            entry = self._entries.get(key)
+            if entry is None or time.time() - entry[1] > self.max_age:
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+
+            try:
+                with open(self._entry_path(key), 'r', encoding='utf-8') as f:
+                    result = result_from_json(json.load(f))
+            except (OSError, ValueError, KeyError, TypeError):
+                self._remove(key)
+                self.misses += 1
+                return None
+
+            now = time.time()
+            self._entries[key] = (entry[0], now)
+            self._entries.move_to_end(key)
+            try:
+                os.utime(self._entry_path(key), (now, now))
+            except OSError:
+                pass
+            self.hits += 1
+            return result
+
+    def put(self, key: str, result: Dict[str, str]):
+        """Store a result and evict old entries if the cache is over budget."""
+        data = json.dumps(result_to_json(result)).encode('utf-8')
+        path = self._entry_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with self._lock:
+            self._load_index()
+            try:
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"Error writing OCR cache entry: {e}")
+                return
+
+            if key in self._entries:
+                self._total_bytes -= self._entries[key][0]
+            self._entries[key] = (len(data), time.time())
+            self._entries.move_to_end(key)
+            self._total_bytes += len(data)
+            self._evict()
+
+    def _remove(self, key: str):
+        size, _ = self._entries.pop(key)
+        self._total_bytes -= size
+        try:
+            os.remove(self._entry_path(key))
+        except OSError:
+            pass
+
+    def _evict(self):
+        """Drop expired entries, then least recently used ones until under max_bytes."""
+        cutoff = time.time() - self.max_age
+        while self._entries:
+            key, (_, last_access) = next(iter(self._entries.items()))
+            if last_access >= cutoff and self._total_bytes <= self.max_bytes:
+                break
+            self._remove(key)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters and current cache size."""
+        with self._lock:
+            self._load_index()
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._total_bytes
+            }
@@ -0,0 +1,95 @@
+import contextvars
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+class JobToken:
+    """Cancellation flag and API usage of one OCR job.
+
+    Every Vision API request made on the job's behalf, on whatever thread,
+    checks the flag before it is sent and charges the units it was billed.
+    A speculative job starts unconfirmed: side effects meant only for
+    results the user wants are held until confirm() and dropped by cancel().
+    """
+
+    def __init__(self, confirmed: bool = True):
+        self._cancelled = threading.Event()
+        self._confirmed = confirmed
+        self._deferred = []
+        self._units = 0.0
+        self._lock = threading.Lock()
+
+    def confirm(self):
+        with self._lock:
+            self._confirmed = True
+            deferred, self._deferred = self._deferred, []
+        for func in deferred:
+            func()
+
+    def cancel(self):
+        self._cancelled.set()
+        with self._lock:
+            self._deferred = []
+
+    def when_confirmed(self, func: Callable[[], None]):
+        """Call func now if the job is confirmed, on confirm() otherwise, and never if it is cancelled."""
+        with self._lock:
+            if self.cancelled:
+                return
+            if not self._confirmed:
+                self._deferred.append(func)
+                return
+        func()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def charge(self, units: float):
+        with self._lock:
+            self._units += units
+
+    @property
+    def units(self) -> float:
+        with self._lock:
+            return self._units
+
+_jobs = contextvars.ContextVar('ocr_jobs', default=())
+
+@contextmanager
+def jobs(*tokens: Optional[JobToken]) -> Iterator[None]:
+    """Run the OCR work in this block (and threads started from its context) for tokens' jobs.
+
+    A request carrying several images gives one token per image, None for
+    an image no job owns.
+    """
+    token = _jobs.set(tokens)
+    try:
+        yield
+    finally:
+        _jobs.reset(token)
+
+def current_job() -> Optional[JobToken]:
+    """The job the current single-image work is done for, if any."""
+    tokens = _jobs.get()
+    return tokens[0] if len(tokens) == 1 else None
+
+def cancelled() -> bool:
+    """Whether every job the current work is done for has been cancelled (False outside any job)."""
+    tokens = _jobs.get()
+    return bool(tokens) and all(token is not None and token.cancelled for token in tokens)
+
+def charge(units: int):
+    """Split billed units evenly over the current images' jobs."""
+    tokens = _jobs.get()
+    for token in tokens:
+        if token is not None:
+            token.charge(units / len(tokens))
+
+def when_confirmed(func: Callable[[], None]):
+    """Call func once the current job is confirmed; right away outside a job."""
+    token = current_job()
+    if token is None:
+        func()
+    else:
+        token.when_confirmed(func)
@@ -1,108 +1,409 @@
 import base64
+import contextvars
+import json
+import threading
 import time
-from typing import Optional, Dict
-import requests
-from PIL import Image
-import io
-from config import MAX_RETRIES, RETRY_DELAY, TIMEOUT, MAX_IMAGE_SIZE, IMAGE_QUALITY
-
-class OCRService:
-    def __init__(self, api_key: str):
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import TYPE_CHECKING, Optional, Dict, List, Tuple
+from config import (MAX_RETRIES, RETRY_DELAY, TIMEOUT, MAX_IMAGE_SIZE, IMAGE_QUALITY,
+                    OCR_FEATURE, LANGUAGE_HINTS, VISION_ENDPOINT, ADAPTIVE_ENCODING, ENCODE_MAX_SIDE, ENCODE_WEBP,
+                    RETRY_MAX_DELAY, HEDGE_ENABLED, HEDGE_MIN_SAMPLES, HEDGE_MIN_DELAY, HEDGE_MAX_RATIO,
+                    CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT, TRANSPORT_POOL_SIZE, TRANSPORT_GZIP,
+                    TRANSPORT_GZIP_MIN_BYTES)
+from ocr_cache import OCRCache
+from image_store import ImageStore, SharedImage
+from ocr_backend import OCRBackend
+from metrics import metrics
+from text_layout import TextLayout
+from retry_policy import (RETRYABLE_STATUS, backoff_delay, retry_after_seconds, LatencyTracker,
+                          CircuitBreaker)
+from request_scheduler import RequestScheduler
+from transport import VisionTransport, RequestBody
+from ocr_job import cancelled, charge
+from preprocess import PreprocessPool, encode_upload, upload_side
+
+if TYPE_CHECKING:
+    import requests
+
+def parse_words(annotations: List[Dict], scale: float = 1.0) -> List[list]:
+    """Turn word textAnnotations into [text, left, top, right, bottom] lists."""
+    words = []
+    for annotation in annotations:
+        vertices = annotation.get('boundingPoly', {}).get('vertices', [])
+        if not vertices or not annotation.get('description'):
+            continue
+        # The API leaves out coordinates that are 0
+        xs = [vertex.get('x', 0) for vertex in vertices]
+        ys = [vertex.get('y', 0) for vertex in vertices]
+        words.append([annotation['description'], round(min(xs) * scale), round(min(ys) * scale),
+                      round(max(xs) * scale), round(max(ys) * scale)])
+    return words
+
+class OCRService(OCRBackend):
+    """Google Cloud Vision OCR backend."""
+
+    name = 'cloud'
+
+    def __init__(self, api_key: str, cache: Optional[OCRCache] = None,
+                 image_store: Optional[ImageStore] = None, endpoint: str = VISION_ENDPOINT,
+                 adaptive_encoding: bool = ADAPTIVE_ENCODING, scheduler: Optional[RequestScheduler] = None,
+                 transport: Optional[VisionTransport] = None, preprocess: Optional[PreprocessPool] = None):
         self.api_key = api_key
-        self.session = requests.Session()
         self.max_retries = MAX_RETRIES
         self.retry_delay = RETRY_DELAY
         self.timeout = TIMEOUT
+        self.cache = cache
+        self.image_store = image_store
+        self.endpoint = endpoint
+        self.adaptive_encoding = adaptive_encoding
+        self.retry_max_delay = RETRY_MAX_DELAY
+        self.hedge_enabled = HEDGE_ENABLED
+        self.hedge_min_delay = HEDGE_MIN_DELAY
+        self.latency = LatencyTracker()
+        self.breaker = CircuitBreaker(CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT)
+        # Without a scheduler requests are only counted, never delayed
+        self.scheduler = scheduler or RequestScheduler()
+        # Without a transport connections are pooled but not warmed up or kept alive
+        self.transport = transport or VisionTransport(endpoint, TRANSPORT_POOL_SIZE, compress=TRANSPORT_GZIP,
+                                                      compress_min_bytes=TRANSPORT_GZIP_MIN_BYTES)
+        # Without a preprocessing pool images are encoded on the calling thread
+        self.preprocess = preprocess
+        self._hedge_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="ocr-hedge")
+        self._stats = {'requests': 0, 'retries': 0, 'hedges': 0, 'hedge_wins': 0}
+        self._stats_lock = threading.Lock()
+
+    @property
+    def session(self):
+        """HTTP session of the transport, created on first request."""
+        return self.transport.session
+
+    def _cache_params(self) -> list:
+        """OCR parameters that change the result for the same image bytes."""
+        # 'layout': results carry a TextLayout, older entries do not
+        if self.adaptive_encoding:
+            return [OCR_FEATURE, LANGUAGE_HINTS, MAX_IMAGE_SIZE, IMAGE_QUALITY, 'adaptive', ENCODE_MAX_SIDE, ENCODE_WEBP,
+                    'layout']
+        return [OCR_FEATURE, LANGUAGE_HINTS, MAX_IMAGE_SIZE, IMAGE_QUALITY, 'layout']
 
     def compress_image(self, file_path: str) -> bytes:
         """Compress image before sending to API."""
+        return self._compress(file_path)[0]
+
+    def _compress(self, file_path: str) -> Tuple[bytes, float]:
+        """Return the upload bytes and the original-to-uploaded scale factor."""
+        handle = self.image_store.get(file_path) if self.image_store else None
         try:
-            with Image.open(file_path) as img:
-                # Convert to RGB if necessary
-                if img.mode in ('RGBA', 'P'):
-                    img = img.convert('RGB')
-                
-                # Calculate new size while maintaining aspect ratio
-                ratio = min(MAX_IMAGE_SIZE / img.width, MAX_IMAGE_SIZE / img.height)
-                new_size = (int(img.width * ratio), int(img.height * ratio))
-                
-                # Resize image
-                img = img.resize(new_size, Image.Resampling.LANCZOS)
-                
-                # Save to bytes with compression
-                output = io.BytesIO()
-                img.save(output, format='JPEG', quality=IMAGE_QUALITY, optimize=True)
-                return output.getvalue()
+            if self.preprocess is not None:
+                # Off the GIL in a worker process, from the shared decode if there is one
+                return self.preprocess.encode(file_path, self.adaptive_encoding, handle)
+            if handle is None:
+                # Nobody else needs this image, decode a private copy
+                handle = SharedImage(file_path, upload_side(self.adaptive_encoding))
+                encoded = encode_upload(handle, self.adaptive_encoding)
+                handle.release()
+                return encoded
+            return encode_upload(handle, self.adaptive_encoding)
                 
         except Exception as e:
             print(f"Error compressing image: {e}")
             # Return original file if compression fails
             with open(file_path, 'rb') as f:
-                return f.read()
+                return f.read(), 1.0
+
+    def cache_key(self, file_path: str) -> Optional[str]:
+        """Return the cache key for an image, or None without a cache."""
+        if not self.cache:
+            return None
+        try:
+            return OCRCache.make_key(file_path, self._cache_params())
+        except OSError as e:
+            print(f"Error hashing image for cache: {e}")
+            return None
+
+    def lookup_cache(self, file_path: str, count_miss: bool = True) -> Tuple[Optional[str], Optional[Dict[str, str]]]:
+        """Return the cache key for an image and its cached result, if any.
+
+        count_miss=False leaves a miss to be counted by whoever OCRs the image.
+        """
+        cache_key = self.cache_key(file_path)
+        if cache_key is None:
+            return None, None
+
+        result = self.cache.get(cache_key)
+        if result is not None:
+            metrics.inc('cache_hits')
+            print(f"OCR cache hit: {file_path}")
+        elif count_miss:
+            metrics.inc('cache_misses')
+        return cache_key, result
+
+    def store_cache(self, cache_key: Optional[str], result: Optional[Dict[str, str]]):
+        """Remember a successful result under its cache key."""
+        if self.cache and cache_key and result:
+            self.cache.put(cache_key, result)
+
+    def encode_image(self, file_path: str) -> str:
+        """Compress an image and return it base64 encoded for the API."""
+        return self.prepare_image(file_path)[0]
+
+    def prepare_image(self, file_path: str) -> Tuple[str, float]:
+        """Return the base64 upload content and the factor that maps its coordinates to the original."""
+        image_data, scale = self._compress(file_path)
+        return self.encode_bytes(image_data), scale
+
+    @staticmethod
+    def encode_bytes(image_data: bytes) -> str:
+        metrics.inc('upload_bytes', len(image_data))
+        with metrics.timer('base64'):
+            return base64.b64encode(image_data).decode('utf-8')
 
     def perform_ocr(self, file_path: str) -> Optional[Dict[str, str]]:
-        """Perform OCR on image with retry mechanism."""
+        """Perform OCR on image, serving repeated images from the cache."""
+        return self.perform_ocr_batch([file_path])[0]
+
+    def perform_ocr_batch(self, file_paths: List[str]) -> List[Optional[Dict[str, str]]]:
+        """Perform OCR on several images with a single API request."""
+        results = [None] * len(file_paths)
+        pending = []
+        for index, file_path in enumerate(file_paths):
+            cache_key, cached = self.lookup_cache(file_path)
+            if cached is not None:
+                results[index] = cached
+            else:
+                pending.append((index, cache_key) + self.prepare_image(file_path))
+
+        if pending:
+            annotated = self.annotate_contents([content for _, _, content, _ in pending],
+                                               [scale for _, _, _, scale in pending])
+            for (index, cache_key, _, _), result in zip(pending, annotated):
+                self.store_cache(cache_key, result)
+                results[index] = result
+        return results
+
+    def _build_request(self, content: str) -> Dict:
+        """Build one entry of the images:annotate requests array."""
+        return {
+            "image": {
+                "content": content
+            },
+            "features": [
+                {
+                    "type": OCR_FEATURE,
+                    "maxResults": 1
+                }
+            ],
+            "imageContext": {
+                "languageHints": LANGUAGE_HINTS
+            }
+        }
+
+    def _parse_response(self, response: Dict, scale: float = 1.0,
+                        keep_empty: bool = False) -> Optional[Dict[str, str]]:
+        """Extract the text result from one entry of the responses array.
+
+        Word boxes are scaled by scale so the layout is in original image pixels.
+        An image without text gives None, or an empty result with keep_empty.
+        """
+        if 'error' in response:
+            print(f"API Error for image: {response['error'].get('message', response['error'])}")
+            return None
+
+        # Get text from textAnnotations
+        if 'textAnnotations' in response and response['textAnnotations']:
+            text = response['textAnnotations'][0].get('description', '')
+            
+            if text:
+                # Clean up the text
+                text = ' '.join(text.split())  # Remove extra whitespace
+                layout = TextLayout.from_words(parse_words(response['textAnnotations'][1:], scale))
+                return {"text": text, "layout": layout}
+
+        if keep_empty:
+            return {"text": "", "layout": TextLayout.from_words(())}
+        print("No text found in the image")
+        return None
+
+    def annotate_contents(self, contents: List[str], scales: Optional[List[float]] = None,
+                          keep_empty: bool = False) -> List[Optional[Dict[str, str]]]:
+        """Send base64 encoded images in one request and return a result per image.
+
+        scales maps each image's word boxes back to original pixels (default 1).
+        With keep_empty an image without text gets an empty result, so None
+        only means it could not be OCR'd.
+        """
+        import requests
+        results = [None] * len(contents)
+        if not self.breaker.allow():
+            print("Vision API circuit breaker is open, failing fast")
+            return results
+
+        # Serialize and compress once; retries and hedged copies reuse the same body
+        payload = {"requests": [self._build_request(content) for content in contents]}
+        body = self.transport.encode_body(json.dumps(payload).encode('utf-8'))
+        url = f'{self.endpoint}?key={self.api_key}'
+
         for attempt in range(self.max_retries):
+            retry_after = None
+            if cancelled():
+                # Nobody wants the result any more; stop before sending (or resending) it
+                metrics.inc('api_cancelled')
+                self.breaker.release()
+                return results
+            # Every attempt counts against the rate limits; waits in the caller's priority lane
+            if not self.scheduler.acquire(len(contents)):
+                print(f"Vision API budget of {self.scheduler.period_limit} units this month is used up")
+                self.breaker.release()
+                return results
             try:
-                # Compress image before sending
-                image_data = self.compress_image(file_path)
-                content = base64.b64encode(image_data).decode('utf-8')
-                
-                # Use only TEXT_DETECTION (free feature)
-                payload = {
-                    "requests": [{
-                        "image": {
-                            "content": content
-                        },
-                        "features": [
-                            {
-                                "type": "TEXT_DETECTION",
-                                "maxResults": 1
-                            }
-                        ],
-                        "imageContext": {
-                            "languageHints": ["en"]
-                        }
-                    }]
-                }
-                
-                url = f'https://vision.googleapis.com/v1/images:annotate?key={self.api_key}'
-                response = self.session.post(url, json=payload, timeout=self.timeout)
+                response = self._post_hedged(url, body, len(contents))
                 
                 # Log the response for debugging
-                print(f"API Response Status: {response.status_code}")
-                if response.status_code != 200:
-                    print(f"API Error Response: {response.text}")
-                
-                response.raise_for_status()
-                
-                data = response.json()
-                
-                # Process the response to get the text result
-                if 'responses' in data and data['responses']:
-                    response = data['responses'][0]
+                print(f"API Response Status: {response.status_code} ({len(contents)} image(s))")
+                plain = self.transport.plain_body(body, response.status_code)
+                if plain is not None:
+                    # Compressed bodies refused: send this one again plain, paced and counted like any attempt
+                    body = plain
+                    continue
+                if response.status_code == 200:
+                    with metrics.timer('json_parse', images=len(contents)):
+                        data = response.json()
+                    self.breaker.record_success()
+                    self.scheduler.succeeded()
                     
-                    # Get text from textAnnotations
-                    if 'textAnnotations' in response and response['textAnnotations']:
-                        text = response['textAnnotations'][0].get('description', '')
-                        
-                        if text:
-                            # Clean up the text
-                            text = ' '.join(text.split())  # Remove extra whitespace
-                            return {"text": text}
-                        else:
-                            print("No text found in the image")
-                            return None
-                
-                return None
+                    # Split the responses back to each image
+                    for index, image_response in enumerate(data.get('responses', [])[:len(contents)]):
+                        results[index] = self._parse_response(image_response, scales[index] if scales else 1.0,
+                                                              keep_empty)
+                    return results
+
+                metrics.inc('api_errors')
+
+                print(f"API Error Response: {response.text}")
+                if response.status_code not in RETRYABLE_STATUS:
+                    # Bad request, bad key or quota settings: retrying won't help, but a 4xx
+                    # means the API is up, so the breaker must not stay half open
+                    if response.status_code < 500:
+                        self.breaker.record_success()
+                    else:
+                        self.breaker.record_failure()
+                    return results
+                retry_after = retry_after_seconds(response.headers.get('Retry-After'))
+                if retry_after is not None:
+                    # A worker (and the scheduler) never waits longer than a backoff would
+                    retry_after = min(retry_after, self.retry_max_delay)
+                if response.status_code == 429:
+                    self.scheduler.throttled(retry_after)
                 
+            except ValueError as e:
+                # Caught first: requests' JSONDecodeError (a garbled body) and its bad URL
+                # errors are RequestExceptions too, and retrying them won't help
+                print(f"OCR processing failed: {e}")
+                self.breaker.record_failure()
+                return results
             except requests.exceptions.RequestException as e:
+                metrics.inc('api_errors')
                 print(f"API request failed (attempt {attempt + 1}/{self.max_retries}): {e}")
-                if attempt < self.max_retries - 1:
-                    time.sleep(self.retry_delay * (attempt + 1))
-                continue
-            except Exception as e:
-                print(f"OCR processing failed: {e}")
-                return None
+
+            self.breaker.record_failure()
+            if attempt == self.max_retries - 1 or not self.breaker.allow():
+                break
+            delay = retry_after if retry_after is not None else backoff_delay(attempt, self.retry_delay, self.retry_max_delay)
+            self._count('retries')
+            time.sleep(delay)
         
-        return None 
\ No newline at end of file
+        # Out of attempts right after a plain resend was due; the probe was never answered
+        self.breaker.release()
+        return results
+
+    def _post(self, url: str, body: RequestBody, units: int) -> 'requests.Response':
+        """POST one request of units images; record its latency and billed units when it succeeds.
+
+        The units must have been acquired from the scheduler; their reservation
+        is settled here whatever the outcome.
+        """
+        start = time.monotonic()
+        metrics.inc('api_requests')
+        try:
+            response = self.transport.post(url, body, self.timeout)
+        except BaseException:
+            self.scheduler.release(units)
+            raise
+        elapsed = time.monotonic() - start
+        metrics.observe('http', elapsed, status=response.status_code, bytes=len(body.data))
+        if response.status_code == 200:
+            self.latency.record(elapsed)
+            self.scheduler.record_units(units)
+            charge(units)
+        else:
+            self.scheduler.release(units)
+        return response
+
+    def _hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before sending a hedged copy, or None to not hedge."""
+        if not self.hedge_enabled or len(self.latency) < HEDGE_MIN_SAMPLES:
+            return None
+        if self.scheduler.factor < 1.0:
+            # Recently rate limited: a second copy would only add to the load
+            return None
+        with self._stats_lock:
+            if self._stats['hedges'] >= HEDGE_MAX_RATIO * max(1, self._stats['requests']):
+                return None
+        return max(self.hedge_min_delay, self.latency.percentile(0.95))
+
+    def _post_hedged(self, url: str, body: RequestBody, units: int) -> 'requests.Response':
+        """Send the request, plus a second copy if the first is slower than the p95 latency."""
+        self._count('requests')
+        delay = self._hedge_delay()
+        if delay is None:
+            return self._post(url, body, units)
+
+        # Both copies charge the caller's job, so they run in its context
+        context = contextvars.copy_context()
+        first = self._hedge_executor.submit(context.copy().run, self._post, url, body, units)
+        done, _ = wait([first], timeout=delay)
+        if done:
+            return first.result()
+
+        if cancelled():
+            return first.result()
+        if not self.scheduler.try_acquire(units):
+            # The copy counts against the rate limits too; only send it if nothing has to wait for it
+            metrics.inc('hedges_paced')
+            return first.result()
+
+        import requests
+        self._count('hedges')
+        second = self._hedge_executor.submit(context.copy().run, self._post, url, body, units)
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    response = future.result()
+                except requests.exceptions.RequestException as e:
+                    error = e
+                    continue
+                if future is second:
+                    self._count('hedge_wins')
+                # The slower copy finishes in the background and is ignored
+                return response
+        raise error
+
+    def _count(self, name: str):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def stats(self) -> Dict[str, float]:
+        """Return request, retry and hedge counters plus tail latency in seconds."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['circuit_state'] = self.breaker.state
+        stats['circuit_opened'] = self.breaker.times_opened
+        stats['scheduler'] = self.scheduler.stats()
+        stats['transport'] = self.transport.stats()
+        if self.preprocess is not None:
+            stats['preprocess'] = self.preprocess.stats()
+        for name, fraction in (('latency_p50', 0.5), ('latency_p95', 0.95), ('latency_p99', 0.99)):
+            stats[name] = self.latency.percentile(fraction)
+        return stats
@@ -0,0 +1,135 @@
+import contextvars
+import queue
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Optional
+from metrics import metrics
+from memory import memory
+from ocr_job import cancelled
+
+class OCRWorkerPool:
+    """Run OCR jobs from a bounded queue on a pool of worker threads."""
+
+    def __init__(self, ocr_service, num_workers: int, max_queue: int,
+                 deliver: Callable[..., None], history_size: int = 200):
+        """
+        ocr_service is anything with a perform_ocr(file_path) method.
+        deliver(func, *args) is called from a worker thread and must arrange for
+        func(*args) to run on the consumer's thread (e.g. the Tk main loop).
+        """
+        self.ocr_service = ocr_service
+        self.num_workers = num_workers
+        self.deliver = deliver
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.cancelled = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stopped = threading.Event()
+        self._active = 0
+        self._latencies = deque(maxlen=history_size)  # (queue wait, run time) per job
+        self._lock = threading.Lock()
+        self._workers = []
+        for index in range(num_workers):
+            worker = threading.Thread(target=self._run, name=f"ocr-worker-{index}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, file_path: str, on_done: Callable[[str, Optional[Dict[str, str]]], None]) -> bool:
+        """Queue an OCR job, run in the caller's context (e.g. its priority lane). Returns False if the queue is full."""
+        if self._stopped.is_set():
+            return False
+        try:
+            self._queue.put_nowait((file_path, on_done, time.monotonic(), contextvars.copy_context()))
+            return True
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            metrics.inc('ocr_rejected')
+            print(f"OCR queue full, rejected: {file_path}")
+            return False
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None or self._stopped.is_set():
+                break
+
+            file_path, on_done, queued_at, context = job
+            if context.run(cancelled):
+                # Cancelled while it waited: no worker time or API units spent on it
+                with self._lock:
+                    self.cancelled += 1
+                self.deliver(on_done, file_path, None)
+                continue
+            started_at = time.monotonic()
+            with self._lock:
+                self._active += 1
+            try:
+                with memory.job():
+                    result = context.run(self.ocr_service.perform_ocr, file_path)
+            except Exception as e:
+                print(f"OCR job failed for {file_path}: {e}")
+                result = None
+            finished_at = time.monotonic()
+            metrics.observe('queue_wait', started_at - queued_at)
+            metrics.observe('ocr', finished_at - started_at)
+            metrics.inc('ocr_failed' if result is None else 'ocr_completed')
+
+            with self._lock:
+                self._active -= 1
+                self._latencies.append((started_at - queued_at, finished_at - started_at))
+                if result is None:
+                    self.failed += 1
+                else:
+                    self.completed += 1
+            self.deliver(on_done, file_path, result)
+
+    def stats(self) -> Dict[str, float]:
+        """Return queue depth, active workers and per-job latency figures in seconds."""
+        with self._lock:
+            totals = sorted(wait + run for wait, run in self._latencies)
+            waits = [wait for wait, _ in self._latencies]
+            stats = {
+                'queue_depth': self._queue.qsize(),
+                'active_workers': self._active,
+                'workers': self.num_workers,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'cancelled': self.cancelled
+            }
+        if totals:
+            stats['latency_p50'] = totals[len(totals) // 2]
+            stats['latency_p95'] = totals[min(len(totals) - 1, int(len(totals) * 0.95))]
+            stats['latency_max'] = totals[-1]
+            stats['queue_wait_avg'] = sum(waits) / len(waits)
+        return stats
+
+    def stop(self):
+        """Stop the workers after the jobs they are running; queued jobs are dropped with a None result.
+
+        Never blocks on a full queue: the workers check the stop flag, and
+        the wake-up markers only go in once the backlog has been drained.
+        """
+        self._stopped.set()
+        dropped = []
+        while True:
+            try:
+                job = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is not None:
+                dropped.append(job)
+        for _ in self._workers:
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                break
+        with self._lock:
+            self.cancelled += len(dropped)
+        for file_path, on_done, _, _ in dropped:
+            self.deliver(on_done, file_path, None)
+        for worker in self._workers:
+            worker.join(timeout=1.0)
@@ -0,0 +1,215 @@
+import io
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+from config import MAX_IMAGE_SIZE, IMAGE_QUALITY, ENCODE_MAX_SIDE, ENCODE_WEBP
+from image_store import SharedImage
+from metrics import metrics
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+# Decoded images in these modes can be handed to workers as raw pixels in shared memory
+SHARED_MODES = ('RGB', 'RGBA', 'L')
+# Copying pixels costs about as much as decoding them, so only a decode reduced to at most
+# 1/SHARE_MIN_REDUCTION of the original pixels is shared; workers decode the others from the file
+SHARE_MIN_REDUCTION = 2
+
+def upload_side(adaptive_encoding: bool) -> int:
+    """Longest side an image is decoded at before it is encoded for upload."""
+    return ENCODE_MAX_SIDE if adaptive_encoding else MAX_IMAGE_SIZE
+
+def encode_upload(handle: SharedImage, adaptive_encoding: bool) -> Tuple[bytes, float]:
+    """Resize and encode a decoded image; also returns how much it was scaled down."""
+    if adaptive_encoding:
+        import image_encoding
+        base = handle.base()
+        with metrics.timer('analyze'):
+            choice = image_encoding.choose_encoding(base, handle.size(), MAX_IMAGE_SIZE,
+                                                    ENCODE_MAX_SIDE, IMAGE_QUALITY, ENCODE_WEBP)
+        image = handle.resized(choice.size)
+        with metrics.timer('encode', format=choice.format):
+            return image_encoding.encode(image, choice), handle.size()[0] / choice.size[0]
+
+    # Fixed strategy: JPEG at MAX_IMAGE_SIZE
+    width, height = handle.size()
+
+    # Calculate new size while maintaining aspect ratio
+    ratio = min(MAX_IMAGE_SIZE / width, MAX_IMAGE_SIZE / height)
+    new_size = (int(width * ratio), int(height * ratio))
+
+    # Resize image, then convert to RGB if necessary
+    img = handle.resized(new_size)
+    with metrics.timer('encode', format='JPEG'):
+        if img.mode in ('RGBA', 'P'):
+            img = img.convert('RGB')
+
+        # Save to bytes with compression
+        output = io.BytesIO()
+        img.save(output, format='JPEG', quality=IMAGE_QUALITY, optimize=True)
+        return output.getvalue(), width / new_size[0]
+
+# Worker process side
+
+def _preload():
+    """Import Pillow and its codecs in a new worker before the first image arrives."""
+    from PIL import Image
+    import image_encoding
+    # Stage timings are sent back with every result, never logged from here
+    metrics.log_path = None
+    Image.init()
+    image_encoding.encode(Image.new('RGB', (64, 64), 'white'),
+                          image_encoding.EncodingChoice('JPEG', (64, 64), False, IMAGE_QUALITY, None))
+    metrics.reset()
+
+def _stages() -> Dict[str, float]:
+    """Seconds spent per stage since the last call, then start counting again."""
+    stages = {stage: histogram['sum'] for stage, histogram in metrics.snapshot()['stages'].items()}
+    metrics.reset()
+    return stages
+
+def _encode_file(file_path: str, adaptive_encoding: bool) -> Tuple[bytes, float, Dict[str, float]]:
+    handle = SharedImage(file_path, upload_side(adaptive_encoding))
+    try:
+        data, scale = encode_upload(handle, adaptive_encoding)
+    finally:
+        handle.release()
+    return data, scale, _stages()
+
+def _encode_shared(file_path: str, adaptive_encoding: bool, name: str, mode: str, size: Tuple[int, int],
+                   original_size: Tuple[int, int]) -> Tuple[bytes, float, Dict[str, float]]:
+    from PIL import Image
+    # Workers share the parent's resource tracker, which forgets the block when the parent unlinks it
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        # RGBA and L images map the parent's pixels without a copy; RGB is unpacked to 4 bytes a pixel
+        base = Image.frombuffer(mode, size, block.buf, 'raw', mode, 0, 1)
+        handle = SharedImage.from_image(file_path, upload_side(adaptive_encoding), base, original_size)
+        try:
+            data, scale = encode_upload(handle, adaptive_encoding)
+        finally:
+            handle.release()
+            # The mapping must be gone before the block can be closed
+            del base, handle
+    finally:
+        block.close()
+    return data, scale, _stages()
+
+class PreprocessPool:
+    """Decode, resize and encode uploads in worker processes instead of the calling thread.
+
+    Pillow holds the GIL for much of a decode, LANCZOS resize and optimized
+    JPEG encode, so a burst of screenshots compressed on OCR worker threads
+    runs on one core and slows the Tk main loop. Here each image goes to one
+    of workers processes as its path and is decoded there. An image the
+    preview already decoded at reduced size is copied once into shared
+    memory instead, which the worker maps rather than decoding the full
+    file again. Only the encoded bytes come back, through the pool's result
+    pipe.
+
+    Workers are started with spawn, which is safe next to the Tk and watcher
+    threads. With preload they are all started, and Pillow's codecs loaded,
+    when the pool is created rather than on the first screenshot. A pool
+    whose worker died is replaced and the image is encoded in the calling
+    thread instead.
+    """
+
+    def __init__(self, workers: int, preload: bool = True):
+        self.workers = workers
+        self.preload = preload
+        self._context = multiprocessing.get_context('spawn')
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._stats = {'images': 0, 'shared': 0, 'shared_bytes': 0, 'returned_bytes': 0, 'fallbacks': 0,
+                       'restarts': 0, 'worker_seconds': 0.0}
+        self._start()
+
+    def _start(self):
+        self._executor = ProcessPoolExecutor(self.workers, mp_context=self._context, initializer=_preload)
+        if self.preload:
+            # One no-op per worker starts every process now; the initializer loads the codecs
+            for _ in range(self.workers):
+                self._executor.submit(_stages)
+
+    def encode(self, file_path: str, adaptive_encoding: bool,
+               handle: Optional[SharedImage] = None) -> Tuple[bytes, float]:
+        """Return the upload bytes for an image and the original-to-uploaded scale factor."""
+        base = handle.decoded() if handle is not None else None
+        block = None
+        shared = 0
+        try:
+            with self._lock:
+                executor = self._executor
+            if self._share(base, handle):
+                with metrics.timer('preprocess_share'):
+                    pixels = base.tobytes()
+                    shared = len(pixels)
+                    block = shared_memory.SharedMemory(create=True, size=max(1, shared))
+                    block.buf[:shared] = pixels
+                    del pixels
+                future = executor.submit(_encode_shared, file_path, adaptive_encoding, block.name, base.mode,
+                                         base.size, handle.size())
+            else:
+                future = executor.submit(_encode_file, file_path, adaptive_encoding)
+            start = time.perf_counter()
+            data, scale, stages = future.result()
+            metrics.observe('preprocess', time.perf_counter() - start, shared=block is not None)
+        except BrokenProcessPool as e:
+            print(f"Image preprocessing worker died, encoding in this process: {e}")
+            self._restart(executor)
+            return self._encode_here(file_path, adaptive_encoding, handle)
+        finally:
+            if block is not None:
+                block.close()
+                block.unlink()
+
+        for stage, seconds in stages.items():
+            metrics.observe(stage, seconds, process=True)
+        with self._lock:
+            self._stats['images'] += 1
+            self._stats['returned_bytes'] += len(data)
+            self._stats['worker_seconds'] += sum(stages.values())
+            if block is not None:
+                self._stats['shared'] += 1
+                self._stats['shared_bytes'] += shared
+        return data, scale
+
+    @staticmethod
+    def _share(base: Optional['Image.Image'], handle: Optional[SharedImage]) -> bool:
+        if base is None or base.mode not in SHARED_MODES:
+            return False
+        width, height = handle.size()
+        return width * height >= SHARE_MIN_REDUCTION * base.width * base.height
+
+    def _encode_here(self, file_path: str, adaptive_encoding: bool,
+                     handle: Optional[SharedImage]) -> Tuple[bytes, float]:
+        with self._lock:
+            self._stats['fallbacks'] += 1
+        if handle is not None:
+            return encode_upload(handle, adaptive_encoding)
+        handle = SharedImage(file_path, upload_side(adaptive_encoding))
+        try:
+            return encode_upload(handle, adaptive_encoding)
+        finally:
+            handle.release()
+
+    def _restart(self, broken: ProcessPoolExecutor):
+        with self._lock:
+            if self._executor is not broken:
+                # Another thread already replaced it
+                return
+            self._stats['restarts'] += 1
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._start()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._stats, workers=self.workers)
+
+    def close(self):
+        with self._lock:
+            self._executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,246 @@
+import contextvars
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+from metrics import metrics
+
+# Priority lanes, most urgent first
+INTERACTIVE = 'interactive'
+BATCH = 'batch'
+LANES = (INTERACTIVE, BATCH)
+
+# Share of a limit that may be sent at once after an idle spell
+BURST_SHARE = 0.1
+
+_lane = contextvars.ContextVar('ocr_lane', default=INTERACTIVE)
+
+@contextmanager
+def lane(name: str) -> Iterator[None]:
+    """Send the Vision API requests made in this block (and threads started from its context) in lane name."""
+    if name not in LANES:
+        raise ValueError(f"Unknown priority lane: {name}")
+    token = _lane.set(name)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+def current_lane() -> str:
+    return _lane.get()
+
+def billing_period(timestamp: Optional[float] = None) -> str:
+    """The Vision API bills per calendar month (UTC)."""
+    return time.strftime('%Y-%m', time.gmtime(timestamp))
+
+class TokenBucket:
+    """Token bucket refilled at rate tokens per second up to capacity; not thread safe."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float, factor: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate * factor)
+        self._updated = now
+
+    def delay(self, units: int, now: float, factor: float = 1.0) -> float:
+        """Seconds until units can be taken; more than capacity only has to wait for a full bucket."""
+        self._refill(now, factor)
+        missing = min(units, self.capacity) - self.tokens
+        return max(0.0, missing / (self.rate * factor))
+
+    def take(self, units: int):
+        # May go negative for requests larger than the bucket, delaying the next one
+        self.tokens -= units
+
+class UnitLedger:
+    """Running count of billed units per billing period, kept in a small JSON file.
+
+    Every update re-reads the file and adds to it, so several processes
+    sharing the file (app, daemon, batch runs) keep a roughly common count.
+    """
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self._counts = self._load()
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, int]:
+        if not self.path:
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                counts = json.load(f)
+            return {str(period): int(units) for period, units in counts.items()}
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            print(f"Error reading unit ledger {self.path}: {e}")
+            return {}
+
+    def units(self, period: Optional[str] = None) -> int:
+        with self._lock:
+            return self._counts.get(period or billing_period(), 0)
+
+    def add(self, units: int):
+        period = billing_period()
+        with self._lock:
+            if self.path:
+                counts = self._load()
+                counts[period] = max(counts.get(period, 0), self._counts.get(period, 0)) + units
+                self._counts = counts
+                self._save()
+            else:
+                self._counts[period] = self._counts.get(period, 0) + units
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            temp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._counts, f, sort_keys=True)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"Error writing unit ledger {self.path}: {e}")
+
+class RequestScheduler:
+    """Pace Vision API requests to per-second and per-minute unit limits and a per-period budget.
+
+    A unit is one image sent with one feature, which is what the API bills
+    and counts against its quotas. The buckets are sized so no one-second or
+    one-minute window, however aligned, sees more than the limit, except that
+    a multi-image request larger than a bucket is sent whole and the requests
+    after it wait until it is paid back. Requests
+    wait in priority order: an interactive request always goes before any
+    waiting batch request. A 429 halves the sending rate and pauses for
+    Retry-After; every success wins back a step of the configured rate.
+    Units are reserved from the period's budget when a request is let
+    through and settled by record_units() or release() once it is answered,
+    so concurrent requests cannot overshoot it. Limits of 0 disable a check.
+    """
+
+    def __init__(self, per_second: float = 0, per_minute: float = 0, period_limit: int = 0,
+                 ledger: Optional[UnitLedger] = None, min_factor: float = 0.05, recovery: float = 0.05):
+        self.buckets = [self._bucket(limit, window) for limit, window in ((per_second, 1), (per_minute, 60))
+                        if limit > 0]
+        self.period_limit = period_limit
+        self.ledger = ledger or UnitLedger(None)
+        self.min_factor = min_factor
+        self.recovery = recovery
+        self.factor = 1.0  # Share of the configured rate currently used
+        self._paused_until = 0.0
+        self._reserved = 0  # Units let through but not answered yet
+        self._waiters = []  # Heap of (lane index, sequence) tickets
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._counts = {'throttled': 0, 'rejected': 0}
+        self._waits = {name: [0, 0.0] for name in LANES}  # Requests and seconds waited per lane
+
+    @staticmethod
+    def _bucket(limit: float, window: float) -> TokenBucket:
+        # A full bucket plus one window of refill is what can be sent in any window,
+        # so a burst of a tenth of the limit leaves 90% of it for the steady rate. A
+        # multi-image request larger than the bucket goes out whole once it is full
+        # and borrows the rest from the refill, holding back the requests after it
+        burst = max(1.0, limit * BURST_SHARE)
+        return TokenBucket(max(limit - burst, limit * BURST_SHARE) / window, burst)
+
+    def acquire(self, units: int, lane_name: Optional[str] = None) -> bool:
+        """Block until units may be sent; False if the period's budget would be exceeded."""
+        lane_name = lane_name or current_lane()
+        if not self._reserve(units):
+            return False
+
+        start = time.monotonic()
+        with self._condition:
+            ticket = (LANES.index(lane_name), next(self._sequence))
+            heapq.heappush(self._waiters, ticket)
+            try:
+                while True:
+                    delay = None
+                    if self._waiters[0] == ticket:
+                        delay = self._delay(units)
+                        if delay <= 0:
+                            break
+                    self._condition.wait(delay)
+                for bucket in self.buckets:
+                    bucket.take(units)
+            finally:
+                self._waiters.remove(ticket)
+                heapq.heapify(self._waiters)
+                self._condition.notify_all()
+            waited = time.monotonic() - start
+            self._waits[lane_name][0] += 1
+            self._waits[lane_name][1] += waited
+        metrics.observe('rate_wait', waited, lane=lane_name, units=units)
+        return True
+
+    def try_acquire(self, units: int) -> bool:
+        """Take units only if they may be sent right now and nobody is waiting; for optional requests."""
+        with self._condition:
+            if self._waiters or self._delay(units) > 0 or not self._reserve(units):
+                return False
+            for bucket in self.buckets:
+                bucket.take(units)
+        return True
+
+    def _reserve(self, units: int) -> bool:
+        with self._condition:
+            if self.period_limit and self.ledger.units() + self._reserved + units > self.period_limit:
+                self._counts['rejected'] += 1
+                metrics.inc('quota_rejected')
+                return False
+            self._reserved += units
+        return True
+
+    def _delay(self, units: int) -> float:
+        # Called with the condition held
+        now = time.monotonic()
+        delay = self._paused_until - now
+        for bucket in self.buckets:
+            delay = max(delay, bucket.delay(units, now, self.factor))
+        return delay
+
+    def record_units(self, units: int):
+        """Count units the API accepted (and bills) against the current period."""
+        self.ledger.add(units)
+        self.release(units)
+        metrics.inc('api_units', units)
+
+    def release(self, units: int):
+        """Hand back the reservation of units that were let through but not billed."""
+        with self._condition:
+            self._reserved = max(0, self._reserved - units)
+
+    def throttled(self, retry_after: Optional[float]):
+        """Slow down after a 429 and hold every lane until Retry-After has passed."""
+        with self._condition:
+            self.factor = max(self.min_factor, self.factor / 2)
+            self._paused_until = max(self._paused_until, time.monotonic() + (retry_after or 1.0))
+            self._counts['throttled'] += 1
+        metrics.inc('api_throttled')
+        print(f"Vision API rate limited, sending at {self.factor:.0%} of the configured rate")
+
+    def succeeded(self):
+        with self._condition:
+            if self.factor < 1.0:
+                self.factor = min(1.0, self.factor + self.recovery)
+
+    def stats(self) -> Dict[str, float]:
+        with self._condition:
+            stats = dict(self._counts, rate_factor=round(self.factor, 3), waiting=len(self._waiters),
+                         reserved=self._reserved)
+            for name, (count, seconds) in self._waits.items():
+                stats[f"{name}_requests"] = count
+                stats[f"{name}_wait_avg"] = seconds / count if count else 0.0
+        stats['period'] = billing_period()
+        stats['period_units'] = self.ledger.units()
+        stats['period_limit'] = self.period_limit
+        return stats
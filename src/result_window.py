@@ -0,0 +1,470 @@
+import os
+import time
+import tkinter as tk
+from tkinter import ttk
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+from image_store import ImageStore
+from metrics import metrics
+
+PREVIEW_MAX_SIZE = (800, 600)
+PREVIEW_MIN_SIDE = 200
+
+def preview_size(image_size: Tuple[int, int], max_width: int = PREVIEW_MAX_SIZE[0],
+                 max_height: int = PREVIEW_MAX_SIZE[1]) -> Tuple[int, int]:
+    """Fit an image into the preview area, keeping its aspect ratio and scaling tiny images up."""
+    width, height = image_size
+    ratio = min(max_width / width, max_height / height)
+    new_width, new_height = int(width * ratio), int(height * ratio)
+    if new_width < PREVIEW_MIN_SIDE and new_height < PREVIEW_MIN_SIDE:
+        if width > height:
+            new_width, new_height = PREVIEW_MIN_SIDE, int(height * (PREVIEW_MIN_SIDE / width))
+        else:
+            new_width, new_height = int(width * (PREVIEW_MIN_SIDE / height)), PREVIEW_MIN_SIDE
+    return (max(1, new_width), max(1, new_height))
+
+class TrayItem:
+    """A screenshot waiting in the result window: to be confirmed, or with its OCR outcome."""
+
+    CONFIRM = 'confirm'
+    RESULT = 'result'
+    FAILED = 'failed'
+
+    __slots__ = ('file_path', 'kind', 'result', 'created')
+
+    def __init__(self, file_path: str, kind: str, result: Optional[Dict] = None):
+        self.file_path = file_path
+        self.kind = kind
+        self.result = result
+        self.created = time.time()
+
+    def label(self) -> str:
+        marks = {self.CONFIRM: '?', self.RESULT: '✓', self.FAILED: '!'}
+        return f"{marks[self.kind]} {time.strftime('%H:%M:%S', time.localtime(self.created))}  " \
+               f"{os.path.basename(self.file_path)}"
+
+class PreviewRenderer:
+    """Prepare downscaled previews on a background thread and keep a bounded number of them.
+
+    Decoding and resizing happen off the Tk thread; only the PhotoImage,
+    which Tk needs to own, is made on it. Resized images are kept for the
+    max_previews most recently requested screenshots and PhotoImages for the
+    max_photos most recently shown; anything evicted is prepared again when
+    it is needed. A screenshot that cannot be read is remembered as failed
+    until it is discarded and not tried again.
+    """
+
+    def __init__(self, image_store: ImageStore, dispatcher: Callable, max_previews: int, max_photos: int):
+        self.image_store = image_store
+        self.dispatcher = dispatcher
+        self.max_previews = max_previews
+        self.max_photos = max_photos
+        self._previews = OrderedDict()  # path -> (resized image, original size)
+        self._photos = OrderedDict()  # path -> PhotoImage
+        self._waiting: Dict[str, List[Callable[[str], None]]] = {}
+        self._failed = set()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ui-preview")
+
+    def request(self, file_path: str, callback: Callable[[str], None]):
+        """Call callback(file_path) on the Tk thread once the preview is ready or has failed, right away if it is."""
+        if file_path in self._failed:
+            callback(file_path)
+            return
+        if file_path in self._previews:
+            self._previews.move_to_end(file_path)
+            callback(file_path)
+            return
+        if file_path in self._waiting:
+            self._waiting[file_path].append(callback)
+            return
+        self._waiting[file_path] = [callback]
+        # Keep the shared decode alive until the preview has been cut from it
+        handle = self.image_store.acquire(file_path)
+        self._executor.submit(self._prepare, file_path, handle)
+
+    def _prepare(self, file_path: str, handle):
+        image, original = None, None
+        try:
+            original = handle.size()
+            image = handle.resized(preview_size(original))
+        except Exception as e:
+            print(f"Error preparing preview for {file_path}: {e}")
+        finally:
+            self.image_store.release(file_path)
+        self.dispatcher(self._ready, file_path, image, original)
+
+    def _ready(self, file_path: str, image, original: Optional[Tuple[int, int]]):
+        callbacks = self._waiting.pop(file_path, [])
+        if image is not None:
+            self._previews[file_path] = (image, original)
+            while len(self._previews) > self.max_previews:
+                evicted, _ = self._previews.popitem(last=False)
+                self._photos.pop(evicted, None)
+        else:
+            self._failed.add(file_path)
+        for callback in callbacks:
+            callback(file_path)
+
+    def failed(self, file_path: str) -> bool:
+        """True if the screenshot could not be read for a preview."""
+        return file_path in self._failed
+
+    def photo(self, file_path: str) -> Optional[Tuple[object, Tuple[int, int], float]]:
+        """Return the PhotoImage, its size and the preview-to-original scale, or None if not prepared."""
+        entry = self._previews.get(file_path)
+        if entry is None:
+            return None
+        image, original = entry
+        photo = self._photos.get(file_path)
+        if photo is None:
+            # Imported on first preview, off the startup path
+            from PIL import ImageTk
+            with metrics.timer('preview'):
+                photo = ImageTk.PhotoImage(image)
+            self._photos[file_path] = photo
+            while len(self._photos) > self.max_photos:
+                self._photos.popitem(last=False)
+        else:
+            self._photos.move_to_end(file_path)
+        return photo, image.size, original[0] / image.size[0]
+
+    def discard(self, file_path: str):
+        """Forget a screenshot's preview once nothing will show it again."""
+        self._previews.pop(file_path, None)
+        self._photos.pop(file_path, None)
+        self._failed.discard(file_path)
+
+    def stats(self) -> Dict[str, int]:
+        return {'previews': len(self._previews), 'photos': len(self._photos), 'preparing': len(self._waiting),
+                'failed': len(self._failed)}
+
+    def stop(self):
+        self._executor.shutdown(wait=False)
+
+class ResultWindow:
+    """One reusable window for every new screenshot, with a tray of the ones waiting.
+
+    Confirmations and OCR results queue up in the tray instead of each
+    opening a window of its own. The widgets are built once and refilled for
+    whichever item is shown, so a burst costs the same per item as a single
+    screenshot. With max_results set, a new result beyond that many dismisses
+    the oldest one not on screen, so results left unread all day do not
+    pile up. Closing the window cancels or discards everything waiting.
+    """
+
+    def __init__(self, root: tk.Tk, previews: PreviewRenderer, web_presets: Dict[str, str],
+                 on_confirm: Callable[[str], None], on_cancel: Callable[[str], None],
+                 on_send: Callable[[str, str], None], on_copy: Callable[[str], None],
+                 on_exit: Callable[[], None], on_search: Optional[Callable[[], None]] = None,
+                 on_skip: Optional[Callable[[bool], None]] = None,
+                 on_dismiss: Optional[Callable[[str], None]] = None, max_results: Optional[int] = None):
+        """on_dismiss(path) is called when a result or failure leaves the tray."""
+        self.root = root
+        self.previews = previews
+        self.web_presets = web_presets
+        self.on_confirm = on_confirm
+        self.on_cancel = on_cancel
+        self.on_send = on_send
+        self.on_copy = on_copy
+        self.on_exit = on_exit
+        self.on_search = on_search
+        self.on_skip = on_skip
+        self.on_dismiss = on_dismiss
+        self.max_results = max_results
+        self.dismissed = 0  # Results dismissed to stay within max_results
+        self.items: List[TrayItem] = []
+        self.current: Optional[TrayItem] = None
+        self.window = None
+        self._scale = 1.0  # Preview pixels to original pixels of the item shown
+
+    def add(self, item: TrayItem):
+        """Queue an item; it is shown right away if nothing else is."""
+        self.items.append(item)
+        if self.window is None:
+            self._build()
+        # Start preparing the preview now so it is ready by the time the item is shown
+        self.previews.request(item.file_path, self._on_preview_ready)
+        if self.current is None:
+            self.window.deiconify()
+            self.window.lift()
+            self.show(item)
+        else:
+            self._refresh_tray()
+        if self.max_results is not None and item.kind != TrayItem.CONFIRM:
+            self._trim_results()
+
+    def _trim_results(self):
+        """Dismiss the oldest results not on screen until at most max_results are left."""
+        results = [item for item in self.items if item.kind != TrayItem.CONFIRM]
+        for item in results[:max(0, len(results) - self.max_results)]:
+            if item is self.current:
+                continue
+            self._remove(item)
+            self.dismissed += 1
+            metrics.inc('ui_results_dismissed')
+            if self.on_dismiss is not None:
+                self.on_dismiss(item.file_path)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def _build(self):
+        window = tk.Toplevel(self.root)
+        window.title("OCR")
+        window.attributes('-topmost', True)  # Make window stay on top
+        window.protocol("WM_DELETE_WINDOW", self.clear)
+        self.window = window
+
+        # Size the window once for the largest preview and center it on screen
+        width, height = self._calculate_window_size(PREVIEW_MAX_SIZE)
+        window.update_idletasks()
+        x = (window.winfo_screenwidth() - width) // 2
+        y = (window.winfo_screenheight() - height) // 2
+        window.geometry(f"{width}x{height}+{x}+{y}")
+
+        # Create main container: the tray on the left, the item shown on the right
+        main_frame = ttk.Frame(window, padding="10")
+        main_frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+
+        tray_frame = ttk.Frame(main_frame)
+        tray_frame.grid(row=0, column=0, rowspan=5, sticky=(tk.N, tk.S), padx=5, pady=5)
+        self.tray_label = ttk.Label(tray_frame, text="Waiting")
+        self.tray_label.grid(row=0, column=0, sticky=tk.W)
+        self.tray_list = tk.Listbox(tray_frame, width=28, exportselection=False)
+        self.tray_list.grid(row=1, column=0, sticky=(tk.N, tk.S))
+        self.tray_list.bind('<<ListboxSelect>>', self._on_tray_select)
+        tray_frame.rowconfigure(1, weight=1)
+
+        # Create message label
+        self.message_label = ttk.Label(main_frame, text="")
+        self.message_label.grid(row=0, column=1, sticky=(tk.W, tk.E), padx=5, pady=5)
+
+        # Display the preview on a canvas so a region can be selected on it
+        self.canvas = tk.Canvas(main_frame, width=PREVIEW_MAX_SIZE[0], height=PREVIEW_MAX_SIZE[1],
+                                highlightthickness=0)
+        self.canvas.grid(row=1, column=1, sticky=tk.NW, padx=5, pady=5)
+        self._bind_region_select()
+
+        # Confirmation controls
+        self.confirm_frame = ttk.Frame(main_frame)
+        self.confirm_frame.grid(row=2, column=1, sticky=(tk.W, tk.E), padx=5, pady=5)
+        skip_var = tk.BooleanVar()
+        skip_checkbox = ttk.Checkbutton(self.confirm_frame, text="Don't ask again", variable=skip_var,
+                                        command=lambda: self.on_skip and self.on_skip(skip_var.get()))
+        skip_checkbox.grid(row=0, column=0, columnspan=2, sticky=tk.W, padx=5, pady=5)
+        ttk.Button(self.confirm_frame, text="Confirm", width=10,
+                   command=self._confirm).grid(row=1, column=0, padx=5)
+        ttk.Button(self.confirm_frame, text="Cancel", width=10,
+                   command=self._cancel).grid(row=1, column=1, padx=5)
+
+        # Result controls: text box, web preset and action buttons
+        self.result_frame = ttk.Frame(main_frame)
+        self.result_frame.grid(row=2, column=1, sticky=(tk.W, tk.E), padx=5, pady=5)
+        self.text_label = ttk.Label(self.result_frame, text="Recognized Text:")
+        self.text_label.grid(row=0, column=0, sticky=tk.W)
+        self.text_box = tk.Text(self.result_frame, wrap=tk.WORD, width=60, height=10)
+        self.text_box.grid(row=1, column=0, sticky=(tk.W, tk.E), padx=5, pady=5)
+
+        web_frame = ttk.Frame(self.result_frame)
+        web_frame.grid(row=2, column=0, sticky=(tk.W, tk.E), pady=5)
+        web_preset = ttk.Combobox(web_frame, values=list(self.web_presets.keys()), width=20)
+        web_preset.grid(row=0, column=0, padx=5)
+        web_preset.set(list(self.web_presets.keys())[0])
+        ttk.Button(web_frame, text="Send", width=10,
+                   command=lambda: self._act(lambda text: self.on_send(web_preset.get(), text))
+                   ).grid(row=0, column=1, padx=5)
+
+        button_frame = ttk.Frame(self.result_frame)
+        button_frame.grid(row=3, column=0, sticky=(tk.W, tk.E), pady=5)
+        ttk.Button(button_frame, text="Copy", width=10,
+                   command=lambda: self._act(self.on_copy)).grid(row=0, column=0, padx=5)
+        ttk.Button(button_frame, text="Discard", width=10,
+                   command=lambda: self._act(None)).grid(row=0, column=1, padx=5)
+        ttk.Button(button_frame, text="Exit", width=10, command=self.on_exit).grid(row=0, column=2, padx=5)
+        if self.on_search is not None:
+            ttk.Button(button_frame, text="History", width=10,
+                       command=self.on_search).grid(row=0, column=3, padx=5)
+            button_frame.columnconfigure(3, weight=1)
+
+        # Configure grid weights
+        window.columnconfigure(0, weight=1)
+        window.rowconfigure(0, weight=1)
+        main_frame.columnconfigure(1, weight=1)
+        main_frame.rowconfigure(4, weight=1)
+        self.result_frame.columnconfigure(0, weight=1)
+        web_frame.columnconfigure(0, weight=1)
+        for column in range(3):
+            button_frame.columnconfigure(column, weight=1)
+
+    def _calculate_window_size(self, image_size: Tuple[int, int]) -> Tuple[int, int]:
+        """Calculate the window size for a preview of image_size, at most 80% of the screen."""
+        content_width = max(400, image_size[0] + 300)  # Add space for the tray
+        content_height = max(500, image_size[1] + 300)  # Add space for controls
+        width = min(content_width, int(self.root.winfo_screenwidth() * 0.8))
+        height = min(content_height, int(self.root.winfo_screenheight() * 0.8))
+        return (width, height)
+
+    def show(self, item: TrayItem):
+        """Fill the window's widgets with an item."""
+        render_start = time.perf_counter()
+        self.current = item
+        if item.kind == TrayItem.CONFIRM:
+            self.message_label.config(text="New screenshot detected. Do you want to proceed?")
+            self.result_frame.grid_remove()
+            self.confirm_frame.grid()
+        else:
+            layout = item.result.get('layout') if item.result else None
+            if item.kind == TrayItem.FAILED:
+                self.message_label.config(text="Failed to perform OCR on the image")
+            else:
+                self.message_label.config(text=os.path.basename(item.file_path))
+            self.text_label.config(text="Recognized Text (drag over the image to keep a region):"
+                                   if layout else "Recognized Text:")
+            self.text_box.delete('1.0', tk.END)
+            if item.result:
+                self.text_box.insert('1.0', layout.layout_text() if layout else item.result['text'])
+            self.confirm_frame.grid_remove()
+            self.result_frame.grid()
+        self._draw_preview()
+        self._refresh_tray()
+        metrics.observe('ui_render', time.perf_counter() - render_start)
+
+    def _draw_preview(self):
+        self.canvas.delete('all')
+        self.canvas.image = None
+        shown = self.previews.photo(self.current.file_path)
+        if shown is None and self.previews.failed(self.current.file_path):
+            self.canvas.create_text(PREVIEW_MAX_SIZE[0] // 2, PREVIEW_MAX_SIZE[1] // 2, text="Preview unavailable")
+            return
+        if shown is None:
+            # Drawn by _on_preview_ready once the background thread is done
+            self.canvas.create_text(PREVIEW_MAX_SIZE[0] // 2, PREVIEW_MAX_SIZE[1] // 2, text="Loading preview…")
+            self.previews.request(self.current.file_path, self._on_preview_ready)
+            return
+        photo, size, self._scale = shown
+        self.canvas.config(width=size[0], height=size[1])
+        self.canvas.create_image(0, 0, image=photo, anchor=tk.NW)
+        self.canvas.image = photo  # Keep a reference even if the renderer evicts it
+
+    def _on_preview_ready(self, file_path: str):
+        if self.current is not None and self.current.file_path == file_path:
+            self._draw_preview()
+
+    def _refresh_tray(self):
+        self.tray_list.delete(0, tk.END)
+        for item in self.items:
+            self.tray_list.insert(tk.END, item.label())
+        if self.current in self.items:
+            index = self.items.index(self.current)
+            self.tray_list.selection_clear(0, tk.END)
+            self.tray_list.selection_set(index)
+            self.tray_list.see(index)
+        waiting = len(self.items)
+        self.tray_label.config(text=f"{waiting} waiting")
+        self.window.title(f"OCR ({waiting} waiting)" if waiting > 1 else "OCR")
+
+    def _on_tray_select(self, event):
+        selection = self.tray_list.curselection()
+        if selection and self.items[selection[0]] is not self.current:
+            self.show(self.items[selection[0]])
+
+    def _remove(self, item: TrayItem, keep_preview: bool = False):
+        """Take an item out of the tray and show the next one, or hide the window when none is left."""
+        index = self.items.index(item)
+        self.items.pop(index)
+        if not keep_preview and all(other.file_path != item.file_path for other in self.items):
+            self.previews.discard(item.file_path)
+        if item is not self.current:
+            self._refresh_tray()
+            return
+        self.current = None
+        self.canvas.delete('all')
+        self.canvas.image = None
+        if self.items:
+            self.show(self.items[min(index, len(self.items) - 1)])
+        else:
+            self.window.withdraw()
+
+    def _confirm(self):
+        item = self.current
+        if item is None:
+            return
+        # The result reuses this preview
+        self._remove(item, keep_preview=True)
+        self.on_confirm(item.file_path)
+
+    def _cancel(self):
+        item = self.current
+        if item is None:
+            return
+        self._remove(item)
+        self.on_cancel(item.file_path)
+
+    def _act(self, action: Optional[Callable[[str], None]]):
+        """Run an action on the shown result's text, then dismiss the result."""
+        item = self.current
+        if item is None:
+            return
+        text = self.text_box.get('1.0', tk.END).strip()
+        self._remove(item)
+        if action is not None:
+            action(text)
+        if self.on_dismiss is not None:
+            self.on_dismiss(item.file_path)
+
+    def clear(self):
+        """Cancel every waiting confirmation, drop every result and hide the window."""
+        items, self.items = self.items, []
+        self.current = None
+        for item in items:
+            self.previews.discard(item.file_path)
+            if item.kind == TrayItem.CONFIRM:
+                self.on_cancel(item.file_path)
+            elif self.on_dismiss is not None:
+                self.on_dismiss(item.file_path)
+        if self.window is not None:
+            self.canvas.delete('all')
+            self.canvas.image = None
+            self.window.withdraw()
+
+    def _bind_region_select(self):
+        """Drag a rectangle over the preview to show only the text inside it; a click shows all text again."""
+        canvas = self.canvas
+        drag = {}
+
+        def layout():
+            item = self.current
+            return item.result.get('layout') if item is not None and item.result else None
+
+        def on_press(event):
+            canvas.delete('selection')
+            drag['start'] = (event.x, event.y) if layout() else None
+
+        def on_motion(event):
+            if not drag.get('start'):
+                return
+            canvas.delete('selection')
+            canvas.create_rectangle(*drag['start'], event.x, event.y, outline='red', dash=(4, 2), tags='selection')
+
+        def on_release(event):
+            start = drag.pop('start', None)
+            current = layout()
+            if not start or current is None:
+                return
+            left, right = sorted((start[0], event.x))
+            top, bottom = sorted((start[1], event.y))
+            if right - left < 3 or bottom - top < 3:
+                canvas.delete('selection')
+                text = current.layout_text()
+            else:
+                scale = self._scale
+                with metrics.timer('region_query'):
+                    text = current.text_in((int(left * scale), int(top * scale),
+                                            int(right * scale), int(bottom * scale)))
+            self.text_box.delete('1.0', tk.END)
+            self.text_box.insert('1.0', text)
+
+        canvas.bind('<ButtonPress-1>', on_press)
+        canvas.bind('<B1-Motion>', on_motion)
+        canvas.bind('<ButtonRelease-1>', on_release)
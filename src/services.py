@@ -0,0 +1,72 @@
+from typing import Optional
+from ocr_service import OCRService
+from ocr_cache import OCRCache
+from ocr_batcher import OCRBatcher
+from image_store import ImageStore
+from ocr_backend import OCRBackend, create_backend
+from tesseract_backend import TesseractBackend
+from history import HistoryIndex, HistoryRecorder
+from incremental_ocr import IncrementalOCR
+from tiled_ocr import TiledOCR
+from request_scheduler import RequestScheduler, UnitLedger
+from transport import VisionTransport
+from preprocess import PreprocessPool
+from config import (CACHE_ENABLED, CACHE_DIR, CACHE_MAX_BYTES, CACHE_MAX_AGE,
+                    BATCH_ENABLED, DEDUP_ENABLED, TILING_ENABLED, DECODE_MAX_SIDE,
+                    BATCH_MAX_IMAGES, BATCH_MAX_BYTES, BATCH_MAX_WAIT,
+                    OCR_MODE, TESSERACT_CMD, TESSERACT_LANG, LOCAL_MAX_PIXELS, LOCAL_MIN_CONFIDENCE,
+                    RATE_PER_SECOND, RATE_PER_MINUTE, QUOTA_MONTHLY_UNITS, QUOTA_LEDGER,
+                    VISION_ENDPOINT, TIMEOUT, TRANSPORT_POOL_SIZE, TRANSPORT_WARM_CONNECTIONS, TRANSPORT_KEEPALIVE,
+                    TRANSPORT_GZIP, TRANSPORT_GZIP_MIN_BYTES, PREPROCESS_WORKERS, PREPROCESS_PRELOAD)
+
+def build_ocr_backend(api_key: str, image_store: Optional[ImageStore] = None,
+                      history: Optional[HistoryIndex] = None) -> OCRBackend:
+    """Wire cache, cloud service, batching, local engine and history index into one OCR backend."""
+    # Create OCR result cache
+    cache = OCRCache(CACHE_DIR, CACHE_MAX_BYTES, CACHE_MAX_AGE) if CACHE_ENABLED else None
+    
+    # Near-duplicate detection shares decoded images with the upload path
+    if DEDUP_ENABLED and image_store is None:
+        image_store = ImageStore(DECODE_MAX_SIDE)
+    
+    # Pace requests to the API's rate limits and the monthly unit budget; without
+    # a budget units are only counted in memory, not written to the shared ledger
+    ledger = UnitLedger(QUOTA_LEDGER if QUOTA_MONTHLY_UNITS else None)
+    scheduler = RequestScheduler(RATE_PER_SECOND, RATE_PER_MINUTE, QUOTA_MONTHLY_UNITS, ledger)
+    
+    # Keep warm connections to the API ready for the first screenshot
+    transport = VisionTransport(VISION_ENDPOINT, TRANSPORT_POOL_SIZE, TRANSPORT_WARM_CONNECTIONS,
+                                TRANSPORT_KEEPALIVE, TRANSPORT_GZIP, TRANSPORT_GZIP_MIN_BYTES, timeout=TIMEOUT)
+    if OCR_MODE != 'local':
+        transport.warm()
+    
+    # Decode and encode uploads in worker processes, out of the way of the GIL
+    preprocess = PreprocessPool(PREPROCESS_WORKERS, PREPROCESS_PRELOAD) if PREPROCESS_WORKERS > 0 else None
+    
+    # Create OCR service
+    ocr_service = OCRService(api_key, cache, image_store, scheduler=scheduler, transport=transport,
+                             preprocess=preprocess)
+    service = ocr_service
+    print("OCR service initialized")
+    
+    # Group concurrent screenshots into multi-image requests
+    if BATCH_ENABLED:
+        ocr_service = OCRBatcher(ocr_service, BATCH_MAX_IMAGES, BATCH_MAX_BYTES, BATCH_MAX_WAIT)
+    
+    # Re-OCR only the changed regions of near-duplicate screenshots
+    if DEDUP_ENABLED:
+        ocr_service = IncrementalOCR(ocr_service, service, image_store)
+    
+    # Split very large screenshots into full-resolution tiles sent in parallel
+    if TILING_ENABLED:
+        ocr_service = TiledOCR(ocr_service, service)
+    
+    # Optionally combine the cloud with a local offline engine
+    ocr_backend = create_backend(OCR_MODE, ocr_service, TesseractBackend(TESSERACT_CMD, TESSERACT_LANG),
+                                 LOCAL_MAX_PIXELS, LOCAL_MIN_CONFIDENCE)
+    print(f"OCR mode: {OCR_MODE}")
+    
+    # Record every result in the searchable history
+    if history is not None:
+        ocr_backend = HistoryRecorder(ocr_backend, history)
+    return ocr_backend
@@ -0,0 +1,107 @@
+import time
+from typing import Callable, Dict, Optional
+from metrics import metrics
+from ocr_job import JobToken, jobs
+
+class _Speculation:
+    __slots__ = ('file_path', 'token', 'started', 'finished', 'confirmed', 'result')
+
+    def __init__(self, file_path: str, token: JobToken):
+        self.file_path = file_path
+        self.token = token
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+        self.confirmed: Optional[float] = None
+        self.result: Optional[Dict[str, str]] = None
+
+class SpeculativeOCR:
+    """OCR screenshots while their confirmation is still pending.
+
+    start() queues the OCR job as soon as a screenshot is ready, so the
+    user's think time overlaps compression and the API round trip.
+    confirm() hands on a finished result at once, or as soon as the job in
+    flight finishes; cancel() stops the job at its next checkpoint (before
+    it is queued, uploaded or retried) and discards whatever it produces.
+    Time saved is what confirmed jobs had already run at confirmation; waste
+    is the API units billed for cancelled ones. Not thread safe: call it
+    and deliver the worker pool's results on one thread (the Tk main loop).
+    """
+
+    def __init__(self, worker_pool, on_result: Callable[[str, Optional[Dict[str, str]]], None]):
+        """
+        worker_pool is an OCRWorkerPool delivering to this object's thread;
+        on_result(file_path, result) receives the results of confirmed jobs.
+        """
+        self.worker_pool = worker_pool
+        self.on_result = on_result
+        self._pending: Dict[str, _Speculation] = {}
+        self._cancelled = []  # Cancelled jobs still running, to count what they cost
+        self._stats = {'started': 0, 'confirmed': 0, 'ready_at_confirm': 0, 'cancelled': 0,
+                       'cancelled_after_upload': 0, 'saved_seconds': 0.0, 'wasted_units': 0.0}
+
+    def start(self, file_path: str) -> bool:
+        """Start OCR for a screenshot awaiting confirmation; False if the worker queue is full."""
+        if file_path in self._pending:
+            return True
+        speculation = _Speculation(file_path, JobToken(confirmed=False))
+        with jobs(speculation.token):
+            if not self.worker_pool.submit(file_path, lambda path, result: self._done(speculation, result)):
+                return False
+        self._pending[file_path] = speculation
+        self._stats['started'] += 1
+        return True
+
+    def _done(self, speculation: _Speculation, result: Optional[Dict[str, str]]):
+        speculation.finished = time.monotonic()
+        if speculation.token.cancelled:
+            self._cancelled.remove(speculation)
+            self._count_waste(speculation)
+        elif speculation.confirmed is not None:
+            del self._pending[speculation.file_path]
+            self.on_result(speculation.file_path, result)
+        else:
+            speculation.result = result
+
+    def confirm(self, file_path: str) -> bool:
+        """Deliver the screenshot's result now or when its job finishes; False if it was not speculated."""
+        speculation = self._pending.get(file_path)
+        if speculation is None:
+            return False
+        speculation.confirmed = time.monotonic()
+        speculation.token.confirm()
+        # Without speculation the whole job would have started now
+        saved = (speculation.finished or speculation.confirmed) - speculation.started
+        self._stats['confirmed'] += 1
+        self._stats['saved_seconds'] += saved
+        metrics.observe('speculation_saved', saved, ready=speculation.finished is not None)
+        if speculation.finished is not None:
+            self._stats['ready_at_confirm'] += 1
+            del self._pending[file_path]
+            self.on_result(file_path, speculation.result)
+        return True
+
+    def cancel(self, file_path: str):
+        """Abort the screenshot's job and discard its result."""
+        speculation = self._pending.pop(file_path, None)
+        if speculation is None:
+            return
+        speculation.token.cancel()
+        self._stats['cancelled'] += 1
+        if speculation.finished is not None:
+            self._count_waste(speculation)
+        else:
+            self._cancelled.append(speculation)
+
+    def _count_waste(self, speculation: _Speculation):
+        units = speculation.token.units
+        if units:
+            self._stats['cancelled_after_upload'] += 1
+            self._stats['wasted_units'] += units
+            metrics.inc('speculative_units_wasted', units)
+
+    def stats(self) -> Dict[str, float]:
+        """Return job counts, total and average latency saved, and API units wasted on cancelled jobs."""
+        stats = dict(self._stats, pending=len(self._pending), cancelled_running=len(self._cancelled))
+        confirmed = stats['confirmed']
+        stats['saved_avg'] = stats['saved_seconds'] / confirmed if confirmed else 0.0
+        return stats
@@ -0,0 +1,51 @@
+import shutil
+import subprocess
+from typing import Dict, Optional
+from ocr_backend import OCRBackend
+from text_layout import TextLayout
+
+class TesseractBackend(OCRBackend):
+    """Offline OCR through the tesseract command line tool."""
+
+    name = 'tesseract'
+
+    def __init__(self, command: str = 'tesseract', language: str = 'eng', timeout: float = 10.0):
+        self.command = command
+        self.language = language
+        self.timeout = timeout
+
+    def is_available(self) -> bool:
+        return shutil.which(self.command) is not None
+
+    def perform_ocr(self, file_path: str) -> Optional[Dict[str, str]]:
+        """Run tesseract with TSV output to get both the words and their confidence."""
+        try:
+            completed = subprocess.run(
+                [self.command, file_path, 'stdout', '-l', self.language, 'tsv'],
+                capture_output=True, timeout=self.timeout, check=True
+            )
+        except (OSError, subprocess.SubprocessError) as e:
+            print(f"Tesseract failed: {e}")
+            return None
+
+        words = []
+        boxes = []
+        confidences = []
+        for line in completed.stdout.decode('utf-8', errors='replace').splitlines()[1:]:
+            columns = line.split('\t')
+            # level page block par line word left top width height conf text
+            if len(columns) < 12 or not columns[11].strip():
+                continue
+            words.append(columns[11].strip())
+            try:
+                left, top, width, height = (int(value) for value in columns[6:10])
+                boxes.append([words[-1], left, top, left + width, top + height])
+                confidences.append(float(columns[10]))
+            except ValueError:
+                pass
+
+        if not words:
+            print("No text found in the image")
+            return None
+        confidence = sum(confidences) / len(confidences) if confidences else 0.0
+        return {"text": ' '.join(words), "confidence": confidence, "layout": TextLayout.from_words(boxes)}
@@ -0,0 +1,185 @@
+import base64
+from array import array
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Sequence, Tuple
+
+Box = Tuple[int, int, int, int]
+
+class Word(NamedTuple):
+    text: str
+    left: int
+    top: int
+    right: int
+    bottom: int
+
+class Line(NamedTuple):
+    text: str
+    box: Box
+
+def _packed(values: array) -> str:
+    return base64.b64encode(values.tobytes()).decode('ascii')
+
+def _unpacked(typecode: str, data: str) -> array:
+    values = array(typecode)
+    values.frombytes(base64.b64decode(data))
+    return values
+
+class TextLayout:
+    """Words of an OCR result with their boxes, grouped into lines in reading order.
+
+    Word texts are kept in a tuple and all coordinates in flat arrays (four
+    per word and per line), so a result with thousands of words is a handful
+    of objects that is cheap to cache, serialize and query by region.
+    Coordinates are pixels of the original screenshot.
+    """
+
+    __slots__ = ('_words', '_boxes', '_line_starts', '_line_boxes')
+
+    def __init__(self, words: Tuple[str, ...], boxes: array, line_starts: array, line_boxes: array):
+        """Use from_words() or from_json(); words must already be in reading order."""
+        self._words = words
+        self._boxes = boxes
+        self._line_starts = line_starts
+        self._line_boxes = line_boxes
+
+    @classmethod
+    def from_words(cls, words: Iterable[Sequence]) -> 'TextLayout':
+        """Build a layout from (text, left, top, right, bottom) words in any order.
+
+        A word joins the first line whose vertical extent contains its centre.
+        """
+        lines, open_lines = [], []
+        for word in sorted(words, key=lambda word: (word[2], word[1])):
+            # Words come top first, so a line ending above this word can take no more words
+            if open_lines and open_lines[0][1] < word[2]:
+                open_lines = [line for line in open_lines if line[1] >= word[2]]
+            center = (word[2] + word[4]) / 2
+            for line in open_lines:
+                if line[0] <= center <= line[1]:
+                    line[2].append(word)
+                    break
+            else:
+                line = [word[2], word[4], [word]]
+                lines.append(line)
+                open_lines.append(line)
+
+        texts, boxes, line_starts, line_boxes = [], array('i'), array('i'), array('i')
+        for _, _, line in lines:
+            line.sort(key=lambda word: word[1])
+            line_starts.append(len(texts))
+            for text, left, top, right, bottom in line:
+                texts.append(text)
+                boxes.extend((int(left), int(top), int(right), int(bottom)))
+            line_boxes.extend((min(word[1] for word in line), min(word[2] for word in line),
+                               max(word[3] for word in line), max(word[4] for word in line)))
+        line_starts.append(len(texts))
+        return cls(tuple(texts), boxes, line_starts, line_boxes)
+
+    def __len__(self) -> int:
+        return len(self._words)
+
+    def __iter__(self) -> Iterator[Word]:
+        boxes = self._boxes
+        for index, text in enumerate(self._words):
+            yield Word(text, *boxes[4 * index:4 * index + 4])
+
+    def __eq__(self, other) -> bool:
+        return (isinstance(other, TextLayout) and self._words == other._words and self._boxes == other._boxes
+                and self._line_starts == other._line_starts)
+
+    def __repr__(self) -> str:
+        return f"TextLayout({len(self)} words, {self.line_count()} lines)"
+
+    def word(self, index: int) -> Word:
+        return Word(self._words[index], *self._boxes[4 * index:4 * index + 4])
+
+    def line_count(self) -> int:
+        return len(self._line_starts) - 1
+
+    def lines(self) -> List[Line]:
+        """Return each line's text and bounding box, top to bottom."""
+        starts, boxes = self._line_starts, self._line_boxes
+        return [Line(' '.join(self._words[starts[line]:starts[line + 1]]), tuple(boxes[4 * line:4 * line + 4]))
+                for line in range(self.line_count())]
+
+    def text(self) -> str:
+        """All words in reading order separated by single spaces."""
+        return ' '.join(self._words)
+
+    def layout_text(self) -> str:
+        """Text with line breaks, indentation and blank lines approximating the screen layout.
+
+        Horizontal positions are converted to columns of the median character
+        width, vertical gaps to blank lines of the median line height.
+        """
+        if not self._words:
+            return ''
+        words, lefts = self._words, self._boxes[0::4]
+        widths = sorted((right - left) / len(text) for text, left, right in zip(words, lefts, self._boxes[2::4])
+                        if text)
+        char_width = max(1.0, widths[len(widths) // 2])
+        tops, bottoms = self._line_boxes[1::4], self._line_boxes[3::4]
+        heights = sorted(bottom - top for top, bottom in zip(tops, bottoms))
+        line_height = max(1, heights[len(heights) // 2])
+        origin = min(self._line_boxes[0::4])
+
+        rows = []
+        starts = self._line_starts
+        for line in range(self.line_count()):
+            if line:
+                rows.extend([''] * int((tops[line] - bottoms[line - 1]) / line_height))
+            row = ''
+            for text, left in zip(words[starts[line]:starts[line + 1]], lefts[starts[line]:starts[line + 1]]):
+                column = round((left - origin) / char_width)
+                row += ' ' * max(1 if row else 0, column - len(row)) + text
+            rows.append(row)
+        return '\n'.join(rows)
+
+    def words_in(self, box: Box, partial: bool = False) -> List[Word]:
+        """Return the words whose centre lies inside box, or that overlap it at all if partial."""
+        left, top, right, bottom = box
+        starts, line_boxes, boxes = self._line_starts, self._line_boxes, self._boxes
+        found = []
+        for line in range(self.line_count()):
+            # Skip whole lines outside the box before looking at their words
+            if line_boxes[4 * line + 1] >= bottom or line_boxes[4 * line + 3] <= top:
+                continue
+            for index in range(starts[line], starts[line + 1]):
+                word_left, word_top, word_right, word_bottom = boxes[4 * index:4 * index + 4]
+                if partial:
+                    inside = word_left < right and word_right > left and word_top < bottom and word_bottom > top
+                else:
+                    x, y = (word_left + word_right) / 2, (word_top + word_bottom) / 2
+                    inside = left <= x < right and top <= y < bottom
+                if inside:
+                    found.append(Word(self._words[index], word_left, word_top, word_right, word_bottom))
+        return found
+
+    def text_in(self, box: Box, partial: bool = False) -> str:
+        """Text inside box (see words_in), one line of output per line of the screenshot."""
+        return TextLayout.from_words(self.words_in(box, partial)).layout_text()
+
+    def to_json(self) -> Dict[str, object]:
+        """Compact JSON-ready form: the words plus base64 packed coordinate arrays."""
+        # Screenshot coordinates fit 16 bits; fall back to 32 for anything larger
+        fits = not self._boxes or (min(self._boxes) >= 0 and max(self._boxes) < 65536)
+        typecode = 'H' if fits else 'i'
+        return {'words': list(self._words), 'typecode': typecode,
+                'boxes': _packed(array(typecode, self._boxes)),
+                'line_boxes': _packed(array(typecode, self._line_boxes)),
+                'lines': _packed(array('i', self._line_starts))}
+
+    @classmethod
+    def from_json(cls, data: Dict) -> 'TextLayout':
+        typecode = data['typecode']
+        return cls(tuple(data['words']), array('i', _unpacked(typecode, data['boxes'])),
+                   _unpacked('i', data['lines']), array('i', _unpacked(typecode, data['line_boxes'])))
+
+def result_to_json(result: Dict) -> Dict:
+    """Copy of an OCR result dict whose layout is replaced by its JSON form."""
+    layout = result.get('layout')
+    return dict(result, layout=layout.to_json()) if isinstance(layout, TextLayout) else result
+
+def result_from_json(data: Dict) -> Dict:
+    """Inverse of result_to_json."""
+    layout = data.get('layout')
+    return dict(data, layout=TextLayout.from_json(layout)) if isinstance(layout, dict) else data
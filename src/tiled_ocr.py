@@ -0,0 +1,199 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from ocr_backend import OCRBackend
+from ocr_service import OCRService
+from image_store import SharedImage
+from metrics import metrics
+from text_layout import Box, TextLayout
+from config import (MAX_IMAGE_SIZE, IMAGE_QUALITY, ENCODE_MAX_SIDE, ENCODE_WEBP, TILE_MIN_SIDE, TILE_SIDE,
+                    TILE_OVERLAP, TILE_WORKERS)
+
+# Words closer than this (original pixels) to a tile edge inside the image may be cut off
+EDGE_MARGIN = 2
+# Share of a word's box covered by an already kept word that makes it a duplicate
+DUPLICATE_OVERLAP = 0.5
+# Grid cell (original pixels) used to find kept words near a candidate
+_CELL = 128
+# Tiles whose grey levels span less than this are blank and not sent
+BLANK_RANGE = 32
+
+def tile_boxes(width: int, height: int, tile: int, overlap: int) -> List[Box]:
+    """Cover an image with tile x tile boxes, neighbours sharing at least overlap pixels."""
+    def starts(length: int) -> List[int]:
+        if length <= tile:
+            return [0]
+        positions = list(range(0, length - tile, tile - overlap))
+        positions.append(length - tile)
+        return positions
+    return [(x, y, min(width, x + tile), min(height, y + tile)) for y in starts(height) for x in starts(width)]
+
+def _area(word: list) -> int:
+    return max(1, (word[3] - word[1]) * (word[4] - word[2]))
+
+def _intersection(a: list, b: list) -> int:
+    return max(0, min(a[3], b[3]) - max(a[1], b[1])) * max(0, min(a[4], b[4]) - max(a[2], b[2]))
+
+def _cells(word: list) -> List[Tuple[int, int]]:
+    return [(x, y) for x in range(word[1] // _CELL, word[3] // _CELL + 1)
+            for y in range(word[2] // _CELL, word[4] // _CELL + 1)]
+
+def _join_text(left: str, right: str) -> Optional[str]:
+    """Join two readings of a word that overlap, e.g. 'https://exam' and 'xample.com', or None if they do not."""
+    for length in range(min(len(left), len(right)), 0, -1):
+        if left.endswith(right[:length]):
+            return left + right[length:]
+    return None
+
+def _join_pieces(pieces: List[list]) -> List[list]:
+    """Join pieces of words cut by tile edges that overlap on the same line."""
+    joined = []
+    for word in sorted(pieces, key=lambda word: (word[1], word[2])):
+        for other in joined:
+            same_line = min(other[4], word[4]) - max(other[2], word[2]) > min(other[4] - other[2],
+                                                                               word[4] - word[2]) / 2
+            text = _join_text(other[0], word[0]) if same_line and word[1] < other[3] else None
+            if text is not None:
+                other[:] = [text, min(other[1], word[1]), min(other[2], word[2]),
+                            max(other[3], word[3]), max(other[4], word[4])]
+                break
+        else:
+            joined.append(list(word))
+    return joined
+
+def merge_tile_words(tiles: List[Tuple[Box, Iterable[Sequence]]], size: Tuple[int, int]) -> List[list]:
+    """Combine per-tile (text, left, top, right, bottom) words into one list in image coordinates.
+
+    A word touching a tile edge that another tile continues past may be cut
+    in two. It is dropped when another tile saw it whole, which the overlap
+    ensures for words narrower than it; the pieces of a longer word (a URL
+    across a seam) are kept and joined. Words read by two tiles are kept once.
+    """
+    width, height = size
+    whole, cut = [], []
+    for (left, top, right, bottom), words in tiles:
+        for text, word_left, word_top, word_right, word_bottom in words:
+            word = [text, word_left + left, word_top + top, word_right + left, word_bottom + top]
+            if ((left > 0 and word[1] - left < EDGE_MARGIN) or (right < width and right - word[3] < EDGE_MARGIN) or
+                    (top > 0 and word[2] - top < EDGE_MARGIN) or (bottom < height and bottom - word[4] < EDGE_MARGIN)):
+                cut.append(word)
+            else:
+                whole.append(word)
+
+    whole_grid = {}
+    for word in whole:
+        for cell in _cells(word):
+            whole_grid.setdefault(cell, []).append(word)
+    pieces = [word for word in cut
+              if not any(_intersection(word, other) > DUPLICATE_OVERLAP * _area(word)
+                         for cell in _cells(word) for other in whole_grid.get(cell, ()))]
+    candidates = whole + _join_pieces(pieces)
+
+    kept, grid = [], {}
+    for word in sorted(candidates, key=_area, reverse=True):
+        cells = _cells(word)
+        if any(_intersection(word, other) > DUPLICATE_OVERLAP * _area(word)
+               for cell in cells for other in grid.get(cell, ())):
+            continue
+        kept.append(word)
+        for cell in cells:
+            grid.setdefault(cell, []).append(word)
+    return kept
+
+class TiledOCR(OCRBackend):
+    """OCR very large screenshots as overlapping tiles at full resolution.
+
+    Downscaling a 4K or multi-monitor capture to one upload makes small text
+    unreadable. Screenshots whose longest side exceeds min_side are split into
+    tiles of at most tile pixels that are each encoded without losing text
+    resolution, sent as concurrent requests, and merged back by word box.
+    Smaller screenshots go to the wrapped backend.
+    """
+
+    name = 'cloud'
+
+    def __init__(self, backend: OCRBackend, ocr_service: OCRService, min_side: int = TILE_MIN_SIDE,
+                 tile: int = TILE_SIDE, overlap: int = TILE_OVERLAP, workers: int = TILE_WORKERS):
+        """backend does whole-image OCR; ocr_service (usually inside it) sends the tile requests."""
+        self.backend = backend
+        self.ocr_service = ocr_service
+        self.min_side = min_side
+        self.tile = tile
+        self.overlap = overlap
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ocr-tile")
+
+    def perform_ocr(self, file_path: str) -> Optional[Dict[str, str]]:
+        from PIL import Image
+        try:
+            with Image.open(file_path) as img:
+                size = img.size
+        except Exception as e:
+            print(f"Error reading image size: {e}")
+            return self.backend.perform_ocr(file_path)
+        if max(size) <= self.min_side:
+            return self.backend.perform_ocr(file_path)
+
+        cache_key, cached = self.ocr_service.lookup_cache(file_path)
+        if cached is not None:
+            return cached
+        with metrics.timer('tiled_ocr', pixels=size[0] * size[1]):
+            result = self._tiled(file_path)
+        if result is None:
+            return self.backend.perform_ocr(file_path)
+        self.ocr_service.store_cache(cache_key, result)
+        return result
+
+    def _tiled(self, file_path: str) -> Optional[Dict]:
+        # Decode at full resolution; a private handle, the shared ones are capped for upload and preview
+        handle = SharedImage(file_path, 1 << 16)
+        try:
+            boxes = tile_boxes(*handle.size(), self.tile, self.overlap)
+            metrics.inc('tiles', len(boxes))
+            # Encoding releases the GIL, so tiles are encoded as well as sent in parallel
+            # Tiles are sent in the caller's priority lane
+            context = contextvars.copy_context()
+            futures = [self._executor.submit(context.copy().run, self._ocr_tile, handle, box) for box in boxes]
+            results = [future.result() for future in futures]
+        except Exception as e:
+            print(f"Error tiling image: {e}")
+            return None
+        finally:
+            handle.release()
+        if any(result is None for result in results):
+            # A tile without a result failed, was cancelled or hit the quota (tiles without
+            # text get an empty one); merging the rest would cache text with a hole in it
+            metrics.inc('tiled_incomplete')
+            return None
+
+        words = merge_tile_words([(box, result['layout']) for box, result in zip(boxes, results)],
+                                 handle.original_size)
+        if not words:
+            return None
+        layout = TextLayout.from_words(words)
+        return {"text": layout.text(), "layout": layout}
+
+    def _ocr_tile(self, handle: SharedImage, box: Box) -> Optional[Dict]:
+        low, high = handle.base().crop(box).convert('L').getextrema()
+        if high - low < BLANK_RANGE:
+            metrics.inc('tiles_blank')
+            return {"text": "", "layout": TextLayout.from_words(())}
+        content, scale = self._encode_tile(handle, box)
+        return self.ocr_service.annotate_contents([content], [scale], keep_empty=True)[0]
+
+    def _encode_tile(self, handle: SharedImage, box: Box) -> Tuple[str, float]:
+        """Crop one tile and encode it, shrinking only as far as its text allows."""
+        import image_encoding
+        from PIL import Image
+        crop = handle.base().crop(box)
+        choice = image_encoding.choose_encoding(crop, crop.size, MAX_IMAGE_SIZE, ENCODE_MAX_SIDE,
+                                                IMAGE_QUALITY, ENCODE_WEBP)
+        if crop.size != choice.size:
+            crop = crop.resize(choice.size, Image.Resampling.LANCZOS)
+        with metrics.timer('encode', format=choice.format):
+            data = image_encoding.encode(crop, choice)
+        return self.ocr_service.encode_bytes(data), (box[2] - box[0]) / choice.size[0]
+
+    def stop(self):
+        self._executor.shutdown(wait=False)
+        if hasattr(self.backend, 'stop'):
+            self.backend.stop()
@@ -0,0 +1,207 @@
+import gzip
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, NamedTuple, Optional, Union
+from metrics import metrics
+from retry_policy import LatencyTracker
+
+if TYPE_CHECKING:
+    import requests
+
+# Compressed bodies must save at least this share to be worth the server's extra work
+GZIP_MIN_SAVING = 0.1
+
+class RequestBody(NamedTuple):
+    """A request body as sent, with the uncompressed original to fall back to."""
+    data: bytes
+    headers: Dict[str, str]
+    raw: bytes
+
+def _timed_adapter(on_connect, pool_size: int):
+    """A requests adapter whose pools report every new connection and how long opening it took."""
+    from requests.adapters import HTTPAdapter
+    from urllib3.connection import HTTPConnection, HTTPSConnection
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+    def timed(connection_class):
+        class TimedConnection(connection_class):
+            def connect(self):
+                # DNS, TCP and, for HTTPS, the TLS handshake
+                start = time.perf_counter()
+                super().connect()
+                on_connect(time.perf_counter() - start)
+        return TimedConnection
+
+    class TimedHTTPPool(HTTPConnectionPool):
+        ConnectionCls = timed(HTTPConnection)
+
+    class TimedHTTPSPool(HTTPSConnectionPool):
+        ConnectionCls = timed(HTTPSConnection)
+
+    class TimedAdapter(HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = {'http': TimedHTTPPool, 'https': TimedHTTPSPool}
+
+    # One host, so one pool holding a connection per request in flight
+    return TimedAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+
+class VisionTransport:
+    """Pooled, pre-warmed HTTP connections to the annotate endpoint.
+
+    The session's pool keeps pool_size connections alive, one per request
+    that can be in flight. warm() opens connections in the background before
+    the first screenshot needs them, and while idle a cheap HEAD request
+    every keepalive seconds stops the server from closing them. Bodies are
+    gzipped when that makes them noticeably smaller; if the endpoint rejects
+    a compressed body, plain_body() turns compression off and gives the
+    caller the body to send again.
+    """
+
+    def __init__(self, endpoint: str, pool_size: int, warm_connections: int = 0, keepalive: float = 0,
+                 compress: bool = True, compress_min_bytes: int = 16 * 1024,
+                 verify: Union[bool, str] = True, timeout: float = 10):
+        self.endpoint = endpoint
+        parts = urllib.parse.urlsplit(endpoint)
+        self.origin = f"{parts.scheme}://{parts.netloc}/"
+        self.pool_size = pool_size
+        self.warm_connections = warm_connections
+        self.keepalive = keepalive
+        self.compress = compress
+        self._gzip_accepted = False
+        self.compress_min_bytes = compress_min_bytes
+        self.verify = verify
+        self.timeout = timeout
+        self.handshakes = LatencyTracker()
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._local = threading.local()
+        self._last_used = time.monotonic()
+        self._stopped = threading.Event()
+        self._keepalive_thread = None
+        self._stats = {'requests': 0, 'reused': 0, 'connections': 0, 'warmups': 0, 'pings': 0,
+                       'compressed': 0, 'bytes_raw': 0, 'bytes_sent': 0}
+        self._stats_lock = threading.Lock()
+
+    @property
+    def session(self):
+        """HTTP session, created on first use so importing requests stays off the startup path."""
+        with self._session_lock:
+            if self._session is None:
+                import requests
+                session = requests.Session()
+                adapter = _timed_adapter(self._on_connect, self.pool_size)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._session = session
+            return self._session
+
+    def _on_connect(self, seconds: float):
+        self.handshakes.record(seconds)
+        self._local.connected = True
+        self._count('connections')
+        metrics.observe('connect', seconds)
+
+    def _count(self, name: str, amount: int = 1):
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def warm(self):
+        """Open warm_connections connections and start the idle keep-alive, all in the background."""
+        if self.warm_connections > 0:
+            threading.Thread(target=self._warm, name="ocr-warmup", daemon=True).start()
+        if self.keepalive > 0 and self._keepalive_thread is None:
+            self._keepalive_thread = threading.Thread(target=self._keep_alive, name="ocr-keepalive", daemon=True)
+            self._keepalive_thread.start()
+
+    def _warm(self):
+        start = time.perf_counter()
+        # Concurrent requests, or they would all share the first connection
+        with ThreadPoolExecutor(self.warm_connections, thread_name_prefix="ocr-warmup") as executor:
+            opened = sum(executor.map(lambda _: self._ping(), range(self.warm_connections)))
+        self._count('warmups', opened)
+        metrics.observe('warmup', time.perf_counter() - start, connections=opened)
+
+    def _ping(self) -> bool:
+        """Send a HEAD request to the endpoint's host; any answer leaves a live connection in the pool."""
+        try:
+            self.session.head(self.origin, timeout=self.timeout, verify=self.verify)
+            return True
+        except Exception as e:
+            print(f"Could not reach {self.origin}: {e}")
+            return False
+
+    def _keep_alive(self):
+        while not self._stopped.wait(self.keepalive):
+            if time.monotonic() - self._last_used >= self.keepalive and self._ping():
+                self._count('pings')
+                self._last_used = time.monotonic()
+
+    def encode_body(self, body: bytes) -> RequestBody:
+        """Gzip a JSON body if that saves enough; the result can be sent any number of times."""
+        headers = {'Content-Type': 'application/json'}
+        if self.compress and len(body) >= self.compress_min_bytes:
+            with metrics.timer('gzip', bytes=len(body)):
+                packed = gzip.compress(body, compresslevel=1)
+            if len(packed) <= (1 - GZIP_MIN_SAVING) * len(body):
+                return RequestBody(packed, dict(headers, **{'Content-Encoding': 'gzip'}), body)
+        return RequestBody(body, headers, body)
+
+    def post(self, url: str, body: RequestBody, timeout: float) -> 'requests.Response':
+        """POST a body on a pooled connection."""
+        response = self._send(url, body.data, body.headers, timeout)
+        if body.data is not body.raw:
+            self._count('compressed')
+            if response.status_code == 200:
+                self._gzip_accepted = True
+        self._count('bytes_raw', len(body.raw))
+        return response
+
+    def plain_body(self, body: RequestBody, status_code: int) -> Optional[RequestBody]:
+        """The body to send again uncompressed if its answer says the endpoint refuses gzip, else None.
+
+        A 415 always says so; a 400 only until a compressed body has been
+        accepted, after that it is about the request itself. Either way
+        compression is turned off, so this happens at most once per body.
+        """
+        if body.data is body.raw or status_code not in (400, 415):
+            return None
+        if status_code == 400 and self._gzip_accepted:
+            return None
+        if self.compress:
+            print("Vision endpoint does not accept gzipped requests, sending them uncompressed")
+            self.compress = False
+        return RequestBody(body.raw, {'Content-Type': 'application/json'}, body.raw)
+
+    def _send(self, url: str, data: bytes, headers: Dict[str, str], timeout: float) -> 'requests.Response':
+        self._local.connected = False
+        try:
+            # verify per request, as the session's would lose to REQUESTS_CA_BUNDLE
+            return self.session.post(url, data=data, headers=headers, timeout=timeout, verify=self.verify)
+        finally:
+            self._last_used = time.monotonic()
+            self._count('requests')
+            self._count('bytes_sent', len(data))
+            if not self._local.connected:
+                self._count('reused')
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        """Return connection reuse, handshake latency and compression figures."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['pool_size'] = self.pool_size
+        stats['reuse_rate'] = stats['reused'] / stats['requests'] if stats['requests'] else None
+        stats['handshake_p50'] = self.handshakes.percentile(0.5)
+        stats['handshake_p95'] = self.handshakes.percentile(0.95)
+        if stats['bytes_raw']:
+            stats['compression_ratio'] = round(stats['bytes_sent'] / stats['bytes_raw'], 3)
+        return stats
+
+    def close(self):
+        self._stopped.set()
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
@@ -1,18 +1,63 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
-from PIL import Image, ImageTk
-from typing import Optional, Dict, Callable
-from ocr_service import OCRService
+from typing import Optional, Dict, Callable, Sequence, Union
+from ocr_backend import OCRBackend
+from ocr_worker import OCRWorkerPool
+from image_store import ImageStore
+from history import HistoryIndex
+from result_window import PreviewRenderer, ResultWindow, TrayItem
+from speculation import SpeculativeOCR
+from journal import JobJournal, OCR_DONE, DELIVERED, DISCARDED
 from file_watcher import FileWatcher
+from metrics import metrics
+from memory import memory
+from config import (OCR_WORKERS, OCR_QUEUE_SIZE, UI_POLL_INTERVAL, DECODE_MAX_SIDE, METRICS_FILE,
+                    HISTORY_SEARCH_LIMIT, WATCH_MAX_IN_FLIGHT, UI_MAX_PREVIEWS, UI_MAX_PHOTOS,
+                    UI_MAX_RESULTS, SPECULATIVE_OCR)
 import webbrowser
+import queue
+import threading
 import sys
 import os
 import urllib.parse
+import time
+
+class TkDispatcher:
+    """Run callbacks from background threads on the Tk main loop."""
+
+    def __init__(self, root: tk.Tk, poll_interval: int):
+        self.root = root
+        self.poll_interval = poll_interval
+        self._calls = queue.Queue()
+        self.root.after(self.poll_interval, self._drain)
+
+    def __call__(self, func: Callable, *args):
+        """Schedule func(*args); safe to call from any thread."""
+        self._calls.put((func, args))
+
+    def _drain(self):
+        while True:
+            try:
+                func, args = self._calls.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                func(*args)
+            except Exception as e:
+                print(f"Error in UI callback: {e}")
+        self.root.after(self.poll_interval, self._drain)
 
 class OCRUI:
-    def __init__(self, root: tk.Tk, ocr_service: OCRService, web_presets: Dict[str, str], watch_dir: str):
+    def __init__(self, root: tk.Tk, ocr_service: OCRBackend, web_presets: Dict[str, str],
+                 watch_dir: Union[str, Sequence[str]],
+                 image_store: Optional[ImageStore] = None, history: Optional[HistoryIndex] = None,
+                 journal: Optional[JobJournal] = None):
         self.root = root
         self.ocr_service = ocr_service
+        self.image_store = image_store or ImageStore(DECODE_MAX_SIDE)
+        self.history = history
+        self.journal = journal
+        self.search_window = None
         self.web_presets = web_presets
         self.watch_dir = watch_dir
         self.skip_confirmation = False
@@ -20,8 +65,33 @@ class OCRUI:
         # Hide the root window
         self.root.withdraw()
         
-        # Initialize file watcher
-        self.file_watcher = FileWatcher(watch_dir, self._on_new_screenshot)
+        # Background OCR workers hand results back to the Tk main loop
+        self.dispatcher = TkDispatcher(root, UI_POLL_INTERVAL)
+        self.worker_pool = OCRWorkerPool(ocr_service, OCR_WORKERS, OCR_QUEUE_SIZE, self.dispatcher)
+        
+        # Optionally OCR screenshots while the user is still deciding whether to confirm them
+        self.speculation = SpeculativeOCR(self.worker_pool, self._show_result) if SPECULATIVE_OCR else None
+        
+        # One window for every confirmation and result, previews prepared off the Tk thread
+        self.previews = PreviewRenderer(self.image_store, self.dispatcher, UI_MAX_PREVIEWS, UI_MAX_PHOTOS)
+        self.result_window = ResultWindow(root, self.previews, web_presets,
+                                          on_confirm=self._on_confirm, on_cancel=self._on_cancel,
+                                          on_send=self._on_send, on_copy=self._on_copy, on_exit=self._on_exit,
+                                          on_search=self.open_search if history is not None else None,
+                                          on_skip=lambda skip: setattr(self, 'skip_confirmation', skip),
+                                          on_dismiss=self._on_dismiss, max_results=UI_MAX_RESULTS)
+        
+        # What stays resident between screenshots, for memory reports
+        memory.gauge('previews', self.previews.stats)
+        memory.gauge('tray', lambda: {'items': len(self.result_window), 'dismissed': self.result_window.dismissed})
+        memory.gauge('decoded_images', lambda: len(self.image_store))
+        
+        # Initialize file watcher; its callback runs on the intake thread. At most
+        # WATCH_MAX_IN_FLIGHT screenshots are open at once, the rest wait in its queue.
+        # Jobs the last run left unfinished come first
+        self.file_watcher = FileWatcher(watch_dir,
+                                        lambda file_path: self.dispatcher(self._on_new_screenshot, file_path),
+                                        max_in_flight=WATCH_MAX_IN_FLIGHT, journal=journal)
         if not self.file_watcher.start():
             messagebox.showerror("Error", f"Could not start watching directory: {watch_dir}")
             self.root.destroy()
@@ -29,254 +99,74 @@ class OCRUI:
         
         # Bind window close event
         self.root.protocol("WM_DELETE_WINDOW", self._on_exit)
+        
+        # Ctrl+F in any of our windows opens the history search
+        if self.history is not None:
+            self.root.bind_all('<Control-f>', self.open_search)
 
     def _on_new_screenshot(self, file_path: str):
         """Handle new screenshot detection."""
         try:
-            # Show confirmation dialog with screenshot preview
-            self.create_confirmation_dialog(
-                file_path,
-                on_confirm=lambda dialog=None: self._process_screenshot(file_path),
-                on_cancel=lambda dialog=None: None
-            )
+            # Decode once; preview and upload share this image until the job ends
+            self.image_store.acquire(file_path)
+            
+            # A screenshot whose result the last run never showed was confirmed already
+            if self.skip_confirmation or (self.journal is not None and self.journal.state(file_path) == OCR_DONE):
+                self._process_screenshot(file_path)
+            else:
+                # Ask in the result window, behind any screenshots already waiting there
+                self.result_window.add(TrayItem(file_path, TrayItem.CONFIRM))
+                if self.speculation is not None:
+                    self.speculation.start(file_path)
             
         except Exception as e:
+            self._finish(file_path)
             print(f"Error handling new screenshot: {e}")
             messagebox.showerror("Error", f"Failed to handle screenshot: {e}")
 
-    def _calculate_image_size(self, image: Image.Image, max_width: int = 800, max_height: int = 600) -> tuple:
-        """Calculate optimal image size while maintaining aspect ratio."""
-        width, height = image.size
-        
-        # Calculate scaling factors for both dimensions
-        width_ratio = max_width / width
-        height_ratio = max_height / height
-        
-        # Use the smaller ratio to ensure the image fits within bounds
-        ratio = min(width_ratio, height_ratio)
-        
-        # Calculate new dimensions
-        new_width = int(width * ratio)
-        new_height = int(height * ratio)
-        
-        # Ensure minimum size for very small images
-        min_size = 200  # Increased minimum size
-        if new_width < min_size and new_height < min_size:
-            if width > height:
-                new_width = min_size
-                new_height = int(height * (min_size / width))
-            else:
-                new_height = min_size
-                new_width = int(width * (min_size / height))
-        
-        return (new_width, new_height)
+    def _finish(self, file_path: str):
+        """End a screenshot's job: free its decoded image and let the watcher hand on the next file."""
+        self.image_store.release(file_path)
+        self.file_watcher.done(file_path)
 
-    def _calculate_window_size(self, image_size: tuple) -> tuple:
-        """Calculate optimal window size based on image size."""
-        # Base dimensions for the window content
-        content_width = max(400, image_size[0] + 40)  # Add padding
-        content_height = max(500, image_size[1] + 300)  # Add space for controls
-        
-        # Get screen dimensions
-        screen_width = self.root.winfo_screenwidth()
-        screen_height = self.root.winfo_screenheight()
-        
-        # Calculate maximum allowed dimensions (80% of screen)
-        max_width = int(screen_width * 0.8)
-        max_height = int(screen_height * 0.8)
-        
-        # Calculate final dimensions
-        width = min(content_width, max_width)
-        height = min(content_height, max_height)
-        
-        return (width, height)
+    def _on_confirm(self, file_path: str):
+        """Show the speculative result when there is one, otherwise start OCR now."""
+        if self.speculation is None or not self.speculation.confirm(file_path):
+            self._process_screenshot(file_path)
+
+    def _on_cancel(self, file_path: str):
+        if self.speculation is not None:
+            self.speculation.cancel(file_path)
+        self._record(file_path, DISCARDED)
+        self._finish(file_path)
+
+    def _on_dismiss(self, file_path: str):
+        self._record(file_path, DELIVERED)
+
+    def _record(self, file_path: str, state: str):
+        if self.journal is not None:
+            self.journal.record(file_path, state)
 
-    def create_confirmation_dialog(self, image_path: str, on_confirm: Callable, on_cancel: Callable):
-        """Create confirmation dialog with image preview."""
-        if self.skip_confirmation:
-            on_confirm()
-            return
-            
-        dialog = tk.Toplevel(self.root)
-        dialog.title("Confirm OCR")
-        dialog.attributes('-topmost', True)  # Make window stay on top
-        
-        try:
-            # Load and resize image
-            image = Image.open(image_path)
-            image_size = self._calculate_image_size(image)
-            image = image.resize(image_size, Image.Resampling.LANCZOS)
-            photo = ImageTk.PhotoImage(image)
-            
-            # Calculate window size
-            window_size = self._calculate_window_size(image_size)
-            dialog.geometry(f"{window_size[0]}x{window_size[1]}")
-            
-            # Center the window on screen
-            dialog.update_idletasks()
-            x = (dialog.winfo_screenwidth() - window_size[0]) // 2
-            y = (dialog.winfo_screenheight() - window_size[1]) // 2
-            dialog.geometry(f"+{x}+{y}")
-            
-            # Create main container
-            main_frame = ttk.Frame(dialog, padding="10")
-            main_frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
-            
-            # Create message label
-            message_label = ttk.Label(main_frame, text="New screenshot detected. Do you want to proceed?")
-            message_label.grid(row=0, column=0, sticky=(tk.W, tk.E), padx=5, pady=5)
-            
-            # Create image frame
-            image_frame = ttk.Frame(main_frame)
-            image_frame.grid(row=1, column=0, sticky=(tk.W, tk.E), padx=5, pady=5)
-            
-            # Display image
-            image_label = ttk.Label(image_frame, image=photo)
-            image_label.image = photo  # Keep a reference
-            image_label.grid(row=0, column=0)
-            
-            # Create controls frame
-            controls_frame = ttk.Frame(main_frame)
-            controls_frame.grid(row=2, column=0, sticky=(tk.W, tk.E), padx=5, pady=5)
-            
-            # Create checkbox
-            skip_var = tk.BooleanVar()
-            skip_checkbox = ttk.Checkbutton(controls_frame, text="Don't ask again",
-                                          variable=skip_var,
-                                          command=lambda: setattr(self, 'skip_confirmation', skip_var.get()))
-            skip_checkbox.grid(row=0, column=0, columnspan=2, sticky=tk.W, padx=5, pady=5)
-            
-            # Create buttons frame
-            button_frame = ttk.Frame(main_frame)
-            button_frame.grid(row=3, column=0, sticky=(tk.W, tk.E), padx=5, pady=5)
-            
-            # Create buttons
-            confirm_button = ttk.Button(button_frame, text="Confirm", width=10,
-                                      command=lambda: [on_confirm(dialog), dialog.destroy()])
-            confirm_button.grid(row=0, column=0, padx=5)
-            
-            cancel_button = ttk.Button(button_frame, text="Cancel", width=10,
-                                     command=lambda: [on_cancel(dialog), dialog.destroy()])
-            cancel_button.grid(row=0, column=1, padx=5)
-            
-            # Configure grid weights
-            dialog.columnconfigure(0, weight=1)
-            dialog.rowconfigure(0, weight=1)
-            main_frame.columnconfigure(0, weight=1)
-            controls_frame.columnconfigure(0, weight=1)
-            button_frame.columnconfigure(0, weight=1)
-            button_frame.columnconfigure(1, weight=1)
-            
-        except Exception as e:
-            print(f"Error creating confirmation dialog: {e}")
-            messagebox.showerror("Error", "Failed to create confirmation dialog")
-            dialog.destroy()
-    
     def _process_screenshot(self, file_path: str):
-        """Process the screenshot after confirmation."""
+        """Queue the screenshot for OCR after confirmation."""
+        if not self.worker_pool.submit(file_path, self._show_result):
+            self._finish(file_path)
+            messagebox.showwarning("Warning", "Too many screenshots are waiting for OCR, please retry later")
+
+    def _show_result(self, file_path: str, result: Optional[Dict[str, str]]):
+        """Queue an OCR result in the result window; runs on the Tk main loop."""
         try:
-            # Perform OCR
-            result = self.ocr_service.perform_ocr(file_path)
             if result:
-                # Show result editor window
-                editor = tk.Toplevel(self.root)
-                editor.title("OCR Result")
-                editor.attributes('-topmost', True)  # Make window stay on top
-                
-                try:
-                    # Load and resize image
-                    image = Image.open(file_path)
-                    image_size = self._calculate_image_size(image)
-                    image = image.resize(image_size, Image.Resampling.LANCZOS)
-                    photo = ImageTk.PhotoImage(image)
-                    
-                    # Calculate window size
-                    window_size = self._calculate_window_size(image_size)
-                    editor.geometry(f"{window_size[0]}x{window_size[1]}")
-                    
-                    # Center the window on screen
-                    editor.update_idletasks()
-                    x = (editor.winfo_screenwidth() - window_size[0]) // 2
-                    y = (editor.winfo_screenheight() - window_size[1]) // 2
-                    editor.geometry(f"+{x}+{y}")
-                    
-                    # Create main container
-                    main_frame = ttk.Frame(editor, padding="10")
-                    main_frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
-                    
-                    # Create image frame
-                    image_frame = ttk.Frame(main_frame)
-                    image_frame.grid(row=0, column=0, sticky=(tk.W, tk.E), padx=5, pady=5)
-                    
-                    # Display image
-                    image_label = ttk.Label(image_frame, image=photo)
-                    image_label.image = photo  # Keep a reference
-                    image_label.grid(row=0, column=0)
-                    
-                    # Create text frame
-                    text_frame = ttk.Frame(main_frame)
-                    text_frame.grid(row=1, column=0, sticky=(tk.W, tk.E), padx=5, pady=5)
-                    
-                    # Create text box
-                    ttk.Label(text_frame, text="Recognized Text:").grid(row=0, column=0, sticky=tk.W)
-                    text_box = tk.Text(text_frame, wrap=tk.WORD, width=60, height=10)
-                    text_box.grid(row=1, column=0, sticky=(tk.W, tk.E), padx=5, pady=5)
-                    text_box.insert('1.0', result['text'])
-                    
-                    # Create web controls frame
-                    web_frame = ttk.Frame(main_frame)
-                    web_frame.grid(row=2, column=0, sticky=(tk.W, tk.E), padx=5, pady=5)
-                    
-                    # Create web preset dropdown
-                    web_preset = ttk.Combobox(web_frame, values=list(self.web_presets.keys()), width=20)
-                    web_preset.grid(row=0, column=0, padx=5)
-                    web_preset.set(list(self.web_presets.keys())[0])
-                    
-                    # Create send button
-                    send_button = ttk.Button(web_frame, text="Send", width=10,
-                                           command=lambda: [self._on_send(web_preset.get(), 
-                                                                        text_box.get('1.0', tk.END).strip()),
-                                                          editor.destroy()])
-                    send_button.grid(row=0, column=1, padx=5)
-                    
-                    # Create action buttons frame
-                    button_frame = ttk.Frame(main_frame)
-                    button_frame.grid(row=3, column=0, sticky=(tk.W, tk.E), padx=5, pady=5)
-                    
-                    # Create action buttons
-                    copy_button = ttk.Button(button_frame, text="Copy", width=10,
-                                           command=lambda: self._on_copy(text_box.get('1.0', tk.END).strip(),
-                                                                       editor))
-                    copy_button.grid(row=0, column=0, padx=5)
-                    
-                    discard_button = ttk.Button(button_frame, text="Discard", width=10,
-                                              command=lambda: self._on_discard(editor))
-                    discard_button.grid(row=0, column=1, padx=5)
-                    
-                    exit_button = ttk.Button(button_frame, text="Exit", width=10,
-                                           command=self._on_exit)
-                    exit_button.grid(row=0, column=2, padx=5)
-                    
-                    # Configure grid weights
-                    editor.columnconfigure(0, weight=1)
-                    editor.rowconfigure(0, weight=1)
-                    main_frame.columnconfigure(0, weight=1)
-                    text_frame.columnconfigure(0, weight=1)
-                    web_frame.columnconfigure(0, weight=1)
-                    button_frame.columnconfigure(0, weight=1)
-                    button_frame.columnconfigure(1, weight=1)
-                    button_frame.columnconfigure(2, weight=1)
-                    
-                except Exception as e:
-                    print(f"Error showing result editor: {e}")
-                    messagebox.showerror("Error", "Failed to show result editor")
-                    editor.destroy()
-            else:
-                messagebox.showerror("Error", "Failed to perform OCR on the image")
-            
+                # Until the user is done with it the result is shown again after a restart
+                self._record(file_path, OCR_DONE)
+            kind = TrayItem.RESULT if result else TrayItem.FAILED
+            self.result_window.add(TrayItem(file_path, kind, result))
         except Exception as e:
             print(f"Error processing screenshot: {e}")
             messagebox.showerror("Error", f"Failed to process screenshot: {e}")
+        finally:
+            # The job is finished; the window keeps only a downscaled preview
+            self._finish(file_path)
 
     def _on_send(self, preset_name: str, text: str = None):
         """Handle send button click."""
@@ -309,11 +199,102 @@ class OCRUI:
         if window:
             window.destroy()
 
-    def _on_discard(self, window: Optional[tk.Toplevel] = None):
-        """Handle discard button click."""
-        print("Discarding screenshot...")
-        if window:
-            window.destroy()
+    def open_search(self, event=None):
+        """Show the history search window, reusing it when it is already open."""
+        if self.history is None:
+            return
+        if self.search_window is not None and self.search_window.winfo_exists():
+            self.search_window.deiconify()
+            self.search_window.lift()
+            return
+        
+        window = tk.Toplevel(self.root)
+        window.title("Search OCR History")
+        window.geometry("720x520")
+        self.search_window = window
+        
+        # Create main container
+        main_frame = ttk.Frame(window, padding="10")
+        main_frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        
+        # Create search box
+        query_var = tk.StringVar()
+        query_entry = ttk.Entry(main_frame, textvariable=query_var)
+        query_entry.grid(row=0, column=0, sticky=(tk.W, tk.E), padx=5, pady=5)
+        query_entry.focus_set()
+        
+        # Create result list and the full text of the selected result
+        result_list = tk.Listbox(main_frame, height=12)
+        result_list.grid(row=1, column=0, sticky=(tk.W, tk.E, tk.N, tk.S), padx=5, pady=5)
+        text_box = tk.Text(main_frame, wrap=tk.WORD, height=8)
+        text_box.grid(row=2, column=0, sticky=(tk.W, tk.E), padx=5, pady=5)
+        
+        # Create action buttons
+        button_frame = ttk.Frame(main_frame)
+        button_frame.grid(row=3, column=0, sticky=(tk.W, tk.E), padx=5, pady=5)
+        status_label = ttk.Label(button_frame, text="")
+        status_label.grid(row=0, column=0, sticky=tk.W, padx=5)
+        copy_button = ttk.Button(button_frame, text="Copy", width=10,
+                                 command=lambda: self._on_copy(text_box.get('1.0', tk.END).strip()))
+        copy_button.grid(row=0, column=1, padx=5)
+        close_button = ttk.Button(button_frame, text="Close", width=10, command=window.destroy)
+        close_button.grid(row=0, column=2, padx=5)
+        
+        hits = []
+        pending = {'job': None, 'search': 0}
+        
+        def run_search():
+            pending['job'] = None
+            pending['search'] += 1
+            query = query_var.get()
+            # Ranking a word found in most of a large index takes a while; keep the window responsive
+            threading.Thread(target=search, args=(pending['search'], query), name="history-search",
+                             daemon=True).start()
+        
+        def search(number: int, query: str):
+            start = time.perf_counter()
+            if query.strip():
+                found = self.history.search(query, HISTORY_SEARCH_LIMIT)
+            else:
+                found = self.history.recent(HISTORY_SEARCH_LIMIT)
+            metrics.observe('history_search', time.perf_counter() - start)
+            self.dispatcher(show_results, number, found)
+        
+        def show_results(number: int, found: list):
+            if number != pending['search'] or not window.winfo_exists():
+                # Typing went on, or the window was closed, while this search ran
+                return
+            hits[:] = found
+            result_list.delete(0, tk.END)
+            for hit in found:
+                when = time.strftime('%Y-%m-%d %H:%M', time.localtime(hit.created))
+                result_list.insert(tk.END, f"{when}  {os.path.basename(hit.path)}  {' '.join(hit.snippet.split())}")
+            status_label.config(text=f"{len(found)} result(s)")
+        
+        def on_query_change(*args):
+            # Search once typing pauses instead of on every keystroke
+            if pending['job'] is not None:
+                window.after_cancel(pending['job'])
+            pending['job'] = window.after(150, run_search)
+        
+        def on_select(event):
+            selection = result_list.curselection()
+            if selection:
+                text_box.delete('1.0', tk.END)
+                text_box.insert('1.0', hits[selection[0]].text)
+        
+        query_var.trace_add('write', on_query_change)
+        result_list.bind('<<ListboxSelect>>', on_select)
+        query_entry.bind('<Return>', lambda event: run_search())
+        
+        # Configure grid weights
+        window.columnconfigure(0, weight=1)
+        window.rowconfigure(0, weight=1)
+        main_frame.columnconfigure(0, weight=1)
+        main_frame.rowconfigure(1, weight=1)
+        button_frame.columnconfigure(0, weight=1)
+        
+        run_search()
 
     def _on_exit(self):
         """Handle exit button click or window close."""
@@ -321,6 +302,13 @@ class OCRUI:
             print("Exiting program...")
             if self.file_watcher:
                 self.file_watcher.stop()
+            self.previews.stop()
+            print(f"OCR worker stats: {self.worker_pool.stats()}")
+            if self.speculation is not None:
+                print(f"Speculative OCR stats: {self.speculation.stats()}")
+            print(f"Memory: {memory.stats()}")
+            if METRICS_FILE:
+                metrics.write_snapshot(METRICS_FILE)
             
             for widget in self.root.winfo_children():
                 widget.destroy()
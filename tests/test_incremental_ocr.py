@@ -0,0 +1,63 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+os.environ.setdefault('API_KEY', 'test')
+os.environ.setdefault('WATCH_DIR', tempfile.gettempdir())
+
+from PIL import Image, ImageDraw
+from image_store import ImageStore
+from incremental_ocr import IncrementalOCR
+from ocr_backend import OCRBackend
+from ocr_service import OCRService
+from text_layout import TextLayout
+from test_retry_policy import StubResponse, StubTransport
+
+class StubBackend(OCRBackend):
+    name = 'stub'
+
+    def __init__(self):
+        self.calls = 0
+
+    def perform_ocr(self, file_path):
+        self.calls += 1
+        layout = TextLayout.from_words([['hello', 40, 40, 120, 60], ['world', 1500, 800, 1580, 820]])
+        return {"text": layout.text(), "layout": layout}
+
+    def is_available(self):
+        return True
+
+class PartialRegionTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def screenshot(self, name: str, marks=()) -> str:
+        image = Image.new('RGB', (1600, 900), (255, 255, 255))
+        draw = ImageDraw.Draw(image)
+        draw.rectangle((40, 40, 120, 60), fill=(0, 0, 0))
+        draw.rectangle((1500, 800, 1580, 820), fill=(0, 0, 0))
+        for box in marks:
+            draw.rectangle(box, fill=(0, 0, 0))
+        path = os.path.join(self.directory.name, name)
+        image.save(path)
+        return path
+
+    def test_failed_region_falls_back_to_full_ocr(self):
+        # The first region fails, the second is read
+        word = {'description': 'new', 'boundingPoly': {'vertices': [{'x': 1, 'y': 1}, {'x': 20, 'y': 10}]}}
+        read = {'textAnnotations': [{'description': 'new'}, word]}
+        transport = StubTransport(StubResponse(200, {'responses': [{'error': {'message': 'failed'}}, read]}))
+        service = OCRService('test', transport=transport)
+        backend = StubBackend()
+        ocr = IncrementalOCR(backend, service, ImageStore(4096), max_changed=1.0)
+        ocr.perform_ocr(self.screenshot('first.png'))
+        result = ocr.perform_ocr(self.screenshot('second.png', [(200, 300, 260, 320), (1200, 600, 1260, 620)]))
+        self.assertEqual(transport.posts, 1)
+        self.assertEqual(backend.calls, 2)
+        self.assertEqual(result['text'], backend.perform_ocr('')['text'])
+
+if __name__ == '__main__':
+    unittest.main()
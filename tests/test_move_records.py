@@ -0,0 +1,56 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+os.environ.setdefault('API_KEY', 'test')
+os.environ.setdefault('WATCH_DIR', tempfile.gettempdir())
+
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+from move_records import InotifyEmitter, MoveRecordPruner, UnsupportedWatchdog, inotify_backends
+
+@unittest.skipIf(InotifyEmitter is None, "watchdog's inotify backend is Linux only")
+class MoveRecordPrunerTest(unittest.TestCase):
+    """Pins the installed watchdog's inotify internals that MoveRecordPruner relies on."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.observer = Observer()
+        self.observer.schedule(FileSystemEventHandler(), self.directory.name)
+        self.observer.start()
+        self.addCleanup(self.observer.join, 1.0)
+        self.addCleanup(self.observer.stop)
+
+    def records(self) -> int:
+        return sum(len(inotify._moved_from_events)
+                   for emitter in self.observer.emitters for inotify in inotify_backends(emitter))
+
+    def test_clears_what_renames_leave_behind(self):
+        for index in range(5):
+            temp_path = os.path.join(self.directory.name, f".shot{index}.tmp")
+            with open(temp_path, 'wb') as f:
+                f.write(b'png')
+            os.replace(temp_path, os.path.join(self.directory.name, f"shot{index}.png"))
+        deadline = time.monotonic() + 2
+        while self.records() < 5 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        self.assertEqual(self.records(), 5, "watchdog no longer keeps move records; MoveRecordPruner can go")
+
+        self.assertEqual(MoveRecordPruner().prune(self.observer), 1)
+        self.assertEqual(self.records(), 0)
+
+    def test_changed_internals_are_reported(self):
+        emitter = next(iter(self.observer.emitters))
+        emitter._inotify._inotify, inotify = object(), emitter._inotify._inotify
+        try:
+            with self.assertRaises(UnsupportedWatchdog):
+                MoveRecordPruner().prune(self.observer)
+        finally:
+            emitter._inotify._inotify = inotify
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+os.environ.setdefault('API_KEY', 'test')
+os.environ.setdefault('WATCH_DIR', tempfile.gettempdir())
+
+from ocr_worker import OCRWorkerPool
+
+class BlockedService:
+    """perform_ocr waits until released."""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def perform_ocr(self, file_path):
+        self.started.set()
+        self.release.wait(5)
+        return {'text': file_path}
+
+class StopTest(unittest.TestCase):
+    def test_stop_with_a_full_queue_does_not_hang(self):
+        service = BlockedService()
+        delivered = []
+        pool = OCRWorkerPool(service, 1, 2, lambda func, *args: func(*args))
+        self.addCleanup(service.release.set)
+        pool.submit('running', lambda path, result: delivered.append((path, result)))
+        service.started.wait(1)
+        for path in ('queued-1', 'queued-2'):
+            self.assertTrue(pool.submit(path, lambda path, result: delivered.append((path, result))))
+
+        start = time.monotonic()
+        pool.stop()
+        self.assertLess(time.monotonic() - start, 2.5)
+        self.assertEqual(sorted(delivered), [('queued-1', None), ('queued-2', None)])
+        self.assertFalse(pool.submit('late', lambda path, result: None))
+
+if __name__ == '__main__':
+    unittest.main()
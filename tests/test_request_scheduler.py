@@ -0,0 +1,50 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+os.environ.setdefault('API_KEY', 'test')
+os.environ.setdefault('WATCH_DIR', tempfile.gettempdir())
+
+from config import RATE_PER_SECOND, RATE_PER_MINUTE
+from ocr_service import OCRService
+from request_scheduler import RequestScheduler
+from test_retry_policy import StubResponse, StubTransport
+
+class BudgetTest(unittest.TestCase):
+    def test_requests_in_flight_count_against_the_budget(self):
+        scheduler = RequestScheduler(period_limit=10)
+        self.assertTrue(scheduler.acquire(6))
+        self.assertFalse(scheduler.acquire(6))
+        scheduler.release(6)
+        self.assertTrue(scheduler.acquire(6))
+        scheduler.record_units(6)
+        self.assertFalse(scheduler.acquire(6))
+        self.assertEqual(scheduler.stats()['reserved'], 0)
+
+    def test_failed_request_hands_its_units_back(self):
+        scheduler = RequestScheduler(period_limit=1)
+        service = OCRService('test', transport=StubTransport(StubResponse(400)), scheduler=scheduler)
+        service.annotate_contents(['x'])
+        self.assertEqual(scheduler.ledger.units(), 0)
+        self.assertTrue(scheduler.acquire(1))
+
+class PacingTest(unittest.TestCase):
+    def test_batch_goes_in_one_request_at_the_default_limits(self):
+        scheduler = RequestScheduler(RATE_PER_SECOND, RATE_PER_MINUTE)
+        transport = StubTransport(StubResponse(200, {'responses': [{}] * 8}))
+        service = OCRService('test', transport=transport, scheduler=scheduler)
+        self.assertEqual(len(service.annotate_contents(['x'] * 8, keep_empty=True)), 8)
+        self.assertEqual(transport.posts, 1)
+        # The units borrowed beyond the burst hold back the next request
+        self.assertFalse(scheduler.try_acquire(1))
+
+    def test_optional_request_does_not_wait(self):
+        scheduler = RequestScheduler(per_second=10)
+        self.assertTrue(scheduler.try_acquire(1))
+        self.assertFalse(scheduler.try_acquire(1))
+        self.assertEqual(scheduler.stats()['reserved'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
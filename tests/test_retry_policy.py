@@ -0,0 +1,188 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+os.environ.setdefault('API_KEY', 'test')
+os.environ.setdefault('WATCH_DIR', tempfile.gettempdir())
+
+from ocr_job import JobToken, jobs
+from ocr_service import OCRService
+from retry_policy import CircuitBreaker
+from transport import RequestBody
+
+class StubResponse:
+    def __init__(self, status_code: int, data=None, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.text = ''
+        self._data = data
+
+    def json(self):
+        if self._data is None:
+            raise ValueError("not JSON")
+        return self._data
+
+class StubTransport:
+    """Answers each POST with the next of responses, repeating the last."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.posts = 0
+
+    def encode_body(self, body: bytes) -> RequestBody:
+        return RequestBody(body, {}, body)
+
+    def plain_body(self, body, status_code):
+        return None
+
+    def post(self, url, body, timeout):
+        self.posts += 1
+        return self.responses.pop(0) if len(self.responses) > 1 else self.responses[0]
+
+    def stats(self):
+        return {}
+
+class CircuitBreakerTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 100.0
+        patcher = mock.patch('retry_policy.time.monotonic', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+
+    def open_breaker(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+    def test_opens_after_threshold_and_fails_fast(self):
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.open_breaker()
+        self.assertFalse(self.breaker.allow())
+        self.assertEqual(self.breaker.times_opened, 1)
+
+    def test_lets_one_probe_through_after_cool_down(self):
+        self.open_breaker()
+        self.now += 30
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertFalse(self.breaker.allow())
+
+    def test_probe_success_closes(self):
+        self.open_breaker()
+        self.now += 30
+        self.breaker.allow()
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(self.breaker.allow())
+
+    def test_probe_failure_reopens_for_another_cool_down(self):
+        self.open_breaker()
+        self.now += 30
+        self.breaker.allow()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(self.breaker.times_opened, 2)
+        self.now += 29
+        self.assertFalse(self.breaker.allow())
+        self.now += 1
+        self.assertTrue(self.breaker.allow())
+
+    def test_released_probe_is_let_through_again(self):
+        self.open_breaker()
+        self.now += 30
+        self.breaker.allow()
+        self.breaker.release()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+
+    def test_release_when_closed_changes_nothing(self):
+        self.breaker.release()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+class BreakerOutcomeTest(unittest.TestCase):
+    """Every way annotate_contents ends after a probe leaves the breaker closed or open, never half open."""
+
+    def service(self, *responses) -> OCRService:
+        service = OCRService('test', transport=StubTransport(*responses))
+        service.hedge_enabled = False
+        service.retry_delay = service.retry_max_delay = 0
+        service.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        service.breaker.record_failure()
+        return service
+
+    def test_client_error_closes(self):
+        service = self.service(StubResponse(400))
+        self.assertEqual(service.annotate_contents(['x']), [None])
+        self.assertEqual(service.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_unparsable_response_reopens(self):
+        service = self.service(StubResponse(200))
+        self.assertEqual(service.annotate_contents(['x']), [None])
+        self.assertEqual(service.breaker.state, CircuitBreaker.OPEN)
+
+    def test_garbled_body_fails_fast(self):
+        import requests
+        service = self.service(StubResponse(200))
+        service.breaker = CircuitBreaker(failure_threshold=5, reset_timeout=0)
+        with mock.patch.object(StubResponse, 'json', side_effect=requests.exceptions.JSONDecodeError('bad', '', 0)):
+            self.assertEqual(service.annotate_contents(['x']), [None])
+        self.assertEqual(service.transport.posts, 1)
+
+    def test_server_error_reopens(self):
+        service = self.service(StubResponse(503))
+        service.annotate_contents(['x'])
+        self.assertEqual(service.breaker.state, CircuitBreaker.OPEN)
+
+    def test_probe_not_sent_is_handed_back(self):
+        service = self.service(StubResponse(200, {'responses': [{}]}))
+        with mock.patch('ocr_service.cancelled', return_value=True):
+            service.annotate_contents(['x'])
+        self.assertEqual(service.breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(service.transport.posts, 0)
+        service.annotate_contents(['x'])
+        self.assertEqual(service.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_retry_after_is_capped(self):
+        service = self.service(StubResponse(503, headers={'Retry-After': '3600'}), StubResponse(200, {'responses': [{}]}))
+        service.breaker = CircuitBreaker(failure_threshold=5, reset_timeout=0)
+        service.retry_max_delay = 0.01
+        with mock.patch('ocr_service.time.sleep') as sleep:
+            service.annotate_contents(['x'])
+        sleep.assert_called_once_with(0.01)
+
+class SlowTransport(StubTransport):
+    """Answers the first POST after delay seconds and the others at once."""
+
+    def __init__(self, delay: float, *responses):
+        super().__init__(*responses)
+        self.delay = delay
+
+    def post(self, url, body, timeout):
+        if self.posts == 0:
+            self.posts += 1
+            time.sleep(self.delay)
+            return self.responses[0]
+        return super().post(url, body, timeout)
+
+class HedgeTest(unittest.TestCase):
+    def test_both_copies_are_charged_to_the_job(self):
+        service = OCRService('test', transport=SlowTransport(0.2, StubResponse(200, {'responses': [{}]})))
+        service.hedge_min_delay = 0.01
+        for _ in range(50):
+            service.latency.record(0.01)
+        token = JobToken()
+        with jobs(token):
+            service.annotate_contents(['x'])
+        self.assertEqual(service.stats()['hedge_wins'], 1)
+        time.sleep(0.3)
+        self.assertEqual(token.units, 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+os.environ.setdefault('API_KEY', 'test')
+os.environ.setdefault('WATCH_DIR', tempfile.gettempdir())
+
+from transport import VisionTransport
+
+class PlainFallbackTest(unittest.TestCase):
+    def setUp(self):
+        self.transport = VisionTransport('https://vision.example/v1/images:annotate', 1, compress_min_bytes=0)
+        self.body = self.transport.encode_body(b'{"requests": []}' * 100)
+        self.assertIsNot(self.body.data, self.body.raw)
+
+    def test_refused_gzip_is_sent_plain_once(self):
+        plain = self.transport.plain_body(self.body, 415)
+        self.assertEqual(plain.data, self.body.raw)
+        self.assertFalse(self.transport.compress)
+        self.assertIsNone(self.transport.plain_body(plain, 415))
+
+    def test_bad_request_after_gzip_worked_is_not_resent(self):
+        self.transport._gzip_accepted = True
+        self.assertIsNone(self.transport.plain_body(self.body, 400))
+        self.assertTrue(self.transport.compress)
+
+    def test_other_errors_are_not_resent(self):
+        self.assertIsNone(self.transport.plain_body(self.body, 503))
+
+if __name__ == '__main__':
+    unittest.main()